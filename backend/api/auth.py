@@ -8,13 +8,24 @@ from datetime import timedelta
 import logging
 import re
 
-from models.user import get_user_by_username, create_user, get_user_by_id
+from models.user import get_user_by_username, create_user, get_user_by_id, check_password
+from utils.password import HashPoolBusy
 from utils.security import sanitize_json, validate_password_strength
 
 # Create a Blueprint for authentication
 auth_bp = Blueprint('auth', __name__)
 logger = logging.getLogger(__name__)
 
+def password_check_busy():
+    """Respond to a password check shed because too many are pending."""
+    logger.warning("Password check rejected: too many pending")
+    response = jsonify({
+        'status': 'error',
+        'message': 'Server is busy. Please try again shortly.'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user."""
@@ -70,7 +81,7 @@ def register():
 
     # Create access token
     access_token = create_access_token(
-        identity=user.id,
+        identity=str(user.id),
         expires_delta=timedelta(days=1)
     )
 
@@ -102,7 +113,12 @@ def login():
     user = get_user_by_username(data['username'])
 
     # Check if user exists and password is correct
-    if not user or not user.verify_password(data['password']):
+    try:
+        valid = user is not None and check_password(user, data['password'])
+    except HashPoolBusy:
+        return password_check_busy()
+
+    if not valid:
         # Log failed login attempt
         logger.warning(f"Failed login attempt for username: {data['username']}")
 
@@ -148,7 +164,7 @@ def login():
 
     # Create access token
     access_token = create_access_token(
-        identity=user.id,
+        identity=str(user.id),
         expires_delta=timedelta(days=1)
     )
 
@@ -219,7 +235,12 @@ def change_password():
         }), 404
 
     # Verify current password
-    if not user.verify_password(data['current_password']):
+    try:
+        valid = check_password(user, data['current_password'])
+    except HashPoolBusy:
+        return password_check_busy()
+
+    if not valid:
         logger.warning(f"Invalid current password for user: {user.username}")
         return jsonify({
             'status': 'error',
@@ -256,5 +277,3 @@ def change_password():
             'status': 'error',
             'message': 'Error changing password'
         }), 500
-    finally:
-        session.close()
@@ -3,32 +3,58 @@ Data Collection API endpoints.
 This module handles the collection and retrieval of reward data from Sentry Nodes.
 """
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date as date_type
+import os
 import random
 
+from models.reward import (
+    get_rewards_page,
+    iter_rewards,
+    get_rewards_by_date_range,
+    create_reward as create_reward_record,
+    create_rewards_bulk,
+    get_reward_stats as get_reward_totals
+)
+from utils.cache import TTLCache
+from utils.pagination import parse_page_args, page_response, ndjson_response
+
 # Create a Blueprint for data collection
 data_collect_bp = Blueprint('data_collect', __name__)
 
-# Mock data for development (will be replaced with actual database)
-mock_rewards = []
+# Reward stats are polled by every dashboard, so they are cached briefly and
+# invalidated whenever rewards are ingested
+stats_cache = TTLCache(ttl=float(os.environ.get('REWARD_STATS_CACHE_TTL', '5')), maxsize=1)
+
+def reward_page_response(node_id=None):
+    """Return a page of rewards, or stream them all as NDJSON."""
+    try:
+        limit, after, stream = parse_page_args((date_type, int))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    if stream:
+        return ndjson_response(reward.to_dict() for reward in iter_rewards(node_id))
+    
+    # Fetch one extra row to know whether there is a next page
+    rewards = get_rewards_page(node_id, limit=limit + 1, after=after)
+    return page_response(
+        [reward.to_dict() for reward in rewards],
+        limit,
+        key=lambda reward: (reward['date'], reward['id'])
+    )
 
 @data_collect_bp.route('/rewards', methods=['GET'])
 def get_rewards():
-    """Get all rewards."""
-    return jsonify({
-        'status': 'success',
-        'data': mock_rewards
-    }), 200
+    """Get all rewards, a page at a time."""
+    return reward_page_response()
 
 @data_collect_bp.route('/rewards/node/<int:node_id>', methods=['GET'])
 def get_node_rewards(node_id):
-    """Get rewards for a specific node."""
-    node_rewards = [reward for reward in mock_rewards if reward['node_id'] == node_id]
-    
-    return jsonify({
-        'status': 'success',
-        'data': node_rewards
-    }), 200
+    """Get rewards for a specific node, a page at a time."""
+    return reward_page_response(node_id)
 
 @data_collect_bp.route('/rewards', methods=['POST'])
 def create_reward():
@@ -44,23 +70,35 @@ def create_reward():
                 'message': f'Missing required field: {field}'
             }), 400
     
-    # Create a new reward record (mock implementation)
-    new_reward = {
-        'id': len(mock_rewards) + 1,
-        'node_id': data['node_id'],
-        'poa_points': data['poa_points'],
-        'poc_points': data['poc_points'],
-        'referral_points': data['referral_points'],
-        'date': data['date'],
-        'created_at': datetime.now().isoformat()
-    }
+    try:
+        date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid date format, expected YYYY-MM-DD'
+        }), 400
     
-    mock_rewards.append(new_reward)
+    # Create a new reward record
+    new_reward = create_reward_record(
+        node_id=data['node_id'],
+        date=date,
+        poa_points=data['poa_points'],
+        poc_points=data['poc_points'],
+        referral_points=data['referral_points']
+    )
+    
+    if not new_reward:
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to record reward data'
+        }), 500
+    
+    stats_cache.invalidate()
     
     return jsonify({
         'status': 'success',
         'message': 'Reward data recorded successfully',
-        'data': new_reward
+        'data': new_reward.to_dict()
     }), 201
 
 @data_collect_bp.route('/rewards/simulate/<int:node_id>', methods=['POST'])
@@ -72,25 +110,30 @@ def simulate_rewards(node_id):
     days = data.get('days', 7)
     
     # Generate simulated reward data
-    simulated_rewards = []
-    for i in range(days):
-        date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        
-        # Simulate random reward points
-        reward = {
-            'id': len(mock_rewards) + i + 1,
+    today = datetime.now().date()
+    simulated_rewards = [
+        {
             'node_id': node_id,
+            'date': today - timedelta(days=i),
             'poa_points': random.randint(10, 50),  # Random POA points
             'poc_points': random.randint(5, 30),   # Random POC points
-            'referral_points': random.randint(0, 20),  # Random referral points
-            'date': date,
-            'created_at': datetime.now().isoformat()
+            'referral_points': random.randint(0, 20)  # Random referral points
         }
-        
-        simulated_rewards.append(reward)
+        for i in range(days)
+    ]
     
-    # Add simulated rewards to mock data
-    mock_rewards.extend(simulated_rewards)
+    if create_rewards_bulk(simulated_rewards) is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to record simulated reward data'
+        }), 500
+    
+    simulated_rewards = [
+        reward.to_dict()
+        for reward in get_rewards_by_date_range(node_id, today - timedelta(days=days - 1), today)
+    ]
+    
+    stats_cache.invalidate()
     
     return jsonify({
         'status': 'success',
@@ -101,40 +144,33 @@ def simulate_rewards(node_id):
 @data_collect_bp.route('/rewards/stats', methods=['GET'])
 def get_reward_stats():
     """Get aggregated reward statistics."""
-    if not mock_rewards:
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'total_poa_points': 0,
-                'total_poc_points': 0,
-                'total_referral_points': 0,
-                'total_points': 0,
-                'nodes_count': 0,
-                'average_points_per_node': 0
-            }
-        }), 200
-    
-    # Calculate statistics
-    total_poa_points = sum(reward['poa_points'] for reward in mock_rewards)
-    total_poc_points = sum(reward['poc_points'] for reward in mock_rewards)
-    total_referral_points = sum(reward['referral_points'] for reward in mock_rewards)
-    total_points = total_poa_points + total_poc_points + total_referral_points
-    
-    # Get unique node IDs
-    node_ids = set(reward['node_id'] for reward in mock_rewards)
-    nodes_count = len(node_ids)
-    
-    # Calculate average points per node
-    average_points_per_node = total_points / nodes_count if nodes_count > 0 else 0
-    
-    return jsonify({
-        'status': 'success',
-        'data': {
-            'total_poa_points': total_poa_points,
-            'total_poc_points': total_poc_points,
-            'total_referral_points': total_referral_points,
+    stats = stats_cache.get('stats')
+    if stats is None:
+        totals = get_reward_totals()
+        if totals is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Failed to get reward statistics'
+            }), 500
+        
+        # Calculate statistics
+        total_points = totals['total_poa_points'] + totals['total_poc_points'] + totals['total_referral_points']
+        nodes_count = totals['nodes_count']
+        
+        # Calculate average points per node
+        average_points_per_node = total_points / nodes_count if nodes_count > 0 else 0
+        
+        stats = {
+            'total_poa_points': totals['total_poa_points'],
+            'total_poc_points': totals['total_poc_points'],
+            'total_referral_points': totals['total_referral_points'],
             'total_points': total_points,
             'nodes_count': nodes_count,
             'average_points_per_node': average_points_per_node
         }
+        stats_cache.set('stats', stats)
+    
+    return jsonify({
+        'status': 'success',
+        'data': stats
     }), 200
@@ -0,0 +1,118 @@
+"""
+Metrics API endpoints.
+This module exposes request, database and connection pool metrics to admins and to Prometheus.
+"""
+from flask import Blueprint, request, jsonify, Response
+from functools import wraps
+import hmac
+import os
+
+from utils.security import admin_required
+from utils.db_metrics import db_metrics
+from middleware.timing import request_metrics, request_profiler
+
+# Create a Blueprint for metrics
+metrics_bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def scrape_access_required(fn):
+    """Allow requests bearing METRICS_TOKEN, or else require an admin."""
+    admin_fn = admin_required(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = os.environ.get('METRICS_TOKEN')
+        authorization = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(authorization, f'Bearer {token}'):
+            return fn(*args, **kwargs)
+        return admin_fn(*args, **kwargs)
+
+    return wrapper
+
+@metrics_bp.route('/database', methods=['GET'])
+@admin_required
+def get_database_metrics():
+    """Get query latency, slow query and connection pool metrics."""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid limit'
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        'data': db_metrics.snapshot(limit)
+    }), 200
+
+@metrics_bp.route('/requests', methods=['GET'])
+@admin_required
+def get_request_metrics():
+    """Get latency, response size and status metrics by blueprint and route."""
+    return jsonify({
+        'status': 'success',
+        'data': request_metrics.snapshot()
+    }), 200
+
+@metrics_bp.route('/profiling', methods=['GET'])
+@admin_required
+def get_profiling():
+    """Get the profiler settings and the slowest profiled requests."""
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'enabled': request_profiler.enabled,
+            'sample_rate': request_profiler.sample_rate,
+            'profiles': request_profiler.profiles()
+        }
+    }), 200
+
+@metrics_bp.route('/profiling', methods=['PUT'])
+@admin_required
+def update_profiling():
+    """Turn profiling of a sample of requests on or off."""
+    data = request.get_json() or {}
+
+    if 'enabled' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing required field: enabled'
+        }), 400
+
+    try:
+        request_profiler.configure(data['enabled'], data.get('sample_rate'))
+    except (TypeError, ValueError):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid sample_rate'
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'enabled': request_profiler.enabled,
+            'sample_rate': request_profiler.sample_rate
+        }
+    }), 200
+
+@metrics_bp.route('/profiling/<int:profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    """Get a profiled request as collapsed stacks for flame graph tools."""
+    stacks = request_profiler.collapsed(profile_id)
+    if stacks is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Profile not found'
+        }), 404
+
+    return Response(stacks, content_type='text/plain; charset=utf-8')
+
+@metrics_bp.route('/prometheus', methods=['GET'])
+@scrape_access_required
+def get_prometheus_metrics():
+    """Get all metrics in the Prometheus text format."""
+    lines = request_metrics.prometheus_lines() + db_metrics.prometheus_lines()
+    return Response('\n'.join(lines) + '\n', content_type=PROMETHEUS_CONTENT_TYPE)
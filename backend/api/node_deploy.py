@@ -4,6 +4,7 @@ This module handles the deployment and management of Sentry Nodes on VMs.
 """
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from utils.pagination import parse_page_args, paginate_list, page_response, ndjson_response
 
 # Create a Blueprint for node deployment
 node_deploy_bp = Blueprint('node_deploy', __name__)
@@ -13,11 +14,19 @@ mock_nodes = []
 
 @node_deploy_bp.route('/nodes', methods=['GET'])
 def get_nodes():
-    """Get all nodes."""
-    return jsonify({
-        'status': 'success',
-        'data': mock_nodes
-    }), 200
+    """Get all nodes, a page at a time."""
+    try:
+        limit, after, stream = parse_page_args()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    if stream:
+        return ndjson_response(list(mock_nodes))
+    
+    return page_response(paginate_list(mock_nodes, limit, after), limit)
 
 @node_deploy_bp.route('/nodes', methods=['POST'])
 def create_node():
@@ -6,15 +6,17 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 import logging
 from datetime import datetime
 
-from models.node import get_node_by_id, update_node
-from models.vm import get_vm_by_id
-from websocket.socket_manager import broadcast_node_status_update, broadcast_reward_update
+from models.node import get_node_with_vm, update_node, get_node_owners, update_node_statuses
+from websocket.socket_manager import broadcast_node_status_update, broadcast_reward_update, record_node_change
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 realtime_bp = Blueprint('realtime', __name__)
 
+# Maximum node statuses accepted by one batch request
+MAX_STATUS_BATCH = 1000
+
 @realtime_bp.route('/node/<int:node_id>/status', methods=['POST'])
 @jwt_required()
 def update_node_status(node_id):
@@ -31,16 +33,15 @@ def update_node_status(node_id):
                 'message': f'Missing required field: {field}'
             }), 400
     
-    # Get node from database
-    node = get_node_by_id(node_id)
+    # Get node and its VM from database to check ownership
+    node = get_node_with_vm(node_id)
     if not node:
         return jsonify({
             'status': 'error',
             'message': f'Node with ID {node_id} not found'
         }), 404
     
-    # Get VM to check ownership
-    vm = get_vm_by_id(node.vm_id)
+    vm = node.vm
     if not vm:
         return jsonify({
             'status': 'error',
@@ -84,6 +85,86 @@ def update_node_status(node_id):
         'data': updated_node.to_dict()
     }), 200
 
+@realtime_bp.route('/nodes/status:batch', methods=['POST'])
+@jwt_required()
+def update_node_statuses_batch():
+    """Update the status of many nodes and broadcast the changes to subscribed clients."""
+    user_id = get_jwt_identity()
+    data = request.json or {}
+    
+    updates = data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing required field: updates'
+        }), 400
+    
+    if len(updates) > MAX_STATUS_BATCH:
+        return jsonify({
+            'status': 'error',
+            'message': f'At most {MAX_STATUS_BATCH} updates are accepted per request'
+        }), 413
+    
+    # Validate updates, keeping the last one for each node
+    statuses = {}
+    for index, update in enumerate(updates):
+        for field in ('node_id', 'status', 'uptime_percentage'):
+            if not isinstance(update, dict) or field not in update:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Missing required field in update {index}: {field}'
+                }), 400
+        
+        if isinstance(update['node_id'], bool) or not isinstance(update['node_id'], int):
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid node_id in update {index}'
+            }), 400
+        
+        statuses[update['node_id']] = {
+            'status': update['status'],
+            'uptime_percentage': update['uptime_percentage']
+        }
+    
+    # Check ownership of all nodes with one query
+    owners = get_node_owners(list(statuses))
+    if owners is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Error getting nodes from database'
+        }), 500
+    
+    rejected = []
+    for node_id in list(statuses):
+        if node_id not in owners:
+            rejected.append({'node_id': node_id, 'reason': 'not_found'})
+        elif str(owners[node_id]) != str(user_id):
+            rejected.append({'node_id': node_id, 'reason': 'forbidden'})
+        else:
+            continue
+        del statuses[node_id]
+    
+    if statuses and not update_node_statuses(statuses):
+        return jsonify({
+            'status': 'error',
+            'message': 'Error updating nodes in database'
+        }), 500
+    
+    # Queue the changes; they are emitted as one batch per node room
+    updated_at = datetime.utcnow().isoformat()
+    for node_id, status in statuses.items():
+        record_node_change(user_id, node_id, dict(status, updated_at=updated_at))
+        broadcast_node_status_update(node_id, dict(status, node_id=node_id, updated_at=updated_at))
+    
+    return jsonify({
+        'status': 'success',
+        'message': f'{len(statuses)} node statuses updated',
+        'data': {
+            'updated': list(statuses),
+            'rejected': rejected
+        }
+    }), 200
+
 @realtime_bp.route('/reward/update', methods=['POST'])
 @jwt_required()
 def update_reward():
@@ -100,16 +181,15 @@ def update_reward():
                 'message': f'Missing required field: {field}'
             }), 400
     
-    # Get node from database
-    node = get_node_by_id(data['node_id'])
+    # Get node and its VM from database to check ownership
+    node = get_node_with_vm(data['node_id'])
     if not node:
         return jsonify({
             'status': 'error',
             'message': f'Node with ID {data["node_id"]} not found'
         }), 404
     
-    # Get VM to check ownership
-    vm = get_vm_by_id(node.vm_id)
+    vm = node.vm
     if not vm:
         return jsonify({
             'status': 'error',
@@ -145,13 +225,16 @@ def update_reward():
 @realtime_bp.route('/status', methods=['GET'])
 def get_realtime_status():
     """Get real-time system status."""
-    from websocket.socket_manager import get_connected_clients_count, get_authenticated_clients_count
+    from websocket.socket_manager import (
+        get_connected_clients_count, get_authenticated_clients_count, get_room_subscriber_counts
+    )
     
     return jsonify({
         'status': 'success',
         'data': {
             'connected_clients': get_connected_clients_count(),
             'authenticated_clients': get_authenticated_clients_count(),
+            'subscribed_rooms': len(get_room_subscriber_counts()),
             'server_time': datetime.utcnow().isoformat()
         }
     }), 200
@@ -4,6 +4,7 @@ This module handles the management of referral relationships between nodes.
 """
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from utils.pagination import parse_page_args, paginate_list, page_response, ndjson_response
 
 # Create a Blueprint for referral management
 referral_manage_bp = Blueprint('referral_manage', __name__)
@@ -13,11 +14,19 @@ mock_referrals = []
 
 @referral_manage_bp.route('/referrals', methods=['GET'])
 def get_referrals():
-    """Get all referrals."""
-    return jsonify({
-        'status': 'success',
-        'data': mock_referrals
-    }), 200
+    """Get all referrals, a page at a time."""
+    try:
+        limit, after, stream = parse_page_args()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    if stream:
+        return ndjson_response(list(mock_referrals))
+    
+    return page_response(paginate_list(mock_referrals, limit, after), limit)
 
 @referral_manage_bp.route('/referrals/node/<int:node_id>', methods=['GET'])
 def get_node_referrals(node_id):
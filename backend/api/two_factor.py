@@ -1,23 +1,60 @@
 """
 Two-factor authentication API for GradientLab backend.
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import logging
 import pyotp
 import qrcode
+import qrcode.image.svg
+import hashlib
 import io
+import os
 import json
 from datetime import datetime, timedelta
 
 from models.user import get_user_by_id
 from config.database import get_session
+from utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 two_factor_bp = Blueprint('two_factor', __name__)
 
+# Rendered QR codes by (user ID, secret hash, format)
+qrcode_cache = LRUCache(maxsize=int(os.environ.get('QRCODE_CACHE_SIZE', '256')))
+
+QRCODE_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+def render_qrcode(uri, image_format):
+    """Render an OTP URI as a QR code image."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(uri)
+    qr.make(fit=True)
+    
+    if image_format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+    
+    # Save image to memory
+    img_io = io.BytesIO()
+    img.save(img_io)
+    return img_io.getvalue()
+
+def invalidate_qrcodes(user_id):
+    """Drop the cached QR codes of a user whose secret changed."""
+    qrcode_cache.invalidate(match=lambda key: key[0] == user_id)
+
 @two_factor_bp.route('/setup', methods=['POST'])
 @jwt_required()
 def setup_2fa():
@@ -39,6 +76,7 @@ def setup_2fa():
     session = get_session()
     try:
         session.commit()
+        invalidate_qrcodes(user.id)
         
         return jsonify({
             'status': 'success',
@@ -56,8 +94,6 @@ def setup_2fa():
             'status': 'error',
             'message': 'Error setting up two-factor authentication'
         }), 500
-    finally:
-        session.close()
 
 @two_factor_bp.route('/qrcode', methods=['GET'])
 @jwt_required()
@@ -88,24 +124,30 @@ def get_qrcode():
             'message': 'Error generating QR code'
         }), 500
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(uri)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
+    # Check the requested image format
+    image_format = request.args.get('format', 'png').lower()
+    if image_format not in QRCODE_FORMATS:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid format. Use png or svg'
+        }), 400
     
-    # Save image to memory
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
+    # The image only changes with the secret, so a client holding it gets a 304
+    secret_hash = hashlib.sha256(uri.encode()).hexdigest()
+    etag = f'{secret_hash[:32]}-{image_format}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        image = qrcode_cache.get_or_set(
+            (user.id, secret_hash, image_format),
+            lambda: render_qrcode(uri, image_format)
+        )
+        response = Response(image, mimetype=QRCODE_FORMATS[image_format])
     
-    return send_file(img_io, mimetype='image/png')
+    response.set_etag(etag)
+    # The image contains the secret, so it may only be kept by the user's browser
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @two_factor_bp.route('/verify', methods=['POST'])
 @jwt_required()
@@ -168,8 +210,6 @@ def verify_2fa():
                 'status': 'error',
                 'message': 'Error verifying two-factor authentication'
             }), 500
-        finally:
-            session.close()
     else:
         return jsonify({
             'status': 'error',
@@ -220,6 +260,7 @@ def disable_2fa():
             user.backup_codes = None
             
             session.commit()
+            invalidate_qrcodes(user.id)
             
             return jsonify({
                 'status': 'success',
@@ -233,8 +274,6 @@ def disable_2fa():
                 'status': 'error',
                 'message': 'Error disabling two-factor authentication'
             }), 500
-        finally:
-            session.close()
     else:
         return jsonify({
             'status': 'error',
@@ -326,8 +365,6 @@ def regenerate_backup_codes():
                 'status': 'error',
                 'message': 'Error regenerating backup codes'
             }), 500
-        finally:
-            session.close()
     else:
         return jsonify({
             'status': 'error',
@@ -10,7 +10,8 @@ import logging
 from datetime import datetime
 from cloud.provider import get_provider
 from models.user import get_user_by_id
-from models.vm import create_vm, get_vm_by_id, get_vm_by_provider_id, get_vms_by_user, update_vm, delete_vm as db_delete_vm
+from models.vm import create_vm, get_vm_by_id, get_vm_by_provider_id, get_vms_page, iter_vms_by_user, update_vm, delete_vm as db_delete_vm
+from utils.pagination import parse_page_args, page_response, ndjson_response
 
 # Create a Blueprint for VM provisioning
 vm_provision_bp = Blueprint('vm_provision', __name__)
@@ -33,20 +34,28 @@ def get_provider_instance(provider_name):
 @vm_provision_bp.route('/vms', methods=['GET'])
 @jwt_required()
 def get_vms():
-    """Get all VMs for the authenticated user."""
+    """Get all VMs for the authenticated user, a page at a time."""
     # Get user ID from JWT token
     user_id = get_jwt_identity()
 
-    # Get all VMs for the user from the database
-    vms = get_vms_by_user(user_id)
+    try:
+        limit, after, stream = parse_page_args()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    if stream:
+        return ndjson_response(vm.to_dict() for vm in iter_vms_by_user(user_id))
+
+    # Get a page of VMs for the user from the database
+    vms = get_vms_page(user_id, limit=limit + 1, after=after)
 
     # Convert VMs to dictionaries
     vm_dicts = [vm.to_dict() for vm in vms]
 
-    return jsonify({
-        'status': 'success',
-        'data': vm_dicts
-    }), 200
+    return page_response(vm_dicts, limit)
 
 @vm_provision_bp.route('/vms', methods=['POST'])
 @jwt_required()
@@ -1,3 +1,9 @@
+if __name__ == '__main__':
+    # Patch before anything else is imported, so that thread-locals such as
+    # the database session registry are per greenlet rather than shared
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
@@ -7,6 +13,7 @@ import logging
 from datetime import timedelta
 from dotenv import load_dotenv
 from middleware.security import HTTPSRedirect, RateLimiter
+from middleware.timing import init_app as init_request_timing
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -19,7 +26,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import database configuration
-from config.database import init_db
+from config.database import init_db, remove_session
 
 # Import models
 from models.user import create_admin_user
@@ -32,6 +39,7 @@ from api.referral_manage import referral_manage_bp
 from api.auth import auth_bp
 from api.realtime import realtime_bp
 from api.two_factor import two_factor_bp
+from api.metrics import metrics_bp
 
 # Import WebSocket
 from websocket.socket_manager import init_app as init_socketio
@@ -58,10 +66,20 @@ csrf = CSRFProtect(app)
 # Enable CORS for all routes
 cors = CORS(app, supports_credentials=True)
 
+# Tighter rate limits (requests, window in seconds) for expensive endpoints
+ROUTE_RATE_LIMITS = {
+    '/api/auth/login': (10, 60),
+    '/api/2fa/qrcode': (10, 60)
+}
+
 # Apply security middleware
 if os.environ.get('FLASK_ENV', 'production') != 'development':
     app.wsgi_app = HTTPSRedirect(app.wsgi_app)
-    app.wsgi_app = RateLimiter(app.wsgi_app, limit=100, window=60)
+    app.wsgi_app = RateLimiter(app.wsgi_app, limit=100, window=60, routes=ROUTE_RATE_LIMITS)
+
+# Time requests outermost so redirected and rate limited requests are counted
+if os.environ.get('REQUEST_TIMING', 'true').lower() == 'true':
+    init_request_timing(app)
 
 # Register API blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -71,6 +89,7 @@ app.register_blueprint(data_collect_bp, url_prefix='/api/data')
 app.register_blueprint(referral_manage_bp, url_prefix='/api/referral')
 app.register_blueprint(realtime_bp, url_prefix='/api/realtime')
 app.register_blueprint(two_factor_bp, url_prefix='/api/2fa')
+app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
 
 # Initialize WebSocket
 socketio = init_socketio(app)
@@ -100,6 +119,11 @@ def health():
         'status': 'healthy'
     })
 
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """Release the database session used by the request."""
+    remove_session(exception)
+
 # Initialize database
 @app.before_first_request
 def initialize_database():
@@ -124,6 +148,4 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
 
     # Run the app with WebSocket support
-    import eventlet
-    eventlet.monkey_patch()
     socketio.run(app, host='0.0.0.0', port=port, debug=True)
@@ -2,10 +2,11 @@
 Database configuration for GradientLab backend.
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 import logging
+from utils.db_metrics import db_metrics, InstrumentedQueuePool
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +17,62 @@ DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///gradientlab.db')
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
+# Connection pool settings
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+
+# Record query and pool metrics (see utils/db_metrics.py)
+DB_INSTRUMENTATION = os.environ.get('DB_INSTRUMENTATION', 'True').lower() == 'true'
+
+def is_memory_database(url):
+    """Check whether a database URL points at an in-memory SQLite database."""
+    return url.startswith('sqlite') and (url in ('sqlite://', 'sqlite:///') or ':memory:' in url)
+
+def engine_options(url):
+    """Get the create_engine() options for a database URL."""
+    options = {
+        'echo': os.environ.get('SQLALCHEMY_ECHO', 'False').lower() == 'true',
+        'pool_pre_ping': True
+    }
+    pool_options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_timeout': DB_POOL_TIMEOUT
+    }
+    
+    if url.startswith('sqlite'):
+        # Connections are shared by the threads and greenlets serving requests
+        options['connect_args'] = {'check_same_thread': False, 'timeout': 30}
+        if is_memory_database(url):
+            # Each connection to an in-memory database is a separate database,
+            # so keep SQLAlchemy's default single connection per thread
+            return options
+    
+    options.update(pool_options)
+    return options
+
 # Create engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=os.environ.get('SQLALCHEMY_ECHO', 'False').lower() == 'true',
-    pool_pre_ping=True
-)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+
+if DB_INSTRUMENTATION:
+    db_metrics.instrument(engine)
+
+if engine.dialect.name == 'sqlite' and not is_memory_database(DATABASE_URL):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Let readers and a writer work concurrently on SQLite."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
 
 # Create session factory
 session_factory = sessionmaker(bind=engine)
+# One session per thread, or per greenlet when eventlet patched threading before this import
 Session = scoped_session(session_factory)
 
 # Create base class for models
@@ -37,20 +85,38 @@ def init_db():
         from models.user import User
         from models.vm import VM
         from models.node import Node
-        from models.reward import Reward
+        from models.reward import Reward, ensure_upsert_index
         from models.referral import Referral
         
         # Create tables
         Base.metadata.create_all(engine)
+        # Tables that already existed don't get new indexes from create_all
+        ensure_upsert_index(engine)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
 def get_session():
-    """Get a database session."""
+    """Get the database session of the current request or thread."""
     return Session()
 
 def close_session(session):
     """Close a database session."""
     session.close()
+
+def remove_session(exception=None):
+    """Close and discard the session of the current request or thread."""
+    Session.remove()
+
+def save_changes(session, commit=True):
+    """Commit a session, or only flush it when the caller owns the transaction."""
+    if commit:
+        session.commit()
+    else:
+        session.flush()
+
+def discard_changes(session, commit=True):
+    """Roll back a session after an error, unless the caller owns the transaction and decides itself."""
+    if commit:
+        session.rollback()
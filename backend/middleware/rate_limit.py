@@ -0,0 +1,238 @@
+"""
+Rate limit backends for GradientLab backend.
+
+Limits are enforced with a token bucket per key: a bucket holds up to
+`capacity` tokens, refills at `rate` tokens per second and every request
+takes one token. Unlike a fixed window, a client cannot send twice the limit
+around a window boundary. Buckets live in a backend, which is either this
+process (memory), a SQLite file shared by the workers on a host, or a Redis
+server shared by all hosts.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+def refill(tokens, updated, capacity, rate, now):
+    """
+    Take a token from a bucket.
+
+    Args:
+        tokens (float): Tokens in the bucket at the last update, or None for a new bucket
+        updated (float): Time of the last update
+        capacity (int): Maximum tokens in the bucket
+        rate (float): Tokens added per second
+        now (float): Current time
+
+    Returns:
+        tuple: (allowed, tokens left, seconds until a token is available)
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + (now - updated) * rate)
+
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+def idle_ttl(capacity, rate):
+    """Get the time after which an unused bucket is full again and can be dropped."""
+    return capacity / rate
+
+class MemoryBackend:
+    """
+    Buckets of this process, bounded in number.
+
+    Args:
+        max_keys (int): Maximum number of buckets; the least recently used
+            bucket is evicted beyond this
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, rate):
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): Bucket key
+            capacity (int): Maximum tokens in the bucket
+            rate (float): Tokens added per second
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self.buckets.pop(key, (None, now, None))
+            allowed, tokens, retry_after = refill(tokens, updated, capacity, rate, now)
+            self.buckets[key] = (tokens, now, now + idle_ttl(capacity, rate))
+
+            # Buckets are in least recently used order, so idle ones are at the front
+            while len(self.buckets) > 1:
+                oldest, (_, _, expires) = next(iter(self.buckets.items()))
+                if len(self.buckets) <= self.max_keys and now < expires:
+                    break
+                del self.buckets[oldest]
+
+        return allowed, retry_after
+
+class SQLiteBackend:
+    """
+    Buckets in a SQLite file shared by the worker processes of a host.
+
+    Args:
+        path (str): Path of the database file
+        prune_every (int): Delete idle buckets after this many hits
+    """
+
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self.hits = 0
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                expires REAL NOT NULL
+            )
+        ''')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, capacity, rate):
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): Bucket key
+            capacity (int): Maximum tokens in the bucket
+            rate (float): Tokens added per second
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        conn = self._connect()
+        # Wall clock time, since it is compared across processes
+        now = time.time()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (None, now)
+            allowed, tokens, retry_after = refill(tokens, updated, capacity, rate, now)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, tokens, updated, expires) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + idle_ttl(capacity, rate))
+            )
+
+            self.hits += 1
+            if self.hits % self.prune_every == 0:
+                conn.execute('DELETE FROM rate_limits WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return allowed, retry_after
+
+# Token bucket update, run atomically by Redis
+REDIS_TOKEN_BUCKET = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(retry_after)}
+'''
+
+class RedisBackend:
+    """
+    Buckets in a Redis server, or a server speaking its protocol, shared by all hosts.
+
+    Args:
+        url (str): Redis URL, e.g. redis://localhost:6379/0
+        prefix (str): Prefix of the bucket keys
+    """
+
+    def __init__(self, url, prefix='gradientlab:ratelimit:'):
+        if redis is None:
+            raise RuntimeError('The redis package is required for the Redis rate limit backend')
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+
+    def hit(self, key, capacity, rate):
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): Bucket key
+            capacity (int): Maximum tokens in the bucket
+            rate (float): Tokens added per second
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        allowed, retry_after = self.script(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        return bool(allowed), float(retry_after)
+
+def get_backend(url=None):
+    """
+    Create the rate limit backend configured by a URL.
+
+    Args:
+        url (str): memory, sqlite:///path/to/file or redis://host:port/db;
+            RATE_LIMIT_BACKEND or memory by default
+
+    Returns:
+        object: Rate limit backend
+    """
+    url = url or os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    if url != 'memory':
+        logger.error(f"Unknown rate limit backend {url}, using memory")
+    return MemoryBackend(int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000')))
@@ -3,6 +3,11 @@ Security middleware for GradientLab backend.
 """
 from flask import request, redirect
 import os
+import math
+import logging
+from middleware.rate_limit import get_backend
+
+logger = logging.getLogger(__name__)
 
 class HTTPSRedirect:
     """Middleware to redirect HTTP requests to HTTPS."""
@@ -26,13 +31,14 @@ class HTTPSRedirect:
         return response(environ, start_response)
 
 class RateLimiter:
-    """Middleware to limit request rate."""
+    """Middleware to limit request rate per client, with tighter limits for some routes."""
     
-    def __init__(self, app, limit=100, window=60):
+    def __init__(self, app, limit=100, window=60, routes=None, backend=None):
         self.app = app
         self.limit = limit  # Number of requests
         self.window = window  # Time window in seconds
-        self.clients = {}
+        self.routes = routes or {}  # Path to (limit, window) of expensive endpoints
+        self.backend = backend or get_backend()
     
     def __call__(self, environ, start_response):
         """Process the request."""
@@ -44,35 +50,34 @@ class RateLimiter:
         client_ip = environ.get('REMOTE_ADDR')
         
         # Check if client is rate limited
-        if self._is_rate_limited(client_ip):
+        retry_after = self._is_rate_limited(client_ip, environ.get('PATH_INFO', ''))
+        if retry_after is not None:
             # Return 429 Too Many Requests
-            response_headers = [('Content-Type', 'text/plain')]
+            response_headers = [
+                ('Content-Type', 'text/plain'),
+                ('Retry-After', str(max(1, math.ceil(retry_after))))
+            ]
             start_response('429 Too Many Requests', response_headers)
             return [b'Too many requests. Please try again later.']
         
         return self.app(environ, start_response)
     
-    def _is_rate_limited(self, client_ip):
-        """Check if client is rate limited."""
-        from time import time
-        
-        # Get current time
-        now = time()
-        
-        # Initialize client if not exists
-        if client_ip not in self.clients:
-            self.clients[client_ip] = {
-                'requests': 0,
-                'window_start': now
-            }
-        
-        # Reset window if expired
-        if now - self.clients[client_ip]['window_start'] > self.window:
-            self.clients[client_ip]['requests'] = 0
-            self.clients[client_ip]['window_start'] = now
+    def _is_rate_limited(self, client_ip, path):
+        """Check if client is rate limited, returning the seconds to wait if so."""
+        buckets = [(f'client:{client_ip}', self.limit, self.window)]
+        if path in self.routes:
+            route_limit, route_window = self.routes[path]
+            buckets.append((f'route:{path}:{client_ip}', route_limit, route_window))
         
-        # Increment request count
-        self.clients[client_ip]['requests'] += 1
+        for key, limit, window in buckets:
+            try:
+                allowed, retry_after = self.backend.hit(key, limit, limit / window)
+            except Exception as e:
+                # Let requests through rather than failing them when the backend is down
+                logger.error(f"Error checking rate limit: {str(e)}")
+                return None
+            
+            if not allowed:
+                return retry_after
         
-        # Check if rate limited
-        return self.clients[client_ip]['requests'] > self.limit
+        return None
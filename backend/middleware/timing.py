@@ -0,0 +1,320 @@
+"""
+Request timing middleware for GradientLab backend.
+
+Records latency, response size and status counts per blueprint and per
+route, and can profile selected requests with a stack sampler. Profiles are
+kept as collapsed stacks ("frame;frame;frame count"), the input format of
+flamegraph.pl and speedscope, for the slowest profiled requests.
+
+Under eventlet all greenlets share one OS thread, so a profile follows the
+request's greenlet rather than the thread: while another greenlet runs, the
+request is sampled where it is suspended, e.g. waiting on the database. The
+check of which greenlet runs races with the sample itself, so a sample taken
+right at a switch may land in another greenlet's stack.
+"""
+import os
+import sys
+import hmac
+import heapq
+import random
+import itertools
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import request
+from utils.metrics import Histogram, LATENCY_BUCKETS, format_labels
+
+try:
+    # Sample from a real OS thread even when eventlet has patched threading
+    from eventlet import patcher
+    native_threading = patcher.original('threading')
+    native_get_ident = patcher.original('_thread').get_ident
+    from greenlet import getcurrent as current_greenlet
+except ImportError:  # pragma: no cover - eventlet is a dependency
+    import _thread
+    native_threading = threading
+    native_get_ident = _thread.get_ident
+    current_greenlet = lambda: None
+
+# Response size buckets in bytes, from 256 B to 4 MiB
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNMATCHED_ROUTE = '<unmatched>'
+APP_BLUEPRINT = '<app>'
+
+# WSGI environ key of the blueprint and route rule Flask matched
+ROUTE_KEY = 'gradientlab.route'
+
+class RequestMetrics:
+    """Latency, response size and status statistics of the served requests."""
+
+    def __init__(self):
+        self.routes = {}
+        self.blueprints = {}
+        self.sizes = {}
+        self.statuses = Counter()
+        self._lock = threading.Lock()
+
+    def _histogram(self, histograms, key, buckets=LATENCY_BUCKETS):
+        histogram = histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def record(self, blueprint, route, method, status, duration, size):
+        """Record a served request."""
+        self._histogram(self.routes, (method, route)).observe(duration)
+        self._histogram(self.blueprints, blueprint).observe(duration)
+        self._histogram(self.sizes, (method, route), SIZE_BUCKETS).observe(size)
+        with self._lock:
+            self.statuses[(method, route, status)] += 1
+
+    def snapshot(self):
+        """Summarize the request metrics by blueprint and by route."""
+        with self._lock:
+            statuses = dict(self.statuses)
+
+        routes = []
+        for (method, route), histogram in list(self.routes.items()):
+            routes.append(dict(
+                histogram.snapshot(),
+                method=method,
+                route=route,
+                response_size=self.sizes[(method, route)].snapshot(),
+                statuses={
+                    str(status): count
+                    for (m, r, status), count in statuses.items()
+                    if m == method and r == route
+                }
+            ))
+        routes.sort(key=lambda stats: stats['sum'], reverse=True)
+
+        return {
+            'blueprints': {
+                blueprint: histogram.snapshot()
+                for blueprint, histogram in list(self.blueprints.items())
+            },
+            'routes': routes
+        }
+
+    def prometheus_lines(self):
+        """Render the request metrics in the Prometheus text format."""
+        lines = ['# TYPE gradientlab_http_request_seconds histogram']
+        for (method, route), histogram in list(self.routes.items()):
+            lines.extend(histogram.prometheus_lines(
+                'gradientlab_http_request_seconds', {'method': method, 'route': route}
+            ))
+
+        lines.append('# TYPE gradientlab_http_blueprint_request_seconds histogram')
+        for blueprint, histogram in list(self.blueprints.items()):
+            lines.extend(histogram.prometheus_lines(
+                'gradientlab_http_blueprint_request_seconds', {'blueprint': blueprint}
+            ))
+
+        lines.append('# TYPE gradientlab_http_response_bytes histogram')
+        for (method, route), histogram in list(self.sizes.items()):
+            lines.extend(histogram.prometheus_lines(
+                'gradientlab_http_response_bytes', {'method': method, 'route': route}
+            ))
+
+        lines.append('# TYPE gradientlab_http_responses_total counter')
+        with self._lock:
+            statuses = list(self.statuses.items())
+        for (method, route, status), count in statuses:
+            labels = format_labels(method=method, route=route, status=status)
+            lines.append(f"gradientlab_http_responses_total{labels} {count}")
+        return lines
+
+def collapse_stack(frame):
+    """Render a frame and its callers as a collapsed stack, outermost first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Samples the stack of one greenlet at a fixed interval from a native thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.target = native_get_ident()
+        self.greenlet = current_greenlet()
+        self.stacks = Counter()
+        self._stopped = native_threading.Event()
+        self._thread = native_threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            # A suspended greenlet keeps its frame, a running one is the thread's
+            frame = self.greenlet.gr_frame if self.greenlet is not None else None
+            if frame is None:
+                frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def start(self):
+        """Start sampling."""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the sampled stacks."""
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+class RequestProfiler:
+    """Profiles opted-in requests and keeps the slowest profiles."""
+
+    def __init__(self, interval=0.005, keep=20):
+        self.interval = interval
+        self.keep = keep
+        self.token = os.environ.get('PROFILE_TOKEN')
+        self.enabled = False
+        self.sample_rate = 0.0
+        self._profiles = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, enabled, sample_rate=None):
+        """Turn sampling of a fraction of all requests on or off."""
+        self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+
+    def should_profile(self, environ):
+        """Check whether a request is to be profiled."""
+        requested = environ.get('HTTP_X_PROFILE_TOKEN')
+        if self.token and requested and hmac.compare_digest(requested, self.token):
+            return True
+        return self.enabled and random.random() < self.sample_rate
+
+    def start(self, environ):
+        """Start profiling a request if it opted in."""
+        if not self.should_profile(environ):
+            return None
+        return StackSampler(self.interval).start()
+
+    def finish(self, sampler, method, path, route, status, duration):
+        """Stop profiling a request and keep its profile if it is among the slowest."""
+        stacks = sampler.stop()
+        profile = {
+            'id': next(self._ids),
+            'method': method,
+            'path': path,
+            'route': route,
+            'status': status,
+            'duration': round(duration, 6),
+            'samples': sum(stacks.values()),
+            'at': datetime.utcnow().isoformat(),
+            'stacks': dict(stacks)
+        }
+
+        with self._lock:
+            entry = (duration, profile['id'], profile)
+            if len(self._profiles) < self.keep:
+                heapq.heappush(self._profiles, entry)
+            elif duration > self._profiles[0][0]:
+                heapq.heapreplace(self._profiles, entry)
+
+    def profiles(self):
+        """Get the kept profiles without their stacks, slowest first."""
+        with self._lock:
+            entries = sorted(self._profiles, reverse=True)
+        return [
+            {key: value for key, value in profile.items() if key != 'stacks'}
+            for _, _, profile in entries
+        ]
+
+    def collapsed(self, profile_id):
+        """Get a kept profile as collapsed stacks, or None if it is not kept."""
+        with self._lock:
+            profile = next((p for _, _, p in self._profiles if p['id'] == profile_id), None)
+        if profile is None:
+            return None
+        return ''.join(f"{stack} {count}\n" for stack, count in profile['stacks'].items())
+
+class _TimedBody:
+    """Response iterable that reports its size once sent or closed."""
+
+    def __init__(self, body, on_finish):
+        self.body = body
+        self.on_finish = on_finish
+        self.size = 0
+        self.finished = False
+
+    def _finish(self):
+        if not self.finished:
+            self.finished = True
+            self.on_finish(self.size)
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self._finish()
+
+class RequestTimer:
+    """Middleware to record request latency, size and status per route."""
+
+    def __init__(self, app, metrics=None, profiler=None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+        self.profiler = profiler or request_profiler
+
+    def __call__(self, environ, start_response):
+        """Process the request."""
+        started = time.perf_counter()
+        sampler = self.profiler.start(environ)
+        response = {'status': 500}
+
+        def timed_start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def finish(size):
+            duration = time.perf_counter() - started
+            method = environ.get('REQUEST_METHOD', 'GET')
+            blueprint, route = environ.get(ROUTE_KEY, (APP_BLUEPRINT, UNMATCHED_ROUTE))
+            self.metrics.record(blueprint, route, method, response['status'], duration, size)
+            if sampler is not None:
+                self.profiler.finish(sampler, method, environ.get('PATH_INFO', ''), route, response['status'], duration)
+
+        try:
+            body = self.app(environ, timed_start_response)
+        except Exception:
+            finish(0)
+            raise
+        return _TimedBody(body, finish)
+
+def _record_route(exception=None):
+    """Store the matched blueprint and route rule where the middleware can read them."""
+    if request.url_rule is not None:
+        request.environ[ROUTE_KEY] = (request.blueprint or APP_BLUEPRINT, request.url_rule.rule)
+
+def init_app(app, metrics=None, profiler=None):
+    """
+    Time the requests of a Flask app.
+
+    Args:
+        app (Flask): Flask application
+        metrics (RequestMetrics): Metrics to record into, request_metrics by default
+        profiler (RequestProfiler): Profiler to use, request_profiler by default
+    """
+    app.teardown_request(_record_route)
+    app.wsgi_app = RequestTimer(app.wsgi_app, metrics, profiler)
+
+# Metrics and profiler of the application
+request_metrics = RequestMetrics()
+request_profiler = RequestProfiler()
@@ -0,0 +1,101 @@
+"""
+Script to add the model indexes to an existing database.
+
+Tables created by init_db() already have every index declared on the models.
+This script adds them to databases created before the indexes existed,
+merging duplicate rows first so the unique indexes can be built.
+"""
+import os
+import sys
+import logging
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, delete, update
+from config.database import Base, engine
+from models.user import User
+from models.vm import VM
+from models.node import Node
+from models.reward import Reward
+from models.referral import Referral
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def merge_duplicate_rewards(connection):
+    """Fold rewards with the same node and date into their oldest row."""
+    table = Reward.__table__
+    duplicates = connection.execute(
+        select(
+            table.c.node_id,
+            table.c.date,
+            func.min(table.c.id),
+            func.sum(table.c.poa_points),
+            func.sum(table.c.poc_points),
+            func.sum(table.c.referral_points)
+        )
+        # Rewards without a node never conflict in the unique index
+        .where(table.c.node_id.is_not(None))
+        .group_by(table.c.node_id, table.c.date)
+        .having(func.count() > 1)
+    ).fetchall()
+
+    for node_id, date, keep_id, poa_points, poc_points, referral_points in duplicates:
+        connection.execute(
+            update(table)
+            .where(table.c.id == keep_id)
+            .values(poa_points=poa_points, poc_points=poc_points, referral_points=referral_points)
+        )
+        connection.execute(
+            delete(table).where(
+                table.c.node_id == node_id,
+                table.c.date == date,
+                table.c.id != keep_id
+            )
+        )
+
+    if duplicates:
+        logger.info(f"Merged duplicate rewards for {len(duplicates)} node days")
+
+def remove_duplicate_referrals(connection):
+    """Delete repeated referrals between the same nodes, keeping the oldest."""
+    table = Referral.__table__
+    # GROUP BY puts NULLs together, but the unique index never conflicts on them
+    linked = (table.c.referrer_node_id.is_not(None), table.c.referred_node_id.is_not(None))
+    keep = (
+        select(func.min(table.c.id))
+        .where(*linked)
+        .group_by(table.c.referrer_node_id, table.c.referred_node_id)
+    )
+    result = connection.execute(delete(table).where(*linked, table.c.id.not_in(keep)))
+
+    if result.rowcount:
+        logger.info(f"Removed {result.rowcount} duplicate referrals")
+
+def main():
+    """Add missing indexes to the database."""
+    try:
+        with engine.begin() as connection:
+            # Make sure every table exists before indexing it
+            Base.metadata.create_all(connection)
+
+            merge_duplicate_rewards(connection)
+            remove_duplicate_referrals(connection)
+
+            for model in (User, VM, Node, Reward, Referral):
+                for index in model.__table__.indexes:
+                    index.create(connection, checkfirst=True)
+                    logger.info(f"Index {index.name} is in place")
+
+        logger.info("Database indexes added successfully")
+        return 0
+    except Exception as e:
+        logger.error(f"Error adding database indexes: {str(e)}")
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
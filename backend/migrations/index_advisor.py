@@ -0,0 +1,200 @@
+"""
+Index advisor for the GradientLab models.
+
+Seeds a scratch database, runs the queries made by models/*.py against it and
+prints the plan of every SQL statement they issue (EXPLAIN QUERY PLAN on
+SQLite, EXPLAIN on PostgreSQL). Full table and index scans and temporary sorts are
+flagged, and the exit status is 1 if any query scans a table it should not.
+
+The database is seeded with test data, so only point --database-url at a
+scratch database. By default a temporary SQLite file is used.
+"""
+import os
+import sys
+import logging
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SEED_DAYS = 30
+
+def seed_database(session, nodes_count):
+    """Fill the database with users, VMs, nodes, daily rewards and referrals."""
+    from models.user import User
+    from models.vm import VM
+    from models.node import Node
+    from models.reward import Reward
+    from models.referral import Referral
+
+    users = [User(f'user{i}', f'user{i}@example.com', 'Password123!') for i in range(10)]
+    session.add_all(users)
+    session.flush()
+
+    vms = [
+        VM(name=f'vm{i}', provider='oracle', region='us-ashburn-1', vm_id=f'vm-{i}', user_id=users[i % len(users)].id)
+        for i in range(nodes_count)
+    ]
+    session.add_all(vms)
+    session.flush()
+
+    nodes = [Node(name=f'node{i}', vm_id=vm.id, status='running') for i, vm in enumerate(vms)]
+    session.add_all(nodes)
+    session.flush()
+
+    today = date.today()
+    session.bulk_save_objects([
+        Reward(node_id=node.id, date=today - timedelta(days=day), poa_points=10, poc_points=5, referral_points=1)
+        for node in nodes
+        for day in range(SEED_DAYS)
+    ])
+    session.bulk_save_objects([
+        Referral(referrer_node_id=nodes[i].id, referred_node_id=nodes[i + 1].id)
+        for i in range(len(nodes) - 1)
+    ])
+    session.commit()
+
+def model_queries():
+    """Get the model queries to check as (name, call, full_scan_expected)."""
+    from models import user, vm, node, reward, referral
+
+    today = date.today()
+    # Keyset pages start from a cursor in the middle of the seeded rows, as deep pages do
+    cursor_date = today - timedelta(days=SEED_DAYS // 2)
+    # Status batches cover a few of the many nodes, so the planner is not
+    # tempted into a scan by a batch spanning much of the small seeded table
+    batch = list(range(1, 11))
+    return [
+        ('user.get_user_by_username', lambda: user.get_user_by_username('user1'), False),
+        ('user.get_user_by_id', lambda: user.get_user_by_id(1), False),
+        ('vm.get_vm_by_id', lambda: vm.get_vm_by_id(1), False),
+        ('vm.get_vm_by_provider_id', lambda: vm.get_vm_by_provider_id('vm-1'), False),
+        ('vm.get_vms_by_user', lambda: vm.get_vms_by_user(1), False),
+        ('vm.get_vms_with_nodes_by_user', lambda: vm.get_vms_with_nodes_by_user(1), False),
+        ('vm.get_vms_page', lambda: vm.get_vms_page(1, limit=100, after=(5,)), False),
+        ('vm.iter_vms_by_user', lambda: list(vm.iter_vms_by_user(1)), False),
+        ('node.get_node_by_id', lambda: node.get_node_by_id(1), False),
+        ('node.get_node_with_vm', lambda: node.get_node_with_vm(1), False),
+        ('node.get_node_owners', lambda: node.get_node_owners(batch), False),
+        ('node.get_nodes_by_vm', lambda: node.get_nodes_by_vm(1), False),
+        ('node.update_node_statuses',
+         lambda: node.update_node_statuses({
+             node_id: {'status': 'running', 'uptime_percentage': 99.0} for node_id in batch
+         }), False),
+        ('reward.get_reward_by_id', lambda: reward.get_reward_by_id(1), False),
+        ('reward.get_rewards_by_node', lambda: reward.get_rewards_by_node(1), False),
+        ('reward.get_rewards_by_date_range',
+         lambda: reward.get_rewards_by_date_range(1, today - timedelta(days=7), today), False),
+        ('reward.get_rewards_page (node)',
+         lambda: reward.get_rewards_page(1, limit=100, after=(cursor_date, 1)), False),
+        ('reward.get_rewards_page (all)',
+         lambda: reward.get_rewards_page(limit=100, after=(cursor_date, 1)), False),
+        ('reward.iter_rewards (node)', lambda: list(reward.iter_rewards(1)), False),
+        ('reward.create_reward', lambda: reward.create_reward(1, today, poa_points=1), False),
+        # Aggregates over every reward by design
+        ('reward.get_reward_stats', reward.get_reward_stats, True),
+        ('referral.get_referral_by_id', lambda: referral.get_referral_by_id(1), False),
+        ('referral.get_referrals_by_referrer', lambda: referral.get_referrals_by_referrer(1), False),
+        ('referral.get_referrals_by_referred', lambda: referral.get_referrals_by_referred(2), False),
+        ('referral.create_referral', lambda: referral.create_referral(1, 2), False),
+    ]
+
+def explain(connection, statement, parameters):
+    """Get the query plan of a statement as a list of lines."""
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]
+
+    rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+    return [row[0] for row in rows]
+
+def plan_issues(dialect, plan):
+    """Get the full scans and temporary sorts in a query plan."""
+    issues = []
+    for line in plan:
+        detail = line.strip()
+        if dialect == 'sqlite':
+            # SCAN ... USING INDEX still reads the whole index; only SEARCH is bounded
+            if detail.startswith('SCAN '):
+                issues.append(f"full scan: {detail}")
+            elif 'USE TEMP B-TREE' in detail:
+                issues.append(f"temporary sort: {detail}")
+        elif 'Seq Scan on' in detail:
+            issues.append(f"full scan: {detail.lstrip('-> ')}")
+    return issues
+
+def main():
+    """Run the index advisor."""
+    parser = argparse.ArgumentParser(description="Flag model queries that scan whole tables")
+    parser.add_argument("--database-url", help="Scratch database to seed (default: a temporary SQLite file)")
+    parser.add_argument("--nodes", type=int, default=200, help="Number of nodes to seed")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(temp_dir.name, 'advisor.db')}"
+
+    # The engine is created from DATABASE_URL on import
+    from sqlalchemy import event
+    from config.database import engine, init_db, get_session
+
+    init_db()
+    session = get_session()
+    try:
+        seed_database(session, args.nodes)
+    finally:
+        session.close()
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # Bulk UPDATEs and DELETEs find their rows like a SELECT; plain INSERTs don't
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            captured.append((statement, parameters[0] if executemany else parameters))
+
+    unexpected = 0
+    with engine.connect() as connection:
+        for name, call, full_scan_expected in model_queries():
+            captured.clear()
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                call()
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+
+            print(f"\n{name}")
+            for statement, parameters in captured:
+                plan = explain(connection, statement, parameters)
+                for line in plan:
+                    print(f"    {line}")
+
+                for issue in plan_issues(connection.dialect.name, plan):
+                    if full_scan_expected:
+                        print(f"  expected {issue}")
+                    else:
+                        print(f"  WARNING {issue}")
+                        unexpected += 1
+
+    if temp_dir:
+        engine.dispose()
+        temp_dir.cleanup()
+
+    print(f"\n{unexpected} unexpected full scans or sorts")
+    return 1 if unexpected else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
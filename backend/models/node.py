@@ -2,16 +2,22 @@
 Node model for Sentry Nodes.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
-from sqlalchemy.orm import relationship
-from config.database import Base, get_session
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index, case, update
+from sqlalchemy.orm import relationship, contains_eager
+from config.database import Base, get_session, save_changes, discard_changes
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Nodes updated per UPDATE statement by update_node_statuses
+BULK_UPDATE_ROWS = 500
+
 class Node(Base):
     """Node model for Sentry Nodes."""
     __tablename__ = 'nodes'
+    __table_args__ = (
+        Index('ix_nodes_vm_id', 'vm_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -39,31 +45,53 @@ class Node(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-def get_node_by_id(node_id):
+def get_node_by_id(node_id, session=None):
     """Get a Node by ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Node).filter(Node.id == node_id).first()
     except Exception as e:
         logger.error(f"Error getting Node by ID: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def get_nodes_by_vm(vm_id):
+def get_node_with_vm(node_id, session=None):
+    """Get a Node by ID with its VM loaded by the same query."""
+    session = session or get_session()
+    try:
+        return session.query(Node).outerjoin(Node.vm).options(
+            contains_eager(Node.vm)
+        ).filter(Node.id == node_id).first()
+    except Exception as e:
+        logger.error(f"Error getting Node with VM: {str(e)}")
+        return None
+
+def get_node_owners(node_ids, session=None):
+    """Get the user ID owning each of the given Nodes, in one query."""
+    from models.vm import VM
+    
+    session = session or get_session()
+    try:
+        rows = session.query(Node.id, VM.user_id).outerjoin(Node.vm).filter(
+            Node.id.in_(node_ids)
+        ).all()
+        return {node_id: user_id for node_id, user_id in rows}
+    except Exception as e:
+        logger.error(f"Error getting Node owners: {str(e)}")
+        return None
+
+def get_nodes_by_vm(vm_id, session=None):
     """Get all Nodes for a VM."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Node).filter(Node.vm_id == vm_id).all()
     except Exception as e:
         logger.error(f"Error getting Nodes by VM: {str(e)}")
         return []
-    finally:
-        session.close()
 
-def create_node(name, vm_id, status='deploying', uptime_percentage=0.0):
+def create_node(name, vm_id, status='deploying', uptime_percentage=0.0, session=None):
     """Create a new Node."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         node = Node(
             name=name,
@@ -72,18 +100,17 @@ def create_node(name, vm_id, status='deploying', uptime_percentage=0.0):
             uptime_percentage=uptime_percentage
         )
         session.add(node)
-        session.commit()
+        save_changes(session, commit)
         return node
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating Node: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def update_node(node_id, **kwargs):
+def update_node(node_id, session=None, **kwargs):
     """Update a Node."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         node = session.query(Node).filter(Node.id == node_id).first()
         if not node:
@@ -93,29 +120,56 @@ def update_node(node_id, **kwargs):
             if hasattr(node, key):
                 setattr(node, key, value)
         
-        session.commit()
+        save_changes(session, commit)
         return node
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error updating Node: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def delete_node(node_id):
+def update_node_statuses(statuses, session=None):
+    """Update the status and uptime of many Nodes with one UPDATE per chunk."""
+    commit = session is None
+    session = session or get_session()
+    try:
+        items = list(statuses.items())
+        now = datetime.utcnow()
+        for start in range(0, len(items), BULK_UPDATE_ROWS):
+            chunk = dict(items[start:start + BULK_UPDATE_ROWS])
+            session.execute(
+                update(Node)
+                .where(Node.id.in_(chunk))
+                .values(
+                    status=case({node_id: data['status'] for node_id, data in chunk.items()}, value=Node.id),
+                    uptime_percentage=case(
+                        {node_id: data['uptime_percentage'] for node_id, data in chunk.items()},
+                        value=Node.id
+                    ),
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+        
+        save_changes(session, commit)
+        return True
+    except Exception as e:
+        discard_changes(session, commit)
+        logger.error(f"Error updating Node statuses: {str(e)}")
+        return False
+
+def delete_node(node_id, session=None):
     """Delete a Node."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         node = session.query(Node).filter(Node.id == node_id).first()
         if not node:
             return False
         
         session.delete(node)
-        session.commit()
+        save_changes(session, commit)
         return True
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error deleting Node: {str(e)}")
         return False
-    finally:
-        session.close()
@@ -2,9 +2,9 @@
 Referral model for node referrals.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
-from config.database import Base, get_session
+from config.database import Base, get_session, save_changes, discard_changes
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +12,11 @@ logger = logging.getLogger(__name__)
 class Referral(Base):
     """Referral model for node referrals."""
     __tablename__ = 'referrals'
+    __table_args__ = (
+        # A node refers another node at most once; also serves referrer lookups
+        Index('ix_referrals_referrer_referred', 'referrer_node_id', 'referred_node_id', unique=True),
+        Index('ix_referrals_referred_node_id', 'referred_node_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     referrer_node_id = Column(Integer, ForeignKey('nodes.id'))
@@ -33,42 +38,37 @@ class Referral(Base):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-def get_referral_by_id(referral_id):
+def get_referral_by_id(referral_id, session=None):
     """Get a Referral by ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Referral).filter(Referral.id == referral_id).first()
     except Exception as e:
         logger.error(f"Error getting Referral by ID: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def get_referrals_by_referrer(node_id):
+def get_referrals_by_referrer(node_id, session=None):
     """Get all Referrals where the node is the referrer."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Referral).filter(Referral.referrer_node_id == node_id).all()
     except Exception as e:
         logger.error(f"Error getting Referrals by referrer: {str(e)}")
         return []
-    finally:
-        session.close()
 
-def get_referrals_by_referred(node_id):
+def get_referrals_by_referred(node_id, session=None):
     """Get all Referrals where the node is the referred."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Referral).filter(Referral.referred_node_id == node_id).all()
     except Exception as e:
         logger.error(f"Error getting Referrals by referred: {str(e)}")
         return []
-    finally:
-        session.close()
 
-def create_referral(referrer_node_id, referred_node_id, bonus_percentage=10.0):
+def create_referral(referrer_node_id, referred_node_id, bonus_percentage=10.0, session=None):
     """Create a new Referral."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         # Check if a referral already exists
         existing_referral = session.query(Referral).filter(
@@ -90,18 +90,17 @@ def create_referral(referrer_node_id, referred_node_id, bonus_percentage=10.0):
             bonus_percentage=bonus_percentage
         )
         session.add(referral)
-        session.commit()
+        save_changes(session, commit)
         return referral
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating Referral: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def update_referral(referral_id, **kwargs):
+def update_referral(referral_id, session=None, **kwargs):
     """Update a Referral."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         referral = session.query(Referral).filter(Referral.id == referral_id).first()
         if not referral:
@@ -111,29 +110,26 @@ def update_referral(referral_id, **kwargs):
             if hasattr(referral, key):
                 setattr(referral, key, value)
         
-        session.commit()
+        save_changes(session, commit)
         return referral
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error updating Referral: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def delete_referral(referral_id):
+def delete_referral(referral_id, session=None):
     """Delete a Referral."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         referral = session.query(Referral).filter(Referral.id == referral_id).first()
         if not referral:
             return False
         
         session.delete(referral)
-        session.commit()
+        save_changes(session, commit)
         return True
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error deleting Referral: {str(e)}")
         return False
-    finally:
-        session.close()
@@ -2,16 +2,37 @@
 Reward model for node rewards.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, Date, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, Date, ForeignKey, Index, func, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship
-from config.database import Base, get_session
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config.database import Base, get_session, save_changes, discard_changes, session_factory
+from utils.pagination import keyset_filter
 import logging
 
 logger = logging.getLogger(__name__)
 
+# INSERT constructs supporting ON CONFLICT, by dialect
+UPSERT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert
+}
+
+# Rows per upsert statement; SQLite builds before 3.32 allow 999 parameters
+BULK_UPSERT_ROWS = {
+    'postgresql': 1000,
+    'sqlite': 150
+}
+
 class Reward(Base):
     """Reward model for node rewards."""
     __tablename__ = 'rewards'
+    __table_args__ = (
+        # One reward row per node and day; also serves per-node date ranges
+        Index('ix_rewards_node_id_date', 'node_id', 'date', unique=True),
+        Index('ix_rewards_date', 'date'),
+    )
     
     id = Column(Integer, primary_key=True)
     node_id = Column(Integer, ForeignKey('nodes.id'))
@@ -36,31 +57,58 @@ class Reward(Base):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-def get_reward_by_id(reward_id):
+def get_reward_by_id(reward_id, session=None):
     """Get a Reward by ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Reward).filter(Reward.id == reward_id).first()
     except Exception as e:
         logger.error(f"Error getting Reward by ID: {str(e)}")
         return None
+
+def _rewards_query(session, node_id=None):
+    """Query Rewards, optionally for one Node, in (date, id) order."""
+    query = session.query(Reward)
+    if node_id is not None:
+        query = query.filter(Reward.node_id == node_id)
+    return query.order_by(Reward.date, Reward.id)
+
+def get_rewards_page(node_id=None, limit=100, after=None, session=None):
+    """Get a page of Rewards ordered by (date, id), starting after a (date, id) key."""
+    session = session or get_session()
+    try:
+        query = _rewards_query(session, node_id)
+        if after:
+            query = query.filter(keyset_filter((Reward.date, Reward.id), after))
+        return query.limit(limit).all()
+    except Exception as e:
+        logger.error(f"Error getting Rewards page: {str(e)}")
+        return []
+
+def iter_rewards(node_id=None, batch_size=500):
+    """Yield Rewards ordered by (date, id) from a server-side cursor."""
+    session = session_factory()
+    try:
+        query = _rewards_query(session, node_id).execution_options(stream_results=True)
+        for reward in query.yield_per(batch_size):
+            yield reward
+    except Exception as e:
+        logger.error(f"Error streaming Rewards: {str(e)}")
     finally:
         session.close()
 
-def get_rewards_by_node(node_id):
+def get_rewards_by_node(node_id, session=None):
     """Get all Rewards for a Node."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Reward).filter(Reward.node_id == node_id).all()
     except Exception as e:
         logger.error(f"Error getting Rewards by Node: {str(e)}")
         return []
-    finally:
-        session.close()
 
-def get_rewards_by_date_range(node_id, start_date, end_date):
+def get_rewards_by_date_range(node_id, start_date, end_date, session=None):
     """Get Rewards for a Node within a date range."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(Reward).filter(
             Reward.node_id == node_id,
@@ -70,48 +118,159 @@ def get_rewards_by_date_range(node_id, start_date, end_date):
     except Exception as e:
         logger.error(f"Error getting Rewards by date range: {str(e)}")
         return []
-    finally:
-        session.close()
 
-def create_reward(node_id, date, poa_points=0, poc_points=0, referral_points=0):
-    """Create a new Reward."""
-    session = get_session()
+def ensure_upsert_index(bind):
+    """
+    Make sure the unique index reward upserts conflict on exists.
+
+    create_all() only indexes the tables it creates, so a rewards table from
+    before the index gets it here.
+
+    Args:
+        bind: Engine or connection of the database
+
+    Raises:
+        RuntimeError: If duplicate rewards keep the index from being built
+    """
+    inspector = inspect(bind)
+    if not inspector.has_table(Reward.__tablename__):
+        return
+
+    columns = ['node_id', 'date']
+    unique = [index['column_names'] for index in inspector.get_indexes(Reward.__tablename__) if index['unique']]
+    unique += [constraint['column_names'] for constraint in inspector.get_unique_constraints(Reward.__tablename__)]
+    if columns in unique:
+        return
+
+    index = next(index for index in Reward.__table__.indexes if index.name == 'ix_rewards_node_id_date')
     try:
-        # Check if a reward already exists for this node and date
-        existing_reward = session.query(Reward).filter(
+        index.create(bind)
+    except IntegrityError as e:
+        raise RuntimeError(
+            "Cannot create the unique index on rewards (node_id, date) because of duplicate rewards; "
+            "run migrations/add_indexes.py to merge them"
+        ) from e
+    logger.info(f"Created index {index.name} for reward upserts")
+
+def _upsert_rewards(session, rows):
+    """
+    Insert reward rows, adding their points to any existing row for the same node and date.
+
+    Requires the unique index on (node_id, date), see ensure_upsert_index().
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in UPSERT_INSERTS:
+        raise ValueError(f"Reward upserts are not supported on {dialect}")
+    
+    table = Reward.__table__
+    chunk_size = BULK_UPSERT_ROWS[dialect]
+    for i in range(0, len(rows), chunk_size):
+        statement = UPSERT_INSERTS[dialect](table).values(rows[i:i + chunk_size])
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.node_id, table.c.date],
+            set_={
+                'poa_points': table.c.poa_points + statement.excluded.poa_points,
+                'poc_points': table.c.poc_points + statement.excluded.poc_points,
+                'referral_points': table.c.referral_points + statement.excluded.referral_points
+            }
+        )
+        session.execute(statement)
+
+def create_reward(node_id, date, poa_points=0, poc_points=0, referral_points=0, session=None):
+    """Create a new Reward, or add the points to the Reward of the Node for that date."""
+    commit = session is None
+    session = session or get_session()
+    try:
+        # A single atomic upsert, so concurrent increments are never lost
+        _upsert_rewards(session, [{
+            'node_id': node_id,
+            'date': date,
+            'poa_points': poa_points,
+            'poc_points': poc_points,
+            'referral_points': referral_points,
+            'created_at': datetime.utcnow()
+        }])
+        save_changes(session, commit)
+        
+        # The row may already be in the session with its old points
+        return session.query(Reward).populate_existing().filter(
             Reward.node_id == node_id,
             Reward.date == date
         ).first()
-        
-        if existing_reward:
-            # Update existing reward
-            existing_reward.poa_points += poa_points
-            existing_reward.poc_points += poc_points
-            existing_reward.referral_points += referral_points
-            session.commit()
-            return existing_reward
-        
-        # Create new reward
-        reward = Reward(
-            node_id=node_id,
-            date=date,
-            poa_points=poa_points,
-            poc_points=poc_points,
-            referral_points=referral_points
-        )
-        session.add(reward)
-        session.commit()
-        return reward
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating Reward: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def update_reward(reward_id, **kwargs):
+def create_rewards_bulk(rewards, session=None):
+    """Add many reward increments in one transaction.
+    
+    ``rewards`` is an iterable of dicts with ``node_id``, ``date`` and any of
+    ``poa_points``, ``poc_points`` and ``referral_points``. Increments for the
+    same node and date are combined first. Returns the number of node days
+    written, or None on error.
+    """
+    # Combine increments per node and date; ON CONFLICT cannot touch a row twice
+    totals = {}
+    for reward in rewards:
+        key = (reward['node_id'], reward['date'])
+        points = totals.setdefault(key, [0, 0, 0])
+        points[0] += reward.get('poa_points', 0)
+        points[1] += reward.get('poc_points', 0)
+        points[2] += reward.get('referral_points', 0)
+    
+    if not totals:
+        return 0
+    
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            'node_id': node_id,
+            'date': date,
+            'poa_points': poa_points,
+            'poc_points': poc_points,
+            'referral_points': referral_points,
+            'created_at': created_at
+        }
+        for (node_id, date), (poa_points, poc_points, referral_points) in totals.items()
+    ]
+    
+    commit = session is None
+    session = session or get_session()
+    try:
+        _upsert_rewards(session, rows)
+        save_changes(session, commit)
+        return len(rows)
+    except Exception as e:
+        discard_changes(session, commit)
+        logger.error(f"Error creating Rewards in bulk: {str(e)}")
+        return None
+
+def get_reward_stats(session=None):
+    """Get reward totals and the number of rewarded Nodes."""
+    session = session or get_session()
+    try:
+        poa_points, poc_points, referral_points, nodes_count = session.query(
+            func.coalesce(func.sum(Reward.poa_points), 0),
+            func.coalesce(func.sum(Reward.poc_points), 0),
+            func.coalesce(func.sum(Reward.referral_points), 0),
+            func.count(func.distinct(Reward.node_id))
+        ).one()
+        
+        return {
+            'total_poa_points': poa_points,
+            'total_poc_points': poc_points,
+            'total_referral_points': referral_points,
+            'nodes_count': nodes_count
+        }
+    except Exception as e:
+        logger.error(f"Error getting Reward stats: {str(e)}")
+        return None
+
+def update_reward(reward_id, session=None, **kwargs):
     """Update a Reward."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         reward = session.query(Reward).filter(Reward.id == reward_id).first()
         if not reward:
@@ -121,29 +280,26 @@ def update_reward(reward_id, **kwargs):
             if hasattr(reward, key):
                 setattr(reward, key, value)
         
-        session.commit()
+        save_changes(session, commit)
         return reward
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error updating Reward: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def delete_reward(reward_id):
+def delete_reward(reward_id, session=None):
     """Delete a Reward."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         reward = session.query(Reward).filter(Reward.id == reward_id).first()
         if not reward:
             return False
         
         session.delete(reward)
-        session.commit()
+        save_changes(session, commit)
         return True
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error deleting Reward: {str(e)}")
         return False
-    finally:
-        session.close()
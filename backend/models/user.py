@@ -4,8 +4,8 @@ User model for authentication.
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
 from sqlalchemy.orm import relationship
-from passlib.hash import pbkdf2_sha256
-from config.database import Base, get_session
+from config.database import Base, get_session, save_changes, discard_changes
+from utils.password import hash_password, verify_password as verify_password_hash
 import logging
 import pyotp
 import base64
@@ -48,11 +48,14 @@ class User(Base):
 
     def set_password(self, password):
         """Set the user's password."""
-        self.password_hash = pbkdf2_sha256.hash(password)
+        self.password_hash = hash_password(password)
 
     def verify_password(self, password):
-        """Verify the user's password."""
-        return pbkdf2_sha256.verify(password, self.password_hash)
+        """Verify the user's password, upgrading its hash if it uses outdated parameters."""
+        valid, new_hash = verify_password_hash(password, self.password_hash)
+        if valid and new_hash:
+            self.password_hash = new_hash
+        return valid
 
     def to_dict(self):
         """Convert user to dictionary."""
@@ -130,31 +133,45 @@ class User(Base):
         except json.JSONDecodeError:
             return False
 
-def get_user_by_username(username):
+def get_user_by_username(username, session=None):
     """Get a user by username."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(User).filter(User.username == username).first()
     except Exception as e:
         logger.error(f"Error getting user by username: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def get_user_by_id(user_id):
+def get_user_by_id(user_id, session=None):
     """Get a user by ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(User).filter(User.id == user_id).first()
     except Exception as e:
         logger.error(f"Error getting user by ID: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def create_user(username, email, password, role='user', name=None, bio=None):
+def check_password(user, password, session=None):
+    """Verify a user's password and save its hash if it was upgraded."""
+    commit = session is None
+    session = session or get_session()
+    password_hash = user.password_hash
+    if not user.verify_password(password):
+        return False
+
+    if user.password_hash != password_hash:
+        try:
+            save_changes(session, commit)
+            logger.info(f"Rehashed password for user: {user.username}")
+        except Exception as e:
+            discard_changes(session, commit)
+            logger.error(f"Error rehashing password: {str(e)}")
+    return True
+
+def create_user(username, email, password, role='user', name=None, bio=None, session=None):
     """Create a new user."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         # Check if username already exists
         if session.query(User).filter(User.username == username).first():
@@ -163,18 +180,17 @@ def create_user(username, email, password, role='user', name=None, bio=None):
         # Create new user
         user = User(username, email, password, role, name, bio)
         session.add(user)
-        session.commit()
+        save_changes(session, commit)
         return user
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating user: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def create_admin_user():
+def create_admin_user(session=None):
     """Create a default admin user if it doesn't exist."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         # Check if admin user already exists
         admin = session.query(User).filter(User.username == 'admin').first()
@@ -188,10 +204,8 @@ def create_admin_user():
                 name='Admin User'
             )
             session.add(admin)
-            session.commit()
+            save_changes(session, commit)
             logger.info("Default admin user created")
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating admin user: {str(e)}")
-    finally:
-        session.close()
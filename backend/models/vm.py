@@ -2,9 +2,10 @@
 VM model for cloud virtual machines.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
-from config.database import Base, get_session
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, joinedload
+from config.database import Base, get_session, save_changes, discard_changes, session_factory
+from utils.pagination import keyset_filter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +13,9 @@ logger = logging.getLogger(__name__)
 class VM(Base):
     """VM model for cloud virtual machines."""
     __tablename__ = 'vms'
+    __table_args__ = (
+        Index('ix_vms_user_id', 'user_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -45,42 +49,72 @@ class VM(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-def get_vm_by_id(vm_id):
+def get_vm_by_id(vm_id, session=None):
     """Get a VM by ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(VM).filter(VM.id == vm_id).first()
     except Exception as e:
         logger.error(f"Error getting VM by ID: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def get_vm_by_provider_id(provider_id):
+def get_vm_by_provider_id(provider_id, session=None):
     """Get a VM by provider ID."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(VM).filter(VM.vm_id == provider_id).first()
     except Exception as e:
         logger.error(f"Error getting VM by provider ID: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def get_vms_by_user(user_id):
+def get_vms_by_user(user_id, session=None):
     """Get all VMs for a user."""
-    session = get_session()
+    session = session or get_session()
     try:
         return session.query(VM).filter(VM.user_id == user_id).all()
     except Exception as e:
         logger.error(f"Error getting VMs by user: {str(e)}")
         return []
+
+def get_vms_with_nodes_by_user(user_id, session=None):
+    """Get all VMs for a user with their Nodes loaded by the same query."""
+    session = session or get_session()
+    try:
+        return session.query(VM).options(
+            joinedload(VM.nodes)
+        ).filter(VM.user_id == user_id).order_by(VM.id).all()
+    except Exception as e:
+        logger.error(f"Error getting VMs with Nodes by user: {str(e)}")
+        return []
+
+def get_vms_page(user_id, limit=100, after=None, session=None):
+    """Get a page of VMs for a user ordered by ID, starting after an (id,) key."""
+    session = session or get_session()
+    try:
+        query = session.query(VM).filter(VM.user_id == user_id)
+        if after:
+            query = query.filter(keyset_filter((VM.id,), after))
+        return query.order_by(VM.id).limit(limit).all()
+    except Exception as e:
+        logger.error(f"Error getting VMs page: {str(e)}")
+        return []
+
+def iter_vms_by_user(user_id, batch_size=500):
+    """Yield the VMs of a user ordered by ID from a server-side cursor."""
+    session = session_factory()
+    try:
+        query = session.query(VM).filter(VM.user_id == user_id).order_by(VM.id)
+        for vm in query.execution_options(stream_results=True).yield_per(batch_size):
+            yield vm
+    except Exception as e:
+        logger.error(f"Error streaming VMs: {str(e)}")
     finally:
         session.close()
 
-def create_vm(name, provider, region, instance_type, user_id, vm_id=None, ip_address=None, status='provisioning'):
+def create_vm(name, provider, region, instance_type, user_id, vm_id=None, ip_address=None, status='provisioning', session=None):
     """Create a new VM."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         vm = VM(
             name=name,
@@ -93,18 +127,17 @@ def create_vm(name, provider, region, instance_type, user_id, vm_id=None, ip_add
             user_id=user_id
         )
         session.add(vm)
-        session.commit()
+        save_changes(session, commit)
         return vm
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error creating VM: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def update_vm(vm_id, **kwargs):
+def update_vm(vm_id, session=None, **kwargs):
     """Update a VM."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         vm = session.query(VM).filter(VM.id == vm_id).first()
         if not vm:
@@ -114,29 +147,26 @@ def update_vm(vm_id, **kwargs):
             if hasattr(vm, key):
                 setattr(vm, key, value)
         
-        session.commit()
+        save_changes(session, commit)
         return vm
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error updating VM: {str(e)}")
         return None
-    finally:
-        session.close()
 
-def delete_vm(vm_id):
+def delete_vm(vm_id, session=None):
     """Delete a VM."""
-    session = get_session()
+    commit = session is None
+    session = session or get_session()
     try:
         vm = session.query(VM).filter(VM.id == vm_id).first()
         if not vm:
             return False
         
         session.delete(vm)
-        session.commit()
+        save_changes(session, commit)
         return True
     except Exception as e:
-        session.rollback()
+        discard_changes(session, commit)
         logger.error(f"Error deleting VM: {str(e)}")
         return False
-    finally:
-        session.close()
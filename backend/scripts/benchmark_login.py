@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark of login password verification throughput.
+
+Verifies a password through the password hash pool from many concurrent
+callers, once for each number of PBKDF2 rounds, and reports verifications per
+second, latency percentiles and how many verifications were shed. Use it to
+choose PASSWORD_HASH_ROUNDS, PASSWORD_HASH_WORKERS and PASSWORD_HASH_QUEUE.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import Histogram
+from utils.password import HashPool, HashPoolBusy, create_context
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def benchmark(rounds, logins, concurrency, workers, max_pending):
+    """
+    Verify a password concurrently with a given number of rounds.
+
+    Args:
+        rounds (int): PBKDF2 rounds of the password hash
+        logins (int): Number of verifications
+        concurrency (int): Number of concurrent callers
+        workers (int): Threads of the hash pool
+        max_pending (int): Pending verifications accepted by the hash pool
+
+    Returns:
+        dict: Rounds, throughput, latency percentiles and verifications shed
+    """
+    context = create_context(rounds)
+    password_hash = context.hash('Password123!')
+    pool = HashPool(workers, max_pending)
+    latency = Histogram()
+
+    def login(_):
+        started = time.perf_counter()
+        try:
+            pool.run(context.verify_and_update, 'Password123!', password_hash)
+        except HashPoolBusy:
+            return
+        latency.observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as callers:
+        list(callers.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stats = latency.snapshot()
+    return {
+        'rounds': rounds,
+        'logins_per_second': stats['count'] / elapsed,
+        'p50_ms': stats['p50'] * 1000,
+        'p95_ms': stats['p95'] * 1000,
+        'p99_ms': stats['p99'] * 1000,
+        'shed': pool.stats()['shed']
+    }
+
+def main():
+    """Run the benchmark for each number of rounds."""
+    parser = argparse.ArgumentParser(description='Benchmark login throughput against PBKDF2 rounds')
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10000, 29000, 100000, 300000], help='PBKDF2 rounds to benchmark')
+    parser.add_argument('--logins', type=int, default=200, help='Number of verifications per run')
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of concurrent callers')
+    parser.add_argument('--workers', type=int, default=4, help='Threads of the hash pool')
+    parser.add_argument('--max-pending', type=int, default=32, help='Pending verifications accepted by the hash pool')
+    args = parser.parse_args()
+
+    print(f"{'rounds':>8} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'shed':>6}")
+    for rounds in args.rounds:
+        result = benchmark(rounds, args.logins, args.concurrency, args.workers, args.max_pending)
+        print(f"{result['rounds']:>8} {result['logins_per_second']:>10.1f} {result['p50_ms']:>9.1f} "
+              f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['shed']:>6}")
+
+if __name__ == '__main__':
+    main()
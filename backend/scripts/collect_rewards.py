@@ -11,6 +11,9 @@ import logging
 import argparse
 import requests
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
 
 # Configure logging
@@ -24,6 +27,128 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Collection defaults
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DEADLINE = 600
+DEFAULT_TIMEOUT = (5, 30)
+
+# Days after which the rewards of a day are assumed final in incremental mode
+DEFAULT_FINALIZE_AFTER = 2
+
+# Apply the change of each reward row to its day in daily_rewards, so the
+# daily totals cost O(changed rows) instead of a rescan of every day
+DAILY_ROLLUP_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS rewards_rollup_insert AFTER INSERT ON rewards
+    BEGIN
+        INSERT INTO daily_rewards
+        (date, poa_points, poc_points, referral_points, total_points, created_at)
+        VALUES (NEW.date, NEW.poa_points, NEW.poc_points, NEW.referral_points, NEW.total_points, NEW.created_at)
+        ON CONFLICT (date) DO UPDATE SET
+            poa_points = poa_points + excluded.poa_points,
+            poc_points = poc_points + excluded.poc_points,
+            referral_points = referral_points + excluded.referral_points,
+            total_points = total_points + excluded.total_points,
+            created_at = excluded.created_at;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rewards_rollup_update
+    AFTER UPDATE OF date, poa_points, poc_points, referral_points, total_points ON rewards
+    BEGIN
+        UPDATE daily_rewards SET
+            poa_points = poa_points - OLD.poa_points,
+            poc_points = poc_points - OLD.poc_points,
+            referral_points = referral_points - OLD.referral_points,
+            total_points = total_points - OLD.total_points
+        WHERE date = OLD.date;
+    
+        INSERT INTO daily_rewards
+        (date, poa_points, poc_points, referral_points, total_points, created_at)
+        VALUES (NEW.date, NEW.poa_points, NEW.poc_points, NEW.referral_points, NEW.total_points, NEW.created_at)
+        ON CONFLICT (date) DO UPDATE SET
+            poa_points = poa_points + excluded.poa_points,
+            poc_points = poc_points + excluded.poc_points,
+            referral_points = referral_points + excluded.referral_points,
+            total_points = total_points + excluded.total_points,
+            created_at = excluded.created_at;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rewards_rollup_delete AFTER DELETE ON rewards
+    BEGIN
+        UPDATE daily_rewards SET
+            poa_points = poa_points - OLD.poa_points,
+            poc_points = poc_points - OLD.poc_points,
+            referral_points = referral_points - OLD.referral_points,
+            total_points = total_points - OLD.total_points
+        WHERE date = OLD.date;
+    END
+    ''',
+)
+
+def time_left(stop_at, timeout):
+    """Get a timeout cut short so that work started now ends by the deadline."""
+    if stop_at is None:
+        return timeout
+    left = max(0.1, stop_at - time.monotonic())
+    if isinstance(timeout, tuple):
+        return tuple(min(part, left) for part in timeout)
+    return min(timeout, left)
+
+class DeadlineRetry(Retry):
+    """Retry policy that neither sleeps past nor retries after a deadline."""
+    
+    def __init__(self, *args, stop_at=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_at = stop_at
+    
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.stop_at = self.stop_at
+        return retry
+    
+    def is_exhausted(self):
+        if self.stop_at is not None and time.monotonic() >= self.stop_at:
+            return True
+        return super().is_exhausted()
+    
+    def sleep(self, response=None):
+        # A long Retry-After or backoff only waits for what is left of the run
+        if self.stop_at is None:
+            return super().sleep(response)
+        
+        delay = self.get_backoff_time()
+        if self.respect_retry_after_header and response:
+            delay = self.get_retry_after(response) or delay
+        time.sleep(max(0, min(delay, self.stop_at - time.monotonic())))
+
+def create_api_session(api_key, pool_size=DEFAULT_CONCURRENCY, retries=3, backoff_factor=0.5, stop_at=None):
+    """Create a pooled API session that retries rate-limited and failed requests.
+    
+    Retries stop at ``stop_at``, a time.monotonic() deadline, and the waits
+    between them, including the ones asked for by Retry-After, are cut short
+    to end by it.
+    """
+    retry = DeadlineRetry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        stop_at=stop_at
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    })
+    return session
+
 def load_nodes(nodes_file):
     """Load nodes from a JSON file."""
     try:
@@ -35,10 +160,25 @@ def load_nodes(nodes_file):
         logger.error(f"Error loading nodes from {nodes_file}: {str(e)}")
         return []
 
-def initialize_database(db_file):
+def connect_database(db_file):
+    """Open the rewards database in WAL mode."""
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def rewards_unique_indexes(cursor):
+    """Get the names of the unique indexes on exactly (node_id, date) of the rewards table."""
+    names = []
+    for _, name, unique, *_ in cursor.execute("PRAGMA index_list(rewards)").fetchall():
+        columns = [row[2] for row in cursor.execute(f"PRAGMA index_info('{name}')").fetchall()]
+        if unique and columns == ['node_id', 'date']:
+            names.append(name)
+    return names
+
+def initialize_database(conn):
     """Initialize the rewards database."""
     try:
-        conn = sqlite3.connect(db_file)
         cursor = conn.cursor()
         
         # Create rewards table if it doesn't exist
@@ -55,6 +195,18 @@ def initialize_database(db_file):
         )
         ''')
         
+        # The upserts need one unique index on (node_id, date). Tables without
+        # one get it, keeping the most recent row of any duplicates; tables
+        # created with an inline UNIQUE constraint already have one.
+        if not rewards_unique_indexes(cursor):
+            cursor.execute('''
+            DELETE FROM rewards
+            WHERE id NOT IN (SELECT MAX(id) FROM rewards GROUP BY node_id, date)
+            ''')
+            cursor.execute(
+                "CREATE UNIQUE INDEX idx_rewards_node_date ON rewards (node_id, date)"
+            )
+        
         # Create daily_rewards table if it doesn't exist
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS daily_rewards (
@@ -69,24 +221,37 @@ def initialize_database(db_file):
         )
         ''')
         
+        # Create collection_watermarks table if it doesn't exist
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS collection_watermarks (
+            node_id TEXT PRIMARY KEY,
+            finalized_through TEXT,
+            last_fetched_at TEXT NOT NULL
+        )
+        ''')
+        
+        # Keep daily_rewards up to date as rewards change. Databases that
+        # predate the triggers get their daily totals rebuilt once.
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'rewards_rollup_insert'"
+        )
+        if not cursor.fetchone():
+            for trigger in DAILY_ROLLUP_TRIGGERS:
+                cursor.execute(trigger)
+            rebuild_daily_rewards(conn)
+        
         conn.commit()
-        conn.close()
         
-        logger.info(f"Database initialized: {db_file}")
+        logger.info("Database initialized")
         return True
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error initializing database: {str(e)}")
         return False
 
-def get_rewards_from_api(api_url, api_key, node_id, start_date, end_date):
-    """Get rewards from the Gradient Network API."""
+def get_rewards_from_api(session, api_url, node_id, start_date, end_date, timeout=DEFAULT_TIMEOUT, stop_at=None):
+    """Get rewards from the Gradient Network API, giving up by ``stop_at``."""
     try:
-        # Set up API request
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
         params = {
             "node_id": node_id,
             "start_date": start_date.strftime("%Y-%m-%d"),
@@ -94,7 +259,7 @@ def get_rewards_from_api(api_url, api_key, node_id, start_date, end_date):
         }
         
         # Make API request
-        response = requests.get(f"{api_url}/rewards", headers=headers, params=params)
+        response = session.get(f"{api_url}/rewards", params=params, timeout=time_left(stop_at, timeout))
         
         if response.status_code == 200:
             rewards = response.json()
@@ -107,177 +272,177 @@ def get_rewards_from_api(api_url, api_key, node_id, start_date, end_date):
         logger.error(f"Error getting rewards for node {node_id}: {str(e)}")
         return None
 
-def store_rewards(db_file, node_id, rewards):
-    """Store rewards in the database."""
+def store_rewards(conn, node_id, rewards):
+    """Upsert the rewards of a node in the current transaction."""
     try:
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        
-        # Store each reward
-        for reward in rewards:
-            # Check if reward already exists
-            cursor.execute(
-                "SELECT id FROM rewards WHERE node_id = ? AND date = ?",
-                (node_id, reward['date'])
-            )
-            existing_reward = cursor.fetchone()
-            
-            if existing_reward:
-                # Update existing reward
-                cursor.execute(
-                    """
-                    UPDATE rewards
-                    SET poa_points = ?, poc_points = ?, referral_points = ?, total_points = ?, created_at = ?
-                    WHERE node_id = ? AND date = ?
-                    """,
-                    (
-                        reward['poa_points'],
-                        reward['poc_points'],
-                        reward['referral_points'],
-                        reward['total_points'],
-                        datetime.now().isoformat(),
-                        node_id,
-                        reward['date']
-                    )
-                )
-            else:
-                # Insert new reward
-                cursor.execute(
-                    """
-                    INSERT INTO rewards
-                    (node_id, date, poa_points, poc_points, referral_points, total_points, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        node_id,
-                        reward['date'],
-                        reward['poa_points'],
-                        reward['poc_points'],
-                        reward['referral_points'],
-                        reward['total_points'],
-                        datetime.now().isoformat()
-                    )
-                )
-        
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Stored {len(rewards)} rewards for node {node_id}")
-        return True
-    except Exception as e:
-        logger.error(f"Error storing rewards for node {node_id}: {str(e)}")
-        return False
-
-def update_daily_rewards(db_file, date):
-    """Update daily rewards for a specific date."""
-    try:
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        
-        # Calculate daily rewards
-        cursor.execute(
+        created_at = datetime.now().isoformat()
+        cursor = conn.executemany(
             """
-            SELECT
-                SUM(poa_points) as poa_points,
-                SUM(poc_points) as poc_points,
-                SUM(referral_points) as referral_points,
-                SUM(total_points) as total_points
-            FROM rewards
-            WHERE date = ?
+            INSERT INTO rewards
+            (node_id, date, poa_points, poc_points, referral_points, total_points, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (node_id, date) DO UPDATE SET
+                poa_points = excluded.poa_points,
+                poc_points = excluded.poc_points,
+                referral_points = excluded.referral_points,
+                total_points = excluded.total_points,
+                created_at = excluded.created_at
+            WHERE rewards.poa_points IS NOT excluded.poa_points
+                OR rewards.poc_points IS NOT excluded.poc_points
+                OR rewards.referral_points IS NOT excluded.referral_points
+                OR rewards.total_points IS NOT excluded.total_points
             """,
-            (date.strftime("%Y-%m-%d"),)
-        )
-        
-        daily_rewards = cursor.fetchone()
-        
-        if daily_rewards and daily_rewards[0] is not None:
-            # Check if daily reward already exists
-            cursor.execute(
-                "SELECT id FROM daily_rewards WHERE date = ?",
-                (date.strftime("%Y-%m-%d"),)
-            )
-            existing_daily_reward = cursor.fetchone()
-            
-            if existing_daily_reward:
-                # Update existing daily reward
-                cursor.execute(
-                    """
-                    UPDATE daily_rewards
-                    SET poa_points = ?, poc_points = ?, referral_points = ?, total_points = ?, created_at = ?
-                    WHERE date = ?
-                    """,
-                    (
-                        daily_rewards[0],
-                        daily_rewards[1],
-                        daily_rewards[2],
-                        daily_rewards[3],
-                        datetime.now().isoformat(),
-                        date.strftime("%Y-%m-%d")
-                    )
+            [
+                (
+                    node_id,
+                    reward['date'],
+                    reward['poa_points'],
+                    reward['poc_points'],
+                    reward['referral_points'],
+                    reward['total_points'],
+                    created_at
                 )
-            else:
-                # Insert new daily reward
-                cursor.execute(
-                    """
-                    INSERT INTO daily_rewards
-                    (date, poa_points, poc_points, referral_points, total_points, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        date.strftime("%Y-%m-%d"),
-                        daily_rewards[0],
-                        daily_rewards[1],
-                        daily_rewards[2],
-                        daily_rewards[3],
-                        datetime.now().isoformat()
-                    )
-                )
-            
-            conn.commit()
-            logger.info(f"Updated daily rewards for {date.strftime('%Y-%m-%d')}")
+                for reward in rewards
+            ]
+        )
         
-        conn.close()
+        # Rows whose points did not change are left untouched
+        logger.info(f"Stored {cursor.rowcount} of {len(rewards)} rewards for node {node_id}")
         return True
     except Exception as e:
-        logger.error(f"Error updating daily rewards for {date.strftime('%Y-%m-%d')}: {str(e)}")
+        logger.error(f"Error storing rewards for node {node_id}: {str(e)}")
         return False
 
-def collect_rewards(nodes_file, db_file, api_url, api_key, days=7):
-    """Collect rewards for all nodes."""
+def load_watermarks(conn):
+    """Load the last finalized reward date of each node."""
+    cursor = conn.execute("SELECT node_id, finalized_through FROM collection_watermarks")
+    return {
+        node_id: datetime.strptime(finalized_through, "%Y-%m-%d").date()
+        for node_id, finalized_through in cursor
+        if finalized_through
+    }
+
+def update_watermark(conn, node_id, finalized_through):
+    """Record that the rewards of a node are final through a date."""
+    conn.execute(
+        """
+        INSERT INTO collection_watermarks (node_id, finalized_through, last_fetched_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT (node_id) DO UPDATE SET
+            finalized_through = MAX(COALESCE(finalized_through, ''), excluded.finalized_through),
+            last_fetched_at = excluded.last_fetched_at
+        """,
+        (node_id, finalized_through.strftime("%Y-%m-%d"), datetime.now().isoformat())
+    )
+
+def rebuild_daily_rewards(conn):
+    """Recompute daily_rewards from the rewards table."""
+    conn.execute("DELETE FROM daily_rewards")
+    conn.execute(
+        """
+        INSERT INTO daily_rewards
+        (date, poa_points, poc_points, referral_points, total_points, created_at)
+        SELECT date, SUM(poa_points), SUM(poc_points), SUM(referral_points), SUM(total_points), ?
+        FROM rewards
+        GROUP BY date
+        """,
+        (datetime.now().isoformat(),)
+    )
+    logger.info("Rebuilt daily rewards")
+
+def collect_rewards(nodes_file, db_file, api_url, api_key, days=7,
+                    concurrency=DEFAULT_CONCURRENCY, deadline=DEFAULT_DEADLINE,
+                    incremental=False, finalize_after=DEFAULT_FINALIZE_AFTER):
+    """Collect rewards for all nodes.
+    
+    Rewards are fetched concurrently by ``concurrency`` workers sharing one
+    pooled API session and stored as each fetch completes. Fetches still
+    pending after ``deadline`` seconds are abandoned until the next run;
+    request timeouts, retries and their waits are all cut short to end by
+    then, so abandoned workers don't linger past it. The whole run is written over one connection in one transaction.
+    
+    In ``incremental`` mode each node is only asked for the days after its
+    watermark, the last day older than ``finalize_after`` days that was
+    fetched successfully, so days that are already final are not re-fetched.
+    """
     start_time = datetime.now()
     logger.info(f"Starting reward collection at {start_time}")
     
-    # Initialize database
-    if not initialize_database(db_file):
-        logger.error("Failed to initialize database")
-        return
-    
     # Load nodes
     nodes = load_nodes(nodes_file)
     if not nodes:
         logger.error(f"No nodes found in {nodes_file}")
         return
     
+    # Initialize database
+    conn = connect_database(db_file)
+    if not initialize_database(conn):
+        logger.error("Failed to initialize database")
+        conn.close()
+        return
+    
     # Set date range
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=days)
+    finalized_through = end_date - timedelta(days=finalize_after)
+    watermarks = load_watermarks(conn) if incremental else {}
     
-    # Collect rewards for each node
-    for node in nodes:
-        logger.info(f"Collecting rewards for node {node['name']} ({node['id']})")
+    stop_at = time.monotonic() + deadline
+    session = create_api_session(api_key, concurrency, stop_at=stop_at)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    
+    try:
+        # Fetch rewards for all nodes, starting after each node's watermark
+        pending = {}
+        for node in nodes:
+            node_start_date = start_date
+            watermark = watermarks.get(node['id'])
+            if watermark:
+                node_start_date = max(start_date, watermark + timedelta(days=1))
+            if node_start_date > end_date:
+                logger.info(f"Rewards for node {node['name']} ({node['id']}) are final, skipping")
+                continue
+            
+            logger.info(f"Collecting rewards for node {node['name']} ({node['id']}) from {node_start_date}")
+            future = executor.submit(
+                get_rewards_from_api, session, api_url, node['id'], node_start_date, end_date, stop_at=stop_at
+            )
+            pending[future] = node
         
-        # Get rewards from API
-        rewards = get_rewards_from_api(api_url, api_key, node['id'], start_date, end_date)
+        # Store rewards as they arrive
+        while pending:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                rewards = future.result()
+                if rewards is None:
+                    continue
+                
+                if rewards and not store_rewards(conn, node['id'], rewards):
+                    continue
+                
+                # Only move the watermark once the fetched days are stored
+                update_watermark(conn, node['id'], finalized_through)
         
-        if rewards:
-            # Store rewards in database
-            store_rewards(db_file, node['id'], rewards)
+        for node in pending.values():
+            logger.warning(f"Collection deadline reached before rewards for node {node['name']} ({node['id']}) were fetched")
+    finally:
+        # Don't wait on requests that overran the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
     
-    # Update daily rewards for each day in the date range
-    current_date = start_date
-    while current_date <= end_date:
-        update_daily_rewards(db_file, current_date)
-        current_date += timedelta(days=1)
+    try:
+        # daily_rewards was kept up to date by the rollup triggers
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error committing rewards: {str(e)}")
+    finally:
+        conn.close()
     
     end_time = datetime.now()
     duration = end_time - start_time
@@ -287,9 +452,35 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Collect reward data from the Gradient Network")
     parser.add_argument("--nodes-file", default="nodes.json", help="Path to nodes JSON file")
     parser.add_argument("--db-file", default="rewards.db", help="Path to rewards database file")
-    parser.add_argument("--api-url", required=True, help="Gradient Network API URL")
-    parser.add_argument("--api-key", required=True, help="Gradient Network API key")
+    parser.add_argument("--api-url", help="Gradient Network API URL, required to collect rewards")
+    parser.add_argument("--api-key", help="Gradient Network API key, required to collect rewards")
     parser.add_argument("--days", type=int, default=7, help="Number of days to collect rewards for")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of concurrent API requests")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE, help="Maximum duration of a collection run in seconds")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch rewards for days that are not final yet")
+    parser.add_argument("--finalize-after", type=int, default=DEFAULT_FINALIZE_AFTER, help="Number of days after which rewards are considered final")
+    parser.add_argument("--rebuild-daily", action="store_true", help="Recompute daily rewards from all stored rewards and exit")
     args = parser.parse_args()
     
-    collect_rewards(args.nodes_file, args.db_file, args.api_url, args.api_key, args.days)
+    if args.rebuild_daily:
+        conn = connect_database(args.db_file)
+        if initialize_database(conn):
+            rebuild_daily_rewards(conn)
+            conn.commit()
+        conn.close()
+        sys.exit(0)
+    
+    if not args.api_url or not args.api_key:
+        parser.error("--api-url and --api-key are required to collect rewards")
+    
+    collect_rewards(
+        args.nodes_file,
+        args.db_file,
+        args.api_url,
+        args.api_key,
+        args.days,
+        concurrency=args.concurrency,
+        deadline=args.deadline,
+        incremental=args.incremental,
+        finalize_after=args.finalize_after
+    )
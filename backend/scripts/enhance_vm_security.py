@@ -8,8 +8,8 @@ import sys
 import json
 import logging
 import argparse
-import subprocess
 from datetime import datetime
+from ssh_pool import get_pool, check_ssh_connection, close_all_connections
 
 # Configure logging
 logging.basicConfig(
@@ -22,6 +22,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Seconds a remote command may take; package upgrades and installs can take minutes
+COMMAND_TIMEOUT = 900
+
 def load_nodes(nodes_file):
     """Load nodes from a JSON file."""
     try:
@@ -33,58 +36,10 @@ def load_nodes(nodes_file):
         logger.error(f"Error loading nodes from {nodes_file}: {str(e)}")
         return []
 
-def check_ssh_connection(node, username="ubuntu", key_file=None):
-    """Check if SSH connection to the node is possible."""
-    try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "ConnectTimeout=5",
-            f"{username}@{node['ip_address']}",
-            "echo 'SSH connection successful'"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            logger.info(f"SSH connection to {node['name']} ({node['ip_address']}) successful")
-            return True
-        
-        logger.warning(f"SSH connection to {node['name']} ({node['ip_address']}) failed: {result.stderr.strip()}")
-        return False
-    except Exception as e:
-        logger.warning(f"Error checking SSH connection to {node['name']} ({node['ip_address']}): {str(e)}")
-        return False
-
-def run_ssh_command(node, command, username="ubuntu", key_file=None):
+def run_ssh_command(node, command, username="ubuntu", key_file=None, timeout=COMMAND_TIMEOUT):
     """Run a command on a node via SSH."""
     try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            f"{username}@{node['ip_address']}",
-            command
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        result = get_pool(username, key_file).run(node['ip_address'], command, timeout)
         
         if result.returncode == 0:
             logger.info(f"Command executed successfully on {node['name']} ({node['ip_address']}): {command}")
@@ -100,23 +55,7 @@ def run_ssh_command(node, command, username="ubuntu", key_file=None):
 def copy_file_to_node(node, local_file, remote_file, username="ubuntu", key_file=None):
     """Copy a file to a node via SCP."""
     try:
-        scp_command = ["scp"]
-        if key_file:
-            scp_command.extend(["-i", key_file])
-        scp_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            local_file,
-            f"{username}@{node['ip_address']}:{remote_file}"
-        ])
-        
-        result = subprocess.run(
-            scp_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        result = get_pool(username, key_file).copy(node['ip_address'], local_file, remote_file, COMMAND_TIMEOUT)
         
         if result.returncode == 0:
             logger.info(f"File copied successfully to {node['name']} ({node['ip_address']}): {local_file} -> {remote_file}")
@@ -378,6 +317,9 @@ def enhance_vm_security(nodes_file, username="ubuntu", key_file=None):
         
         logger.info(f"Security enhanced for {node['name']} ({node['ip_address']})")
     
+    # Nothing reuses the connections of a one-off run
+    close_all_connections()
+    
     end_time = datetime.now()
     duration = end_time - start_time
     logger.info(f"Security enhancement completed at {end_time} (duration: {duration})")
@@ -9,8 +9,8 @@ import time
 import json
 import logging
 import argparse
-import subprocess
 from datetime import datetime
+from ssh_pool import get_pool, close_all_connections
 
 # Configure logging
 logging.basicConfig(
@@ -23,29 +23,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Seconds the setup script may take to install packages and the extension
+SETUP_TIMEOUT = 1800
+
 def check_ssh_connection(host, username="ubuntu", key_file=None, timeout=60):
     """Check if SSH connection to the host is possible."""
+    pool = get_pool(username, key_file)
     start_time = time.time()
     while time.time() - start_time < timeout:
         try:
-            ssh_command = ["ssh"]
-            if key_file:
-                ssh_command.extend(["-i", key_file])
-            ssh_command.extend([
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "UserKnownHostsFile=/dev/null",
-                "-o", "ConnectTimeout=5",
-                f"{username}@{host}",
-                "echo 'SSH connection successful'"
-            ])
-            
-            result = subprocess.run(
-                ssh_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=False
-            )
+            result = pool.run(host, "echo 'SSH connection successful'")
             
             if result.returncode == 0:
                 logger.info(f"SSH connection to {host} successful")
@@ -67,23 +54,11 @@ def copy_setup_script(host, username="ubuntu", key_file=None):
         setup_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "setup_vm.sh")
         
         # Copy the script to the VM
-        scp_command = ["scp"]
-        if key_file:
-            scp_command.extend(["-i", key_file])
-        scp_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            setup_script,
-            f"{username}@{host}:/tmp/setup_vm.sh"
-        ])
+        result = get_pool(username, key_file).copy(host, setup_script, "/tmp/setup_vm.sh")
         
-        result = subprocess.run(
-            scp_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
+        if result.returncode != 0:
+            logger.error(f"Error copying setup script: {result.stderr.strip()}")
+            return False
         
         logger.info(f"Setup script copied to {host}")
         return True
@@ -94,26 +69,10 @@ def copy_setup_script(host, username="ubuntu", key_file=None):
 def run_setup_script(host, username="ubuntu", key_file=None):
     """Run the setup script on the VM."""
     try:
-        # Run the script on the VM
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            f"{username}@{host}",
-            "sudo bash /tmp/setup_vm.sh"
-        ])
-        
         logger.info(f"Running setup script on {host}...")
         
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        # Run the script on the VM
+        result = get_pool(username, key_file).run(host, "sudo bash /tmp/setup_vm.sh", SETUP_TIMEOUT)
         
         if result.returncode == 0:
             logger.info(f"Setup script completed successfully on {host}")
@@ -129,24 +88,15 @@ def check_sentry_node_status(host, username="ubuntu", key_file=None):
     """Check the status of the Sentry Node on the VM."""
     try:
         # Check if Chromium is running
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            f"{username}@{host}",
+        result = get_pool(username, key_file).run(
+            host,
             "pgrep -f 'chromium-browser --headless' > /dev/null && echo 'running' || echo 'stopped'"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
         )
         
+        if result.returncode != 0:
+            logger.error(f"Error checking Sentry Node status: {result.stderr.strip()}")
+            return False
+        
         status = result.stdout.strip()
         logger.info(f"Sentry Node status on {host}: {status}")
         
@@ -194,4 +144,5 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     success = install_sentry_node(args.host, args.username, args.key_file)
+    close_all_connections()
     sys.exit(0 if success else 1)
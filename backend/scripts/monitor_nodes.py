@@ -7,11 +7,17 @@ import os
 import sys
 import json
 import time
+import heapq
 import logging
 import argparse
+import itertools
 import requests
-import subprocess
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from node_state import NodeStateStore
+from node_history import BitHistory
+from ssh_pool import get_pool, check_ssh_connection, evict_idle_connections
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
@@ -27,23 +33,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_nodes(nodes_file):
-    """Load nodes from a JSON file."""
-    try:
-        with open(nodes_file, 'r') as f:
-            nodes = json.load(f)
-        logger.info(f"Loaded {len(nodes)} nodes from {nodes_file}")
-        return nodes
-    except Exception as e:
-        logger.error(f"Error loading nodes from {nodes_file}: {str(e)}")
-        return []
+# Sweep defaults; the deadline keeps a sweep inside the 5-minute cron interval
+DEFAULT_CONCURRENCY = 32
+DEFAULT_SWEEP_DEADLINE = 240
+DEFAULT_RECHECK_DELAY = 10
+
+# Seconds each status request, SSH check and service restart may take
+HTTP_TIMEOUT = 10
+SSH_CHECK_TIMEOUT = 15
+RESTART_TIMEOUT = 60
+SMTP_TIMEOUT = 30
+
+# Email alerts sent at once, apart from the node checks
+ALERT_CONCURRENCY = 4
+
+# Number of checks kept in the uptime history of each node
+UPTIME_HISTORY_SIZE = 1000
 
-def check_node_status(node):
+# Outcomes of the first check of a node in a sweep
+NODE_UP = 'up'
+NODE_RESTARTED = 'restarted'
+NODE_UNREACHABLE = 'unreachable'
+
+def create_http_session(pool_size=DEFAULT_CONCURRENCY):
+    """Create an HTTP session whose connection pool is shared by all status checks."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def time_left(deadline, timeout):
+    """Get a timeout cut short so that work started now ends by the deadline."""
+    if deadline is None:
+        return timeout
+    return max(0.1, min(timeout, deadline - time.monotonic()))
+
+def check_node_status(node, session=None, timeout=HTTP_TIMEOUT):
     """Check the status of a node."""
     try:
         # Try to access the status page
         url = f"http://{node['ip_address']}/status.json"
-        response = requests.get(url, timeout=10)
+        response = (session or requests).get(url, timeout=timeout)
         
         if response.status_code == 200:
             status = response.json()
@@ -56,58 +87,10 @@ def check_node_status(node):
         logger.warning(f"Error checking node {node['name']} ({node['ip_address']}): {str(e)}")
         return None
 
-def check_ssh_connection(node, username="ubuntu", key_file=None):
-    """Check if SSH connection to the node is possible."""
-    try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "ConnectTimeout=5",
-            f"{username}@{node['ip_address']}",
-            "echo 'SSH connection successful'"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            logger.info(f"SSH connection to {node['name']} ({node['ip_address']}) successful")
-            return True
-        
-        logger.warning(f"SSH connection to {node['name']} ({node['ip_address']}) failed: {result.stderr.strip()}")
-        return False
-    except Exception as e:
-        logger.warning(f"Error checking SSH connection to {node['name']} ({node['ip_address']}): {str(e)}")
-        return False
-
-def restart_node_service(node, username="ubuntu", key_file=None):
+def restart_node_service(node, username="ubuntu", key_file=None, timeout=RESTART_TIMEOUT):
     """Restart the Sentry Node service on a node."""
     try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            f"{username}@{node['ip_address']}",
-            "sudo systemctl restart chromium"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        result = get_pool(username, key_file).run(node['ip_address'], "sudo systemctl restart chromium", timeout)
         
         if result.returncode == 0:
             logger.info(f"Restarted Sentry Node service on {node['name']} ({node['ip_address']})")
@@ -119,7 +102,8 @@ def restart_node_service(node, username="ubuntu", key_file=None):
         logger.warning(f"Error restarting Sentry Node service on {node['name']} ({node['ip_address']}): {str(e)}")
         return False
 
-def send_email_alert(node, status, smtp_server, smtp_port, smtp_username, smtp_password, from_email, to_email):
+def send_email_alert(node, status, smtp_server, smtp_port, smtp_username, smtp_password, from_email, to_email,
+                     timeout=SMTP_TIMEOUT):
     """Send an email alert for a node that is down."""
     try:
         # Create message
@@ -149,7 +133,7 @@ def send_email_alert(node, status, smtp_server, smtp_port, smtp_username, smtp_p
         msg.attach(MIMEText(body, 'html'))
         
         # Connect to SMTP server and send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=timeout)
         server.starttls()
         server.login(smtp_username, smtp_password)
         server.send_message(msg)
@@ -161,140 +145,205 @@ def send_email_alert(node, status, smtp_server, smtp_port, smtp_username, smtp_p
         logger.error(f"Error sending email alert for node {node['name']} ({node['ip_address']}): {str(e)}")
         return False
 
-def update_node_status(node, status, nodes_file):
-    """Update the status of a node in the nodes file."""
-    try:
-        # Load current nodes
-        with open(nodes_file, 'r') as f:
-            nodes = json.load(f)
-        
-        # Find the node and update its status
-        for n in nodes:
-            if n['id'] == node['id']:
-                n['status'] = 'running' if status and status.get('running', False) else 'stopped'
-                n['last_checked'] = datetime.now().isoformat()
-                n['uptime_percentage'] = calculate_uptime(n)
-                break
-        
-        # Save updated nodes
-        with open(nodes_file, 'w') as f:
-            json.dump(nodes, f, indent=2)
-        
-        logger.info(f"Updated status of node {node['name']} ({node['ip_address']}) to {n['status']}")
-        return True
-    except Exception as e:
-        logger.error(f"Error updating status of node {node['name']} ({node['ip_address']}): {str(e)}")
+def update_node_status(store, node, status):
+    """Update the status of a node in the node state store."""
+    node_status = 'running' if status and status.get('running', False) else 'stopped'
+    last_checked = datetime.now().isoformat()
+    
+    def apply(n):
+        n['status'] = node_status
+        n['last_checked'] = last_checked
+        n['uptime_percentage'] = calculate_uptime(n)
+    
+    if store.update(node['id'], apply) is None:
         return False
+    
+    logger.info(f"Updated status of node {node['name']} ({node['ip_address']}) to {node_status}")
+    return True
+
+def load_uptime_history(node):
+    """Load the uptime history of a node."""
+    return BitHistory.load(node.get('uptime_history'), UPTIME_HISTORY_SIZE, legacy=lambda status: status == 'running')
 
 def calculate_uptime(node):
     """Calculate the uptime percentage of a node."""
     try:
-        # Get the uptime history
-        uptime_history = node.get('uptime_history', [])
-        
-        # If no history, return 0
-        if not uptime_history:
-            return 0
-        
-        # Calculate uptime percentage
-        up_count = sum(1 for status in uptime_history if status == 'running')
-        total_count = len(uptime_history)
-        
-        return round((up_count / total_count) * 100, 2)
+        return load_uptime_history(node).percentage()
     except Exception as e:
         logger.error(f"Error calculating uptime for node {node['name']}: {str(e)}")
         return 0
 
-def update_uptime_history(node, status, nodes_file):
-    """Update the uptime history of a node."""
-    try:
-        # Load current nodes
-        with open(nodes_file, 'r') as f:
-            nodes = json.load(f)
+def update_uptime_history(store, node, status):
+    """Update the uptime history of a node in the node state store."""
+    node_status = 'running' if status and status.get('running', False) else 'stopped'
+    
+    def apply(n):
+        # Add current status to history (older entries are overwritten)
+        history = load_uptime_history(n)
+        history.append(node_status == 'running')
+        n['uptime_history'] = history.to_dict()
         
-        # Find the node and update its uptime history
-        for n in nodes:
-            if n['id'] == node['id']:
-                # Initialize uptime history if it doesn't exist
-                if 'uptime_history' not in n:
-                    n['uptime_history'] = []
-                
-                # Add current status to history (limit to last 1000 entries)
-                n['uptime_history'].append('running' if status and status.get('running', False) else 'stopped')
-                n['uptime_history'] = n['uptime_history'][-1000:]
-                
-                # Update uptime percentage
-                n['uptime_percentage'] = calculate_uptime(n)
-                break
+        # Update uptime percentage
+        n['uptime_percentage'] = history.percentage()
+    
+    if store.update(node['id'], apply) is None:
+        return False
+    
+    logger.info(f"Updated uptime history of node {node['name']} ({node['ip_address']})")
+    return True
+
+def check_and_recover_node(node, session, username="ubuntu", key_file=None, deadline=None):
+    """Check a node and, if it is down, try to restart its service.
+
+    Runs on a worker thread and only talks to the node; all bookkeeping is
+    left to the sweep loop so the nodes file is never written concurrently.
+    Every request is cut short at the sweep deadline, since threads still
+    running then keep the process alive.
+    """
+    logger.info(f"Checking node {node['name']} ({node['ip_address']})")
+    
+    status = check_node_status(node, session, time_left(deadline, HTTP_TIMEOUT))
+    if status and status.get('running', False):
+        return NODE_UP, status
+    
+    logger.warning(f"Node {node['name']} ({node['ip_address']}) is DOWN")
+    
+    # Check SSH connection
+    if not check_ssh_connection(node, username, key_file, time_left(deadline, SSH_CHECK_TIMEOUT)):
+        return NODE_UNREACHABLE, status
+    
+    # Try to restart the service; the recheck is scheduled by the sweep loop
+    restart_node_service(node, username, key_file, time_left(deadline, RESTART_TIMEOUT))
+    return NODE_RESTARTED, status
+
+def recheck_node(node, session, deadline=None):
+    """Check a node again after its service was restarted."""
+    return check_node_status(node, session, time_left(deadline, HTTP_TIMEOUT))
+
+def alert_node_down(node, status, smtp_config, deadline=None):
+    """Send an email alert for a node, giving up at the sweep deadline."""
+    return send_email_alert(node, status, timeout=time_left(deadline, SMTP_TIMEOUT), **smtp_config)
+
+def handle_check_result(store, node, outcome, status, send_alert=None):
+    """Record the result of the first check of a node."""
+    # Update uptime history
+    update_uptime_history(store, node, status)
+    
+    if outcome == NODE_UP:
+        logger.info(f"Node {node['name']} ({node['ip_address']}) is UP")
+        update_node_status(store, node, status)
+    elif outcome == NODE_UNREACHABLE:
+        logger.error(f"Cannot connect to node {node['name']} ({node['ip_address']}) via SSH")
+        update_node_status(store, node, None)
         
-        # Save updated nodes
-        with open(nodes_file, 'w') as f:
-            json.dump(nodes, f, indent=2)
+        # Send email alert if configured
+        if send_alert:
+            send_alert(node, None)
+
+def handle_recheck_result(store, node, status, send_alert=None):
+    """Record the result of the check that follows a restart."""
+    update_node_status(store, node, status)
+    
+    # If still down, send alert
+    if not status or not status.get('running', False):
+        logger.error(f"Node {node['name']} ({node['ip_address']}) is still DOWN after restart")
         
-        logger.info(f"Updated uptime history of node {node['name']} ({node['ip_address']})")
-        return True
-    except Exception as e:
-        logger.error(f"Error updating uptime history of node {node['name']} ({node['ip_address']}): {str(e)}")
-        return False
+        # Send email alert if configured
+        if send_alert:
+            send_alert(node, status)
 
-def monitor_nodes(nodes_file, username="ubuntu", key_file=None, smtp_config=None):
-    """Monitor all nodes and take action if any are down."""
+def monitor_nodes(nodes_file, username="ubuntu", key_file=None, smtp_config=None,
+                  concurrency=DEFAULT_CONCURRENCY, sweep_deadline=DEFAULT_SWEEP_DEADLINE,
+                  recheck_delay=DEFAULT_RECHECK_DELAY):
+    """Monitor all nodes and take action if any are down.
+    
+    Nodes are checked concurrently by a bounded worker pool sharing one HTTP
+    connection pool. Nodes that were restarted are rechecked after
+    ``recheck_delay`` seconds as a follow-up task instead of an inline sleep,
+    so a sweep takes about as long as its slowest node. Work still pending
+    after ``sweep_deadline`` seconds is abandoned until the next sweep.
+    All updates are committed to the nodes file once, at the end of the sweep.
+    """
     start_time = datetime.now()
     logger.info(f"Starting node monitoring at {start_time}")
     
     # Load nodes
-    nodes = load_nodes(nodes_file)
+    store = NodeStateStore(nodes_file)
+    nodes = store.load()
     if not nodes:
         logger.error(f"No nodes found in {nodes_file}")
         return
     
-    # Check each node
-    for node in nodes:
-        logger.info(f"Checking node {node['name']} ({node['ip_address']})")
-        
-        # Check node status
-        status = check_node_status(node)
-        
-        # Update uptime history
-        update_uptime_history(node, status, nodes_file)
+    session = create_http_session(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    deadline = time.monotonic() + sweep_deadline
+    
+    # Alerts are sent in the background, so a slow mail server can't hold up the sweep
+    alert_executor = None
+    send_alert = None
+    if smtp_config:
+        alert_executor = ThreadPoolExecutor(max_workers=ALERT_CONCURRENCY)
+        send_alert = lambda node, status: alert_executor.submit(alert_node_down, node, status, smtp_config, deadline)
+    
+    # future -> (node, is_recheck)
+    pending = {}
+    # heap of (due time, sequence, node) for rechecks after a restart
+    followups = []
+    sequence = itertools.count()
+    
+    try:
+        for node in nodes:
+            future = executor.submit(check_and_recover_node, node, session, username, key_file, deadline)
+            pending[future] = (node, False)
         
-        # If node is down, try to restart it
-        if not status or not status.get('running', False):
-            logger.warning(f"Node {node['name']} ({node['ip_address']}) is DOWN")
+        while pending or followups:
+            now = time.monotonic()
+            if now >= deadline:
+                break
             
-            # Check SSH connection
-            if check_ssh_connection(node, username, key_file):
-                # Try to restart the service
-                restart_node_service(node, username, key_file)
-                
-                # Check status again after restart
-                time.sleep(10)
-                status = check_node_status(node)
-                
-                # Update status
-                update_node_status(node, status, nodes_file)
-                
-                # If still down, send alert
-                if not status or not status.get('running', False):
-                    logger.error(f"Node {node['name']} ({node['ip_address']}) is still DOWN after restart")
-                    
-                    # Send email alert if configured
-                    if smtp_config:
-                        send_email_alert(node, status, **smtp_config)
-            else:
-                logger.error(f"Cannot connect to node {node['name']} ({node['ip_address']}) via SSH")
+            # Submit rechecks that are due
+            while followups and followups[0][0] <= now:
+                _, _, node = heapq.heappop(followups)
+                pending[executor.submit(recheck_node, node, session, deadline)] = (node, True)
+            
+            timeout = deadline - now
+            if followups:
+                timeout = min(timeout, followups[0][0] - now)
+            
+            if not pending:
+                time.sleep(timeout)
+                continue
+            
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, is_recheck = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error checking node {node['name']} ({node['ip_address']}): {str(e)}")
+                    continue
                 
-                # Update status
-                update_node_status(node, None, nodes_file)
+                if is_recheck:
+                    handle_recheck_result(store, node, result, send_alert)
+                    continue
                 
-                # Send email alert if configured
-                if smtp_config:
-                    send_email_alert(node, None, **smtp_config)
-        else:
-            logger.info(f"Node {node['name']} ({node['ip_address']}) is UP")
-            
-            # Update status
-            update_node_status(node, status, nodes_file)
+                outcome, status = result
+                handle_check_result(store, node, outcome, status, send_alert)
+                if outcome == NODE_RESTARTED:
+                    heapq.heappush(followups, (time.monotonic() + recheck_delay, next(sequence), node))
+        
+        unfinished = [node for node, _ in pending.values()] + [node for _, _, node in followups]
+        for node in unfinished:
+            logger.warning(f"Sweep deadline reached before node {node['name']} ({node['ip_address']}) was checked")
+    finally:
+        # Drop checks that never started; running ones end by the deadline on their own timeouts
+        executor.shutdown(wait=False, cancel_futures=True)
+        if alert_executor:
+            # Alerts still queued are tried, but give up at the deadline too
+            alert_executor.shutdown(wait=False)
+        session.close()
+        store.commit()
+        evict_idle_connections()
     
     end_time = datetime.now()
     duration = end_time - start_time
@@ -311,6 +360,9 @@ if __name__ == "__main__":
     parser.add_argument("--smtp-password", help="SMTP password")
     parser.add_argument("--from-email", help="From email address")
     parser.add_argument("--to-email", help="To email address")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of nodes checked at once")
+    parser.add_argument("--sweep-deadline", type=float, default=DEFAULT_SWEEP_DEADLINE, help="Maximum duration of a sweep in seconds")
+    parser.add_argument("--recheck-delay", type=float, default=DEFAULT_RECHECK_DELAY, help="Seconds to wait before rechecking a restarted node")
     args = parser.parse_args()
     
     # Set up SMTP config if email alerts are enabled
@@ -325,4 +377,12 @@ if __name__ == "__main__":
             "to_email": args.to_email
         }
     
-    monitor_nodes(args.nodes_file, args.username, args.key_file, smtp_config)
+    monitor_nodes(
+        args.nodes_file,
+        args.username,
+        args.key_file,
+        smtp_config,
+        concurrency=args.concurrency,
+        sweep_deadline=args.sweep_deadline,
+        recheck_delay=args.recheck_delay
+    )
@@ -0,0 +1,101 @@
+"""
+Fixed-size success/failure history for Gradient Sentry Nodes.
+
+Uptime checks and POC taps are stored as a ring buffer of bits with a running
+count of successes, so recording a result and reading the success rate are
+O(1). Histories are serialized to the nodes file as a base64 bitset.
+"""
+import base64
+
+class BitHistory:
+    """Ring buffer of boolean results with a running success count."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.bits = bytearray((capacity + 7) // 8)
+        self.size = 0
+        self.head = 0
+        self.ones = 0
+
+    def __len__(self):
+        return self.size
+
+    def _get(self, index):
+        return (self.bits[index >> 3] >> (index & 7)) & 1
+
+    def _set(self, index, value):
+        if value:
+            self.bits[index >> 3] |= 1 << (index & 7)
+        else:
+            self.bits[index >> 3] &= ~(1 << (index & 7))
+
+    def append(self, value):
+        """Record a result, overwriting the oldest one when full."""
+        value = 1 if value else 0
+        if self.size == self.capacity:
+            self.ones -= self._get(self.head)
+        else:
+            self.size += 1
+
+        self._set(self.head, value)
+        self.ones += value
+        self.head = (self.head + 1) % self.capacity
+
+    def percentage(self):
+        """Get the percentage of successful results."""
+        if not self.size:
+            return 0
+        return round((self.ones / self.size) * 100, 2)
+
+    def to_dict(self):
+        """Convert the history to a JSON-serializable dictionary."""
+        return {
+            'capacity': self.capacity,
+            'size': self.size,
+            'head': self.head,
+            'ones': self.ones,
+            'bits': base64.b64encode(bytes(self.bits)).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data, capacity):
+        """Restore a history serialized with ``to_dict``.
+
+        If the stored capacity differs from ``capacity``, the most recent
+        results are carried over into a history of the new size.
+        """
+        stored = cls(data['capacity'])
+        stored.bits[:] = base64.b64decode(data['bits'])
+        stored.size = data['size']
+        stored.head = data['head']
+        stored.ones = data['ones']
+
+        if stored.capacity == capacity:
+            return stored
+        return cls.from_values(stored.values(), capacity)
+
+    @classmethod
+    def from_values(cls, values, capacity):
+        """Build a history from results ordered oldest first."""
+        history = cls(capacity)
+        for value in list(values)[-capacity:]:
+            history.append(value)
+        return history
+
+    @classmethod
+    def load(cls, data, capacity, legacy=bool):
+        """Load a history stored on a node.
+
+        ``data`` may be a serialized history, ``None``, or a list in the old
+        format, whose entries are converted with ``legacy``.
+        """
+        if not data:
+            return cls(capacity)
+        if isinstance(data, list):
+            return cls.from_values((legacy(item) for item in data), capacity)
+        return cls.from_dict(data, capacity)
+
+    def values(self):
+        """Get the recorded results, oldest first."""
+        start = (self.head - self.size) % self.capacity
+        return [bool(self._get((start + i) % self.capacity)) for i in range(self.size)]
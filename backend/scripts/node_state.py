@@ -0,0 +1,123 @@
+"""
+Shared state store for the nodes file used by the node management scripts.
+
+The store loads the nodes file once and keeps every mutation made during a
+run in memory. ``commit()`` then takes an exclusive lock, re-reads the file,
+replays the mutations on top of it and atomically replaces it, so the file is
+written once per run and concurrent cron jobs don't lose each other's updates.
+"""
+import os
+import json
+import logging
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class NodeStateStore:
+    """Batched, atomically committed view of a nodes JSON file."""
+
+    def __init__(self, nodes_file):
+        self.nodes_file = nodes_file
+        self.lock_file = f"{nodes_file}.lock"
+        self.nodes = []
+        self._index = {}
+        self._mutations = []
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Hold an advisory lock on the nodes file."""
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        """Read the nodes file, treating a missing file as empty."""
+        if not os.path.exists(self.nodes_file):
+            return []
+        with open(self.nodes_file, 'r') as f:
+            return json.load(f)
+
+    def load(self):
+        """Load nodes from the nodes file."""
+        try:
+            with self._locked(exclusive=False):
+                self.nodes = self._read()
+            logger.info(f"Loaded {len(self.nodes)} nodes from {self.nodes_file}")
+        except Exception as e:
+            logger.error(f"Error loading nodes from {self.nodes_file}: {str(e)}")
+            self.nodes = []
+
+        self._index = {node['id']: node for node in self.nodes}
+        self._mutations = []
+        return self.nodes
+
+    def get(self, node_id):
+        """Get the current state of a node."""
+        return self._index.get(node_id)
+
+    def update(self, node_id, mutator):
+        """Apply ``mutator(node)`` to a node now and again at commit time.
+
+        The mutator is replayed against a fresh copy of the file when the
+        store is committed, so it must only depend on the node it is given
+        and on values captured when it was created.
+        """
+        node = self._index.get(node_id)
+        if node is None:
+            logger.warning(f"Node {node_id} not found in {self.nodes_file}")
+            return None
+
+        mutator(node)
+        self._mutations.append((node_id, mutator))
+        return node
+
+    def commit(self):
+        """Write all pending mutations to the nodes file in one atomic step."""
+        if not self._mutations:
+            return True
+
+        directory = os.path.dirname(os.path.abspath(self.nodes_file))
+        temp_path = None
+        try:
+            with self._locked(exclusive=True):
+                # Replay on top of the current file to keep other jobs' changes
+                nodes = self._read()
+                index = {node['id']: node for node in nodes}
+                for node_id, mutator in self._mutations:
+                    if node_id in index:
+                        mutator(index[node_id])
+
+                fd, temp_path = tempfile.mkstemp(prefix='.nodes-', suffix='.json', dir=directory)
+                if os.path.exists(self.nodes_file):
+                    os.chmod(temp_path, os.stat(self.nodes_file).st_mode & 0o777)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(nodes, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.nodes_file)
+                temp_path = None
+
+            logger.info(f"Committed {len(self._mutations)} updates to {self.nodes_file}")
+            self.nodes = nodes
+            self._index = index
+            self._mutations = []
+            return True
+        except Exception as e:
+            logger.error(f"Error saving nodes to {self.nodes_file}: {str(e)}")
+            return False
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -7,10 +7,16 @@ import os
 import sys
 import json
 import time
+import heapq
+import random
 import logging
 import argparse
-import subprocess
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from node_state import NodeStateStore
+from node_history import BitHistory
+from ssh_pool import get_pool, check_ssh_connection, evict_idle_connections
 
 # Configure logging
 logging.basicConfig(
@@ -23,69 +29,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_nodes(nodes_file):
-    """Load nodes from a JSON file."""
-    try:
-        with open(nodes_file, 'r') as f:
-            nodes = json.load(f)
-        logger.info(f"Loaded {len(nodes)} nodes from {nodes_file}")
-        return nodes
-    except Exception as e:
-        logger.error(f"Error loading nodes from {nodes_file}: {str(e)}")
-        return []
+# Number of taps kept in the POC tap history of each node
+POC_HISTORY_SIZE = 100
 
-def check_ssh_connection(node, username="ubuntu", key_file=None):
-    """Check if SSH connection to the node is possible."""
-    try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "ConnectTimeout=5",
-            f"{username}@{node['ip_address']}",
-            "echo 'SSH connection successful'"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            logger.info(f"SSH connection to {node['name']} ({node['ip_address']}) successful")
-            return True
+# Scheduler defaults
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TAP_WINDOW = 60
+DEFAULT_PROVIDER_RATE = 2.0
+
+class ProviderRateLimiter:
+    """Spaces out taps so each provider sees at most ``rate`` taps per second."""
+    
+    def __init__(self, rate=DEFAULT_PROVIDER_RATE, rates=None):
+        self.default_interval = 1.0 / rate if rate else 0
+        self.intervals = {provider: (1.0 / r if r else 0) for provider, r in (rates or {}).items()}
+        self.next_slot = {}
+        self.lock = threading.Lock()
+    
+    def acquire(self, provider):
+        """Wait for the next free tap slot of a provider."""
+        interval = self.intervals.get(provider, self.default_interval)
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(provider, now))
+            self.next_slot[provider] = slot + interval
         
-        logger.warning(f"SSH connection to {node['name']} ({node['ip_address']}) failed: {result.stderr.strip()}")
-        return False
-    except Exception as e:
-        logger.warning(f"Error checking SSH connection to {node['name']} ({node['ip_address']}): {str(e)}")
-        return False
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
 
 def perform_poc_tap(node, username="ubuntu", key_file=None):
     """Perform a POC tap on a node."""
     try:
-        ssh_command = ["ssh"]
-        if key_file:
-            ssh_command.extend(["-i", key_file])
-        ssh_command.extend([
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            f"{username}@{node['ip_address']}",
-            "sudo /home/gradient/sentry/poc_tap.sh"
-        ])
-        
-        result = subprocess.run(
-            ssh_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        result = get_pool(username, key_file).run(node['ip_address'], "sudo /home/gradient/sentry/poc_tap.sh")
         
         if result.returncode == 0:
             logger.info(f"POC tap performed on {node['name']} ({node['ip_address']})")
@@ -97,104 +73,158 @@ def perform_poc_tap(node, username="ubuntu", key_file=None):
         logger.warning(f"Error performing POC tap on {node['name']} ({node['ip_address']}): {str(e)}")
         return False
 
-def update_poc_history(node, success, nodes_file):
-    """Update the POC tap history of a node."""
-    try:
-        # Load current nodes
-        with open(nodes_file, 'r') as f:
-            nodes = json.load(f)
-        
-        # Find the node and update its POC tap history
-        for n in nodes:
-            if n['id'] == node['id']:
-                # Initialize POC tap history if it doesn't exist
-                if 'poc_history' not in n:
-                    n['poc_history'] = []
-                
-                # Add current POC tap to history
-                n['poc_history'].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'success': success
-                })
-                
-                # Limit history to last 100 entries
-                n['poc_history'] = n['poc_history'][-100:]
-                
-                # Update POC tap success rate
-                n['poc_success_rate'] = calculate_poc_success_rate(n)
-                break
-        
-        # Save updated nodes
-        with open(nodes_file, 'w') as f:
-            json.dump(nodes, f, indent=2)
+def load_poc_history(node):
+    """Load the POC tap history of a node."""
+    return BitHistory.load(node.get('poc_history'), POC_HISTORY_SIZE, legacy=lambda tap: tap.get('success', False))
+
+def update_poc_history(store, node, success, latency=None):
+    """Update the POC tap history of a node in the node state store."""
+    timestamp = datetime.now().isoformat()
+    
+    def apply(n):
+        # Add current POC tap to history (older entries are overwritten)
+        history = load_poc_history(n)
+        history.append(success)
+        n['poc_history'] = history.to_dict()
+        n['last_poc_at'] = timestamp
+        n['last_poc_latency'] = round(latency, 3) if latency is not None else None
         
-        logger.info(f"Updated POC tap history of node {node['name']} ({node['ip_address']})")
-        return True
-    except Exception as e:
-        logger.error(f"Error updating POC tap history of node {node['name']} ({node['ip_address']}): {str(e)}")
+        # Update POC tap success rate
+        n['poc_success_rate'] = history.percentage()
+    
+    if store.update(node['id'], apply) is None:
         return False
+    
+    logger.info(f"Updated POC tap history of node {node['name']} ({node['ip_address']})")
+    return True
 
 def calculate_poc_success_rate(node):
     """Calculate the POC tap success rate of a node."""
     try:
-        # Get the POC tap history
-        poc_history = node.get('poc_history', [])
-        
-        # If no history, return 0
-        if not poc_history:
-            return 0
-        
-        # Calculate success rate
-        success_count = sum(1 for tap in poc_history if tap.get('success', False))
-        total_count = len(poc_history)
-        
-        return round((success_count / total_count) * 100, 2)
+        return load_poc_history(node).percentage()
     except Exception as e:
         logger.error(f"Error calculating POC success rate for node {node['name']}: {str(e)}")
         return 0
 
-def perform_poc_taps(nodes_file, username="ubuntu", key_file=None):
-    """Perform POC taps on all nodes."""
+def tap_node(node, limiter, username="ubuntu", key_file=None):
+    """Check SSH and tap a node, returning whether it succeeded and how long it took."""
+    limiter.acquire(node.get('provider'))
+    
+    start = time.monotonic()
+    if check_ssh_connection(node, username, key_file):
+        success = perform_poc_tap(node, username, key_file)
+    else:
+        logger.error(f"Cannot connect to node {node['name']} ({node['ip_address']}) via SSH")
+        success = False
+    
+    return success, time.monotonic() - start
+
+def percentile(values, fraction):
+    """Get a percentile of a list of values (nearest rank)."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+def perform_poc_taps(nodes_file, username="ubuntu", key_file=None, concurrency=DEFAULT_CONCURRENCY,
+                     window=DEFAULT_TAP_WINDOW, provider_rate=DEFAULT_PROVIDER_RATE, provider_rates=None):
+    """Perform POC taps on all nodes.
+    
+    Each running node is given a random start time within ``window`` seconds
+    and tapped by a pool of ``concurrency`` workers. Taps against the same
+    provider are limited to ``provider_rate`` per second, or to the rate
+    given for that provider in ``provider_rates``.
+    """
     start_time = datetime.now()
     logger.info(f"Starting POC taps at {start_time}")
     
     # Load nodes
-    nodes = load_nodes(nodes_file)
+    store = NodeStateStore(nodes_file)
+    nodes = store.load()
     if not nodes:
         logger.error(f"No nodes found in {nodes_file}")
         return
     
-    # Perform POC tap on each node
-    for node in nodes:
-        logger.info(f"Performing POC tap on node {node['name']} ({node['ip_address']})")
-        
-        # Check if node is running
+    # Spread the taps of running nodes over the tap window
+    schedule = []
+    begin = time.monotonic()
+    for i, node in enumerate(nodes):
         if node.get('status') != 'running':
             logger.warning(f"Node {node['name']} ({node['ip_address']}) is not running, skipping POC tap")
             continue
-        
-        # Check SSH connection
-        if check_ssh_connection(node, username, key_file):
-            # Perform POC tap
-            success = perform_poc_tap(node, username, key_file)
+        heapq.heappush(schedule, (begin + random.uniform(0, window), i, node))
+    
+    limiter = ProviderRateLimiter(provider_rate, provider_rates)
+    latencies = {}
+    pending = {}
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while schedule or pending:
+            # Submit taps whose start time has come
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now:
+                _, _, node = heapq.heappop(schedule)
+                logger.info(f"Performing POC tap on node {node['name']} ({node['ip_address']})")
+                pending[executor.submit(tap_node, node, limiter, username, key_file)] = node
             
-            # Update POC tap history
-            update_poc_history(node, success, nodes_file)
-        else:
-            logger.error(f"Cannot connect to node {node['name']} ({node['ip_address']}) via SSH")
+            timeout = schedule[0][0] - now if schedule else None
+            if not pending:
+                time.sleep(timeout)
+                continue
             
-            # Update POC tap history (failed)
-            update_poc_history(node, False, nodes_file)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                try:
+                    success, latency = future.result()
+                except Exception as e:
+                    logger.error(f"Error performing POC tap on {node['name']} ({node['ip_address']}): {str(e)}")
+                    success, latency = False, None
+                
+                if latency is not None:
+                    latencies[node['id']] = latency
+                    logger.info(f"POC tap on {node['name']} ({node['ip_address']}) took {latency:.2f}s")
+                
+                # Update POC tap history
+                update_poc_history(store, node, success, latency)
+    
+    # Save all POC tap results at once
+    store.commit()
+    evict_idle_connections()
+    
+    if latencies:
+        values = list(latencies.values())
+        logger.info(
+            f"POC tap latency over {len(values)} nodes: "
+            f"p50 {percentile(values, 0.5):.2f}s, p95 {percentile(values, 0.95):.2f}s, max {max(values):.2f}s"
+        )
     
     end_time = datetime.now()
     duration = end_time - start_time
     logger.info(f"POC taps completed at {end_time} (duration: {duration})")
+    return latencies
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Perform POC taps on Gradient Sentry Nodes")
     parser.add_argument("--nodes-file", default="nodes.json", help="Path to nodes JSON file")
     parser.add_argument("--username", default="ubuntu", help="SSH username")
     parser.add_argument("--key-file", help="Path to SSH private key file")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of taps in flight")
+    parser.add_argument("--window", type=float, default=DEFAULT_TAP_WINDOW, help="Seconds over which taps are spread")
+    parser.add_argument("--provider-rate", type=float, default=DEFAULT_PROVIDER_RATE, help="Maximum taps per second against one provider")
+    parser.add_argument("--provider-limit", action="append", default=[], metavar="PROVIDER=RATE", help="Override the tap rate for one provider (repeatable)")
     args = parser.parse_args()
     
-    perform_poc_taps(args.nodes_file, args.username, args.key_file)
+    provider_rates = {}
+    for limit in args.provider_limit:
+        provider, _, rate = limit.partition("=")
+        provider_rates[provider] = float(rate)
+    
+    perform_poc_taps(
+        args.nodes_file,
+        args.username,
+        args.key_file,
+        concurrency=args.concurrency,
+        window=args.window,
+        provider_rate=args.provider_rate,
+        provider_rates=provider_rates
+    )
@@ -0,0 +1,197 @@
+"""
+Shared SSH session pool for the node management scripts.
+
+Commands are run through OpenSSH connection multiplexing: the first command
+to a host opens a ControlMaster connection and later ``ssh`` and ``scp``
+invocations reuse its socket instead of doing a full handshake. Control
+sockets live in a shared directory, so connections are also reused across
+scripts and cron runs. Masters exit on their own after ``idle_timeout``
+seconds without use (ControlPersist), and the pool can probe, evict and
+close them explicitly. Every command has a timeout, so a hung host can't
+block the thread running it.
+"""
+import os
+import time
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTROL_DIR = os.environ.get(
+    'GRADIENTLAB_SSH_CONTROL_DIR',
+    os.path.join(os.path.expanduser('~'), '.ssh', 'gradientlab-cm')
+)
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_COMMAND_TIMEOUT = 60
+
+# Exit status reported for commands killed by their timeout, as timeout(1) does
+TIMEOUT_RETURNCODE = 124
+
+class SSHSessionPool:
+    """Pool of multiplexed SSH connections, one master connection per host."""
+
+    def __init__(self, username="ubuntu", key_file=None, control_dir=DEFAULT_CONTROL_DIR,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT):
+        self.username = username
+        self.key_file = key_file
+        self.control_dir = control_dir
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+
+        # host -> monotonic time the host was last used through the pool
+        self._last_used = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+
+    def _options(self):
+        """Get the options shared by ssh and scp."""
+        options = []
+        if self.key_file:
+            options.extend(["-i", self.key_file])
+        options.extend([
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "UserKnownHostsFile=/dev/null",
+            "-o", "LogLevel=ERROR",
+            "-o", f"ConnectTimeout={self.connect_timeout}",
+            "-o", "ServerAliveInterval=15",
+            "-o", "ServerAliveCountMax=3",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={os.path.join(self.control_dir, '%C')}",
+            "-o", f"ControlPersist={self.idle_timeout}"
+        ])
+        return options
+
+    def _target(self, host):
+        return f"{self.username}@{host}"
+
+    def _host_lock(self, host):
+        with self._lock:
+            return self._host_locks.setdefault(host, threading.Lock())
+
+    def _control(self, host, operation):
+        """Send a control command (check, exit) to the master for a host."""
+        return self._execute(
+            ["ssh"] + self._options() + ["-O", operation, self._target(host)],
+            self.connect_timeout
+        )
+
+    def _execute(self, command, timeout):
+        try:
+            return subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=False,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            # subprocess.run has already killed the ssh or scp client
+            return subprocess.CompletedProcess(command, TIMEOUT_RETURNCODE, "", f"Timed out after {timeout} seconds")
+
+    def _touch(self, host, result):
+        if result.returncode == 0:
+            with self._lock:
+                self._last_used[host] = time.monotonic()
+        return result
+
+    def run(self, host, command, timeout=DEFAULT_COMMAND_TIMEOUT):
+        """Run a command on a host and return the completed process."""
+        ssh_command = ["ssh"] + self._options() + [self._target(host), command]
+
+        if host in self._last_used:
+            return self._touch(host, self._execute(ssh_command, timeout))
+
+        # Open the master connection once, even if several threads race for it
+        with self._host_lock(host):
+            return self._touch(host, self._execute(ssh_command, timeout))
+
+    def copy(self, host, local_file, remote_file, timeout=DEFAULT_COMMAND_TIMEOUT):
+        """Copy a local file to a host over the shared connection."""
+        scp_command = ["scp"] + self._options() + [local_file, f"{self._target(host)}:{remote_file}"]
+
+        if host in self._last_used:
+            return self._touch(host, self._execute(scp_command, timeout))
+
+        with self._host_lock(host):
+            return self._touch(host, self._execute(scp_command, timeout))
+
+    def is_alive(self, host):
+        """Check whether a master connection to a host is up."""
+        return self._control(host, "check").returncode == 0
+
+    def probe(self, host, timeout=None):
+        """Health-check a host, reconnecting if its master connection died."""
+        # The master may also have been opened by another script or an earlier run
+        if self.is_alive(host):
+            with self._lock:
+                self._last_used[host] = time.monotonic()
+            return True
+
+        self.close(host)
+        return self.run(host, "true", timeout or self.connect_timeout * 2).returncode == 0
+
+    def close(self, host):
+        """Close the master connection to a host."""
+        with self._lock:
+            self._last_used.pop(host, None)
+        self._control(host, "exit")
+
+    def evict_idle(self):
+        """Close master connections that have not been used for ``idle_timeout`` seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle_hosts = [host for host, last_used in self._last_used.items() if last_used < cutoff]
+
+        for host in idle_hosts:
+            logger.info(f"Closing idle SSH connection to {host}")
+            self.close(host)
+        return idle_hosts
+
+    def close_all(self):
+        """Close every master connection opened by this pool."""
+        with self._lock:
+            hosts = list(self._last_used)
+        for host in hosts:
+            self.close(host)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(username="ubuntu", key_file=None):
+    """Get the shared session pool for a username and key file."""
+    with _pools_lock:
+        key = (username, key_file)
+        if key not in _pools:
+            _pools[key] = SSHSessionPool(username, key_file)
+        return _pools[key]
+
+def evict_idle_connections():
+    """Close the master connections of every pool that have been idle for too long."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [host for pool in pools for host in pool.evict_idle()]
+
+def close_all_connections():
+    """Close the master connections of every pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+def check_ssh_connection(node, username="ubuntu", key_file=None, timeout=None):
+    """Check if SSH connection to the node is possible."""
+    try:
+        if get_pool(username, key_file).probe(node['ip_address'], timeout):
+            logger.info(f"SSH connection to {node['name']} ({node['ip_address']}) successful")
+            return True
+
+        logger.warning(f"SSH connection to {node['name']} ({node['ip_address']}) failed")
+        return False
+    except Exception as e:
+        logger.warning(f"Error checking SSH connection to {node['name']} ({node['ip_address']}): {str(e)}")
+        return False
@@ -4,15 +4,35 @@ Test configuration for GradientLab backend.
 import os
 import sys
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
 # Add the parent directory to the path so we can import from the app
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# The engine is created from DATABASE_URL on import, and the tables are dropped
+# after each test, so never fall back to the development database
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
 from app import app as flask_app
-from config.database import Base, get_session
-from models.user import User
+from config.database import Base, engine, init_db, remove_session
+from middleware.rate_limit import MemoryBackend
+from middleware.security import RateLimiter
+from models.user import create_user
+
+# Outside development plain HTTP requests are redirected to HTTPS and forms
+# need a CSRF token, so test clients use HTTPS and skip the CSRF check
+flask_app.config.update({
+    'PREFERRED_URL_SCHEME': 'https',
+    'WTF_CSRF_ENABLED': False,
+})
+
+def reset_rate_limits(app):
+    """Give the rate limiters of the app empty buckets, so one test can't use up another's limit."""
+    wsgi_app = app.wsgi_app
+    while wsgi_app is not None:
+        if isinstance(wsgi_app, RateLimiter):
+            wsgi_app.backend = MemoryBackend()
+        # The Socket.IO middleware keeps the app it wraps as wsgi_app
+        wsgi_app = getattr(wsgi_app, 'app', None) or getattr(wsgi_app, 'wsgi_app', None)
 
 @pytest.fixture
 def app():
@@ -21,38 +41,20 @@ def app():
     flask_app.config.update({
         'TESTING': True,
         'JWT_SECRET_KEY': 'test_secret_key',
-        'DATABASE_URL': 'sqlite:///:memory:',
     })
 
-    # Create the database and tables
-    engine = create_engine('sqlite:///:memory:')
-    Base.metadata.create_all(engine)
-    
-    # Create a session factory
-    session_factory = sessionmaker(bind=engine)
-    
-    # Override the get_session function to use the test session
-    def _get_test_session():
-        return session_factory()
-    
-    # Patch the get_session function
-    import config.database
-    config.database.get_session = _get_test_session
+    reset_rate_limits(flask_app)
+
+    # Create the tables in the app's database, from DATABASE_URL
+    init_db()
     
     # Create a test user
-    with _get_test_session() as session:
-        test_user = User(
-            username='testuser',
-            email='test@example.com',
-            role='admin'
-        )
-        test_user.set_password('password123')
-        session.add(test_user)
-        session.commit()
+    create_user('testuser', 'test@example.com', 'password123', role='admin')
     
     yield flask_app
     
     # Clean up
+    remove_session()
     Base.metadata.drop_all(engine)
 
 @pytest.fixture
@@ -93,3 +93,15 @@ def test_get_user_unauthenticated(client):
     data = json.loads(response.data)
     assert data['status'] == 'error'
     assert 'Missing Authorization Header' in data['message']
+
+def test_login_busy(client, monkeypatch):
+    """Test that logins are shed when too many password checks are pending."""
+    from utils.password import hash_pool
+    monkeypatch.setattr(hash_pool, 'max_pending', 0)
+
+    response = client.post('/api/auth/login', json={
+        'username': 'testuser',
+        'password': 'password123'
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
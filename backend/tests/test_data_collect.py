@@ -3,7 +3,12 @@ Tests for Data Collection API endpoints.
 """
 import unittest
 import json
+from datetime import date
+from sqlalchemy import event
 from app import app
+from api.data_collect import stats_cache
+from config.database import init_db, get_session, engine
+from models.reward import Reward, get_rewards_page, create_reward
 
 class TestDataCollectionAPI(unittest.TestCase):
     """Test cases for Data Collection API endpoints."""
@@ -12,6 +17,14 @@ class TestDataCollectionAPI(unittest.TestCase):
         """Set up test client."""
         self.app = app.test_client()
         self.app.testing = True
+        
+        # Start every test from an empty rewards table
+        init_db()
+        session = get_session()
+        session.query(Reward).delete()
+        session.commit()
+        session.close()
+        stats_cache.invalidate()
 
     def test_get_rewards_empty(self):
         """Test getting rewards when none exist."""
@@ -45,6 +58,28 @@ class TestDataCollectionAPI(unittest.TestCase):
         self.assertEqual(data['data']['referral_points'], 10)
         self.assertEqual(data['data']['date'], '2023-04-14')
 
+    def test_create_reward_accumulates(self):
+        """Test that rewards recorded twice for a node and date are added up."""
+        reward_data = {
+            'node_id': 1,
+            'poa_points': 25,
+            'poc_points': 15,
+            'referral_points': 10,
+            'date': '2023-04-14'
+        }
+        
+        self.app.post('/api/data/rewards', json=reward_data, content_type='application/json')
+        response = self.app.post('/api/data/rewards', json=reward_data, content_type='application/json')
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['data']['poa_points'], 50)
+        self.assertEqual(data['data']['poc_points'], 30)
+        self.assertEqual(data['data']['referral_points'], 20)
+        
+        response = self.app.get('/api/data/rewards/node/1')
+        self.assertEqual(len(json.loads(response.data)['data']), 1)
+
     def test_get_node_rewards(self):
         """Test getting rewards for a specific node."""
         # First create rewards for two different nodes
@@ -143,5 +178,126 @@ class TestDataCollectionAPI(unittest.TestCase):
         self.assertEqual(data['data']['nodes_count'], 2)
         self.assertEqual(data['data']['average_points_per_node'], 52.5)
 
+    def test_reward_stats_invalidated_on_create(self):
+        """Test that cached reward statistics are refreshed when rewards are recorded."""
+        response = self.app.get('/api/data/rewards/stats')
+        self.assertEqual(json.loads(response.data)['data']['total_points'], 0)
+        
+        self.app.post('/api/data/rewards',
+                     json={
+                         'node_id': 1,
+                         'poa_points': 25,
+                         'poc_points': 15,
+                         'referral_points': 10,
+                         'date': '2023-04-14'
+                     },
+                     content_type='application/json')
+        
+        response = self.app.get('/api/data/rewards/stats')
+        data = json.loads(response.data)
+        
+        self.assertEqual(data['data']['total_points'], 50)
+        self.assertEqual(data['data']['nodes_count'], 1)
+
+    def test_create_reward_invalid_date(self):
+        """Test recording a reward with an invalid date."""
+        response = self.app.post('/api/data/rewards',
+                                json={
+                                    'node_id': 1,
+                                    'poa_points': 25,
+                                    'poc_points': 15,
+                                    'referral_points': 10,
+                                    'date': '14/04/2023'
+                                },
+                                content_type='application/json')
+        
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_rewards_paginated(self):
+        """Test paging through rewards with a cursor."""
+        for day in (14, 12, 13):
+            self.app.post('/api/data/rewards',
+                         json={
+                             'node_id': 1,
+                             'poa_points': day,
+                             'poc_points': 0,
+                             'referral_points': 0,
+                             'date': f'2023-04-{day}'
+                         },
+                         content_type='application/json')
+        
+        response = self.app.get('/api/data/rewards?limit=2')
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([reward['date'] for reward in data['data']], ['2023-04-12', '2023-04-13'])
+        self.assertIsNotNone(data['next_cursor'])
+        
+        response = self.app.get(f"/api/data/rewards?limit=2&cursor={data['next_cursor']}")
+        data = json.loads(response.data)
+        
+        self.assertEqual([reward['date'] for reward in data['data']], ['2023-04-14'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_rewards_page_seeks_to_cursor(self):
+        """Test that a deep page seeks the index to the cursor instead of scanning up to it."""
+        if engine.dialect.name != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite')
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            get_rewards_page(limit=100, after=(date(2023, 4, 12), 500))
+            get_rewards_page(1, limit=100, after=(date(2023, 4, 12), 500))
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                self.assertTrue(all(line.startswith('SEARCH ') for line in plan), plan)
+                self.assertIn('date>?', plan[0])
+
+    def test_failed_helper_keeps_caller_transaction(self):
+        """Test that a helper failing inside a caller's transaction leaves its earlier work alone."""
+        session = get_session()
+        session.add(Reward(node_id=1, date=date(2023, 4, 1), poa_points=7))
+        session.flush()
+        
+        # A reward without a date violates NOT NULL
+        self.assertIsNone(create_reward(1, None, poa_points=1, session=session))
+        session.commit()
+        
+        rewards = session.query(Reward).filter(Reward.node_id == 1).all()
+        self.assertEqual([reward.poa_points for reward in rewards], [7])
+        session.close()
+
+    def test_get_rewards_invalid_cursor(self):
+        """Test paging with a malformed cursor."""
+        response = self.app.get('/api/data/rewards?cursor=not-a-cursor')
+        
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_node_rewards_ndjson(self):
+        """Test streaming the rewards of a node as NDJSON."""
+        self.app.post('/api/data/rewards/simulate/1',
+                     json={'days': 3},
+                     content_type='application/json')
+        self.app.post('/api/data/rewards/simulate/2',
+                     json={'days': 2},
+                     content_type='application/json')
+        
+        response = self.app.get('/api/data/rewards/node/1?format=ndjson')
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row['node_id'] == 1 for row in rows))
+
 if __name__ == '__main__':
     unittest.main()
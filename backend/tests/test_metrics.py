@@ -0,0 +1,129 @@
+"""
+Tests for Metrics API endpoints.
+"""
+import os
+import unittest
+import json
+from flask_jwt_extended import create_access_token
+from app import app
+from config.database import init_db
+from models.user import create_user, get_user_by_username
+from utils.db_metrics import normalize_sql
+from utils.metrics import Histogram
+from middleware.timing import request_profiler
+
+class TestMetricsAPI(unittest.TestCase):
+    """Test cases for Metrics API endpoints."""
+
+    def setUp(self):
+        """Set up test client and users."""
+        self.app = app.test_client()
+        self.app.testing = True
+
+        init_db()
+        for username, role in (('metricsadmin', 'admin'), ('metricsuser', 'user')):
+            if not get_user_by_username(username):
+                create_user(username, f'{username}@example.com', 'Password123!', role=role)
+
+        with app.app_context():
+            self.admin_token = create_access_token(identity=str(get_user_by_username('metricsadmin').id))
+            self.user_token = create_access_token(identity=str(get_user_by_username('metricsuser').id))
+
+    def test_get_database_metrics(self):
+        """Test getting database metrics as an admin."""
+        response = self.app.get('/api/data/rewards/stats')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.app.get('/api/metrics/database',
+                                headers={'Authorization': f'Bearer {self.admin_token}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['status'], 'success')
+        self.assertIn('pool', data['data'])
+        self.assertTrue(any('FROM rewards' in statement['sql'] for statement in data['data']['statements']))
+
+    def test_get_database_metrics_requires_admin(self):
+        """Test that database metrics are not shown to regular users."""
+        response = self.app.get('/api/metrics/database',
+                                headers={'Authorization': f'Bearer {self.user_token}'})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_get_prometheus_metrics_with_token(self):
+        """Test scraping Prometheus metrics with the metrics token."""
+        os.environ['METRICS_TOKEN'] = 'scrape-token'
+        try:
+            response = self.app.get('/api/metrics/prometheus',
+                                    headers={'Authorization': 'Bearer scrape-token'})
+        finally:
+            del os.environ['METRICS_TOKEN']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn(b'gradientlab_db_pool_checked_out', response.data)
+
+    def test_get_request_metrics(self):
+        """Test that requests are timed by route."""
+        self.app.get('/api/data/rewards/stats').close()
+
+        response = self.app.get('/api/metrics/requests',
+                                headers={'Authorization': f'Bearer {self.admin_token}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('data_collect', data['data']['blueprints'])
+        route = next(r for r in data['data']['routes'] if r['route'] == '/api/data/rewards/stats')
+        self.assertEqual(route['method'], 'GET')
+        self.assertGreaterEqual(route['statuses']['200'], 1)
+        self.assertGreater(route['response_size']['max'], 0)
+
+    def test_profile_request_with_token(self):
+        """Test profiling a request that sends the profile token."""
+        request_profiler.token = 'profile-token'
+        try:
+            self.app.get('/api/data/rewards/stats', headers={'X-Profile-Token': 'profile-token'}).close()
+        finally:
+            request_profiler.token = None
+
+        response = self.app.get('/api/metrics/profiling',
+                                headers={'Authorization': f'Bearer {self.admin_token}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        profile = next(p for p in data['data']['profiles'] if p['route'] == '/api/data/rewards/stats')
+
+        response = self.app.get(f"/api/metrics/profiling/{profile['id']}",
+                                headers={'Authorization': f'Bearer {self.admin_token}'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_profiling_requires_enabled(self):
+        """Test that turning profiling on or off requires the enabled flag."""
+        response = self.app.put('/api/metrics/profiling', json={'sample_rate': 0.5},
+                                headers={'Authorization': f'Bearer {self.admin_token}'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_normalize_sql(self):
+        """Test that statements differing only in literals share a fingerprint."""
+        first = normalize_sql("SELECT * FROM rewards WHERE node_id = 1 AND date = '2023-04-14'")
+        second = normalize_sql("SELECT *  FROM rewards\nWHERE node_id = 22 AND date = '2023-04-15'")
+
+        self.assertEqual(first, second)
+        self.assertEqual(normalize_sql('SELECT * FROM vms WHERE id IN (?, ?, ?)'),
+                         'SELECT * FROM vms WHERE id IN (?...)')
+
+    def test_histogram_percentiles(self):
+        """Test histogram percentile estimates."""
+        histogram = Histogram()
+        for _ in range(99):
+            histogram.observe(0.001)
+        histogram.observe(2.0)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertLessEqual(snapshot['p50'], 0.001)
+        self.assertEqual(snapshot['max'], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for the rate limiting middleware.
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from middleware.rate_limit import MemoryBackend, SQLiteBackend
+from middleware.security import RateLimiter
+
+def hello_app(environ, start_response):
+    """WSGI app answering every request."""
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'ok']
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the rate limiter and its backends."""
+
+    def request(self, limiter, path='/api/vm/vms', client_ip='10.0.0.1'):
+        """Send a request through the limiter and return its status."""
+        statuses = []
+        limiter({'REMOTE_ADDR': client_ip, 'PATH_INFO': path},
+                lambda status, headers: statuses.append(status))
+        return statuses[0]
+
+    @patch.dict(os.environ, {'FLASK_ENV': 'production'})
+    def test_route_limit(self):
+        """Test that route limits apply on top of the client limit."""
+        limiter = RateLimiter(hello_app, limit=100, window=60,
+                              routes={'/api/auth/login': (2, 60)}, backend=MemoryBackend())
+
+        statuses = [self.request(limiter, '/api/auth/login') for _ in range(3)]
+
+        self.assertEqual(statuses[:2], ['200 OK', '200 OK'])
+        self.assertEqual(statuses[2], '429 Too Many Requests')
+        self.assertEqual(self.request(limiter), '200 OK')
+        self.assertEqual(self.request(limiter, '/api/auth/login', '10.0.0.2'), '200 OK')
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        """Test that the memory backend keeps a bounded number of clients."""
+        backend = MemoryBackend(max_keys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            backend.hit(key, 10, 1.0)
+
+        self.assertEqual(list(backend.buckets), ['a', 'c'])
+
+    def test_sqlite_backend_is_shared(self):
+        """Test that SQLite backends on the same file share their buckets."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratelimit.db')
+            first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+            self.assertTrue(first.hit('client', 2, 0.01)[0])
+            self.assertTrue(second.hit('client', 2, 0.01)[0])
+            allowed, retry_after = first.hit('client', 2, 0.01)
+
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,3 +72,26 @@ def test_get_event_history(client, auth_token):
     
     # Events should be a list
     assert isinstance(data['data']['events'], list)
+
+def test_update_node_statuses_batch_rejects_unknown_nodes(client, auth_token):
+    """Test that a status batch reports nodes that don't exist."""
+    response = client.post('/api/realtime/nodes/status:batch', json={
+        'updates': [
+            {'node_id': 999999, 'status': 'running', 'uptime_percentage': 99.0}
+        ]
+    }, headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['data']['updated'] == []
+    assert data['data']['rejected'] == [{'node_id': 999999, 'reason': 'not_found'}]
+
+def test_update_node_statuses_batch_missing_fields(client, auth_token):
+    """Test that a status batch with incomplete updates is rejected."""
+    response = client.post('/api/realtime/nodes/status:batch', json={
+        'updates': [{'node_id': 1}]
+    }, headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    assert response.status_code == 400
@@ -0,0 +1,240 @@
+"""
+Tests for the WebSocket manager.
+"""
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from flask_socketio import SocketIO
+from flask_jwt_extended import create_access_token
+from app import app, socketio
+from config.database import init_db
+from websocket import socket_manager
+from websocket.state import MemoryState, get_state
+from websocket.registry import SubscriptionRegistry
+from websocket.coalescer import BroadcastCoalescer
+from websocket.change_log import ChangeLog
+from models.vm import create_vm, delete_vm
+from models.node import create_node
+
+def make_worker(message_queue):
+    """Create an app instance standing in for another worker process."""
+    worker_app = Flask(__name__)
+    worker = SocketIO(worker_app, async_mode='eventlet', **socket_manager.queue_options(message_queue))
+    # Servers otherwise start listening to the queue on their first connection
+    worker.server.manager.initialize()
+    return worker_app, worker
+
+class TestSocketManager(unittest.TestCase):
+    """Test cases for WebSocket presence and node status."""
+
+    def setUp(self):
+        """Set up the database, a fresh state and registry, and a token."""
+        init_db()
+        self.original_state = socket_manager.state
+        self.original_registry = socket_manager.registry
+        self.original_window = socket_manager.node_status_coalescer.window
+        socket_manager.state = MemoryState()
+        socket_manager.registry = SubscriptionRegistry()
+        socket_manager.node_status_coalescer.window = 0
+
+        with app.app_context():
+            self.token = create_access_token(identity='1')
+
+    def tearDown(self):
+        """Restore the state backend and registry."""
+        socket_manager.state = self.original_state
+        socket_manager.registry = self.original_registry
+        socket_manager.node_status_coalescer.window = self.original_window
+
+    def test_presence_counts(self):
+        """Test that connections and authentications are counted."""
+        first = socketio.test_client(app)
+        second = socketio.test_client(app)
+        first.emit('authenticate', {'token': self.token})
+
+        self.assertEqual(socket_manager.get_connected_clients_count(), 2)
+        self.assertEqual(socket_manager.get_authenticated_clients_count(), 1)
+
+        first.disconnect()
+        second.disconnect()
+
+        self.assertEqual(socket_manager.get_connected_clients_count(), 0)
+        self.assertEqual(socket_manager.get_authenticated_clients_count(), 0)
+
+    def test_workers_share_emits_and_state(self):
+        """Test that two app instances sharing a message queue and state see each other's emits and counts."""
+        url = 'local://test-workers'
+        first_app, first = make_worker(url)
+        second_app, second = make_worker(url)
+        first_state, second_state = get_state(url), get_state(url)
+
+        with patch.object(first.server.manager, '_handle_emit', wraps=first.server.manager._handle_emit) as first_emit, \
+                patch.object(second.server.manager, '_handle_emit', wraps=second.server.manager._handle_emit) as second_emit:
+            first.emit('node_status_batch', {'updates': [{'node_id': 5, 'status': 'running'}]}, to='node_5')
+            for _ in range(5):
+                # Let the listeners relay the emit
+                second.sleep(0.01)
+
+        # Emitted to the first worker's clients right away, and to the second's through the queue
+        self.assertEqual(first_emit.call_count, 1)
+        self.assertEqual(second_emit.call_count, 1)
+        message = second_emit.call_args[0][0]
+        self.assertEqual((message['event'], message['room']), ('node_status_batch', 'node_5'))
+        self.assertEqual(message['data'][0]['updates'][0]['status'], 'running')
+
+        first_state.publish_presence(1, 1)
+        second_state.publish_presence(2, 0)
+        first_state.set_node_status(5, {'node_id': 5, 'status': 'running'})
+
+        self.assertEqual(second_state.presence(), (3, 1))
+        self.assertEqual(second_state.get_node_status('5')['status'], 'running')
+
+    def test_subscribe_sends_last_status(self):
+        """Test that subscribers get the last status broadcast for a node."""
+        socket_manager.broadcast_node_status_update(5, {'node_id': 5, 'status': 'running'})
+
+        client = socketio.test_client(app)
+        client.emit('authenticate', {'token': self.token})
+        client.get_received()
+        client.emit('subscribe_node_updates', {'node_id': '5'})
+        received = client.get_received()
+        client.disconnect()
+
+        self.assertEqual(received[-1]['name'], 'node_status_update')
+        self.assertEqual(received[-1]['args'][0]['status'], 'running')
+
+    def test_unchanged_status_is_not_broadcast(self):
+        """Test that an update repeating the last status is skipped."""
+        status = {'node_id': 6, 'status': 'running', 'uptime_percentage': 99.5}
+
+        self.assertTrue(socket_manager.broadcast_node_status_update(6, status))
+        self.assertFalse(socket_manager.broadcast_node_status_update(6, dict(status)))
+        self.assertTrue(socket_manager.broadcast_node_status_update(6, dict(status, status='stopped')))
+
+    def test_broadcast_skips_rooms_without_subscribers(self):
+        """Test that updates for nodes nobody subscribed to are stored but not emitted."""
+        client = socketio.test_client(app)
+        client.emit('authenticate', {'token': self.token})
+
+        with patch.object(socket_manager.node_status_coalescer, 'add') as add:
+            socket_manager.broadcast_node_status_update(9, {'node_id': 9, 'status': 'running'})
+            add.assert_not_called()
+
+            client.emit('subscribe_node_updates', {'node_id': 9})
+            self.assertEqual(socket_manager.registry.subscriber_count('node_9'), 1)
+            socket_manager.broadcast_node_status_update(9, {'node_id': 9, 'status': 'stopped'})
+            add.assert_called_once()
+
+            client.emit('unsubscribe_node_updates', {'node_id': 9})
+            client.disconnect()
+
+        self.assertEqual(socket_manager.registry.room_counts(), {})
+        self.assertEqual(socket_manager.state.get_node_status(9)['status'], 'stopped')
+
+    def test_ghost_clients_are_reaped(self):
+        """Test that clients the server no longer knows are removed from the registry."""
+        client = socketio.test_client(app)
+        client.emit('authenticate', {'token': self.token})
+        socket_manager.registry.connect('ghost')
+        socket_manager.registry.authenticate('ghost', '2')
+        socket_manager.registry.join('ghost', 'user_2')
+
+        self.assertEqual(socket_manager.reap_ghost_clients(), ['ghost'])
+        self.assertEqual(socket_manager.get_connected_clients_count(), 1)
+        self.assertEqual(socket_manager.get_authenticated_clients_count(), 1)
+        self.assertEqual(socket_manager.registry.subscriber_count('user_2'), 0)
+        client.disconnect()
+
+    def test_node_status_expires(self):
+        """Test that node statuses are dropped once stale or over the size limit."""
+        expired = MemoryState(status_ttl=0)
+        expired.set_node_status(1, {'status': 'running'})
+        self.assertIsNone(expired.get_node_status(1))
+        self.assertEqual(len(expired.node_status), 0)
+
+        bounded = MemoryState(status_max=2)
+        for node_id in range(3):
+            bounded.set_node_status(node_id, {'status': 'running'})
+        self.assertIsNone(bounded.get_node_status(0))
+        self.assertEqual(list(bounded.node_status), ['1', '2'])
+
+    def test_coalescer_batches_updates_per_room(self):
+        """Test that updates within a window are emitted as one batch per room."""
+        socketio_mock = MagicMock()
+        coalescer = BroadcastCoalescer(socketio_mock, 'node_status_batch', window=0.25)
+
+        coalescer.add('node_1', 1, {'node_id': 1, 'status': 'starting'})
+        coalescer.add('node_2', 2, {'node_id': 2, 'status': 'running'})
+        coalescer.add('node_1', 1, {'node_id': 1, 'status': 'running'})
+
+        self.assertEqual(socketio_mock.start_background_task.call_count, 1)
+        self.assertEqual(coalescer.flush(), 2)
+        socketio_mock.emit.assert_any_call(
+            'node_status_batch', {'updates': [{'node_id': 1, 'status': 'running'}]}, room='node_1'
+        )
+
+    def test_delta_not_sent_with_other_workers(self):
+        """Test that reconnecting clients get a delta only when no other worker may commit changes."""
+        log = socket_manager.change_log
+        with patch.object(socket_manager, 'SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0'):
+            client = socketio.test_client(app)
+            client.emit('authenticate', {'token': self.token, 'epoch': log.epoch, 'last_seq': log.seq})
+            names = [message['name'] for message in client.get_received()]
+            client.disconnect()
+
+        self.assertIn('initial_data', names)
+        self.assertNotIn('initial_data_delta', names)
+
+        client = socketio.test_client(app)
+        client.emit('authenticate', {'token': self.token, 'epoch': log.epoch, 'last_seq': log.seq})
+        names = [message['name'] for message in client.get_received()]
+        client.disconnect()
+
+        self.assertIn('initial_data_delta', names)
+
+    def test_change_log_delta(self):
+        """Test that a client gets the latest state of each item changed since its snapshot."""
+        log = ChangeLog(maxlen=10)
+        log.record(1, 'node', 7, 'upsert', {'id': 7, 'status': 'deploying'})
+        last_seq = log.seq
+        log.record(1, 'node', 7, 'update', {'status': 'running'})
+        log.record(2, 'node', 8, 'upsert', {'id': 8, 'status': 'running'})
+        log.record(1, 'vm', 3, 'delete')
+
+        seq, changes = log.since(1, log.epoch, last_seq)
+
+        self.assertEqual(seq, 4)
+        self.assertEqual(changes, [
+            {'type': 'node', 'id': 7, 'op': 'update', 'data': {'status': 'running'}},
+            {'type': 'vm', 'id': 3, 'op': 'delete', 'data': None}
+        ])
+
+    def test_change_log_records_cascaded_deletes(self):
+        """Test that deleting a VM logs the deletes of its nodes under the VM's owner."""
+        with app.app_context():
+            vm_id = create_vm('vm', 'aws', 'us-east-1', 't3.micro', 42).id
+            node_ids = [create_node(f"node-{i}", vm_id).id for i in range(3)]
+        log = socket_manager.change_log
+        last_seq = log.seq
+
+        with app.app_context():
+            self.assertTrue(delete_vm(vm_id))
+        _, changes = log.since(42, log.epoch, last_seq)
+
+        self.assertEqual(
+            [(change['type'], change['id'], change['op']) for change in changes],
+            [('vm', vm_id, 'delete')] + [('node', node_id, 'delete') for node_id in node_ids]
+        )
+
+    def test_change_log_requires_snapshot(self):
+        """Test that clients too far behind or from another epoch need a full snapshot."""
+        log = ChangeLog(maxlen=2)
+        for node_id in range(3):
+            log.record(1, 'node', node_id, 'upsert', {'id': node_id})
+
+        self.assertIsNone(log.since(1, log.epoch, 0))
+        self.assertIsNone(log.since(1, 'other', 2))
+        self.assertEqual(log.since(1, log.epoch, 1)[0], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -107,3 +107,35 @@ def test_2fa_disable(client, auth_token):
     })
     status_data = json.loads(status_response.data)
     assert status_data['data']['enabled'] is False
+
+def test_2fa_qrcode_etag(client, auth_token):
+    """Test that an unchanged QR code is answered with 304."""
+    client.post('/api/2fa/setup', headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    
+    response = client.get('/api/2fa/qrcode', headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert 'private' in response.headers['Cache-Control']
+    
+    response = client.get('/api/2fa/qrcode', headers={
+        'Authorization': f'Bearer {auth_token}',
+        'If-None-Match': response.headers['ETag']
+    })
+    assert response.status_code == 304
+
+def test_2fa_qrcode_svg(client, auth_token):
+    """Test getting the QR code as SVG."""
+    client.post('/api/2fa/setup', headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    
+    response = client.get('/api/2fa/qrcode?format=svg', headers={
+        'Authorization': f'Bearer {auth_token}'
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+    assert b'<svg' in response.data
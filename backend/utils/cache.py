@@ -0,0 +1,168 @@
+"""
+Caching utilities for GradientLab backend.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache whose entries expire after a fixed time.
+
+    Args:
+        ttl (float): Seconds an entry stays valid
+        maxsize (int): Maximum number of entries kept
+    """
+
+    def __init__(self, ttl=5, maxsize=128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing or expired
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        """
+        Cache a value for the cache's TTL.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+        """
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # Drop the entry closest to expiry to make room
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, factory):
+        """
+        Get a cached value, computing and caching it with factory() on a miss.
+
+        Args:
+            key: Cache key
+            factory (callable): Function computing the value
+
+        Returns:
+            The cached or computed value
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Remove an entry, or every entry if no key is given.
+
+        Args:
+            key: Cache key to remove
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache keeping the most recently used entries.
+
+    Args:
+        maxsize (int): Maximum number of entries kept
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, factory):
+        """
+        Get a cached value, computing and caching it with factory() on a miss.
+
+        Args:
+            key: Cache key
+            factory (callable): Function computing the value
+
+        Returns:
+            The cached or computed value
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None, match=None):
+        """
+        Remove an entry, the entries whose key matches, or every entry.
+
+        Args:
+            key: Cache key to remove
+            match (callable): Predicate selecting the keys to remove
+        """
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            elif match is not None:
+                for stale in [k for k in self._entries if match(k)]:
+                    del self._entries[stale]
+            else:
+                self._entries.clear()
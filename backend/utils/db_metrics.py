@@ -0,0 +1,233 @@
+"""
+Database instrumentation for GradientLab backend.
+
+Hooks SQLAlchemy engine and pool events to record per-statement latency
+histograms, a log of slow queries, how long requests wait for a pooled
+connection and how long connections stay checked out. Statements are
+grouped by their normalized SQL, with literals and parameter lists
+collapsed, so the same query with different arguments is counted once.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from utils.metrics import Histogram, format_labels
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged
+SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '200'))
+
+# Distinct statements tracked; later ones are grouped together
+MAX_STATEMENTS = 500
+OTHER_STATEMENTS = '<other>'
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_NAMED_PARAMETER = re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s')
+_PARAMETER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST = re.compile(r'(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(statement):
+    """
+    Reduce a SQL statement to a fingerprint shared by all its executions.
+
+    Args:
+        statement (str): SQL statement
+
+    Returns:
+        str: Statement with literals and parameters replaced by ?, parameter
+            lists collapsed to (?...) and whitespace collapsed
+    """
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _NAMED_PARAMETER.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _PARAMETER_LIST.sub('(?...)', sql)
+    sql = _VALUES_LIST.sub(r'\1, ...', sql)
+    return sql
+
+class DatabaseMetrics:
+    """Query and connection pool statistics of an engine."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, max_statements=MAX_STATEMENTS):
+        self.slow_query_ms = slow_query_ms
+        self.max_statements = max_statements
+        self.statements = {}
+        self.slow_queries = deque(maxlen=50)
+        self.errors = 0
+        self.pool_wait = Histogram()
+        self.connection_hold = Histogram()
+        self.checked_out = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+        self._engine = None
+
+    def _statement_histogram(self, sql):
+        histogram = self.statements.get(sql)
+        if histogram is not None:
+            return histogram
+
+        with self._lock:
+            if sql not in self.statements and len(self.statements) >= self.max_statements:
+                sql = OTHER_STATEMENTS
+            return self.statements.setdefault(sql, Histogram())
+
+    def record_query(self, statement, duration):
+        """
+        Record the execution of a statement.
+
+        Args:
+            statement (str): SQL statement as executed
+            duration (float): Execution time in seconds
+        """
+        sql = normalize_sql(statement)
+        self._statement_histogram(sql).observe(duration)
+
+        if duration * 1000 >= self.slow_query_ms:
+            self.slow_queries.append({
+                'sql': sql,
+                'duration_ms': round(duration * 1000, 3),
+                'at': datetime.utcnow().isoformat()
+            })
+            logger.warning(f"Slow query ({duration * 1000:.1f} ms): {sql}")
+
+    def instrument(self, engine):
+        """
+        Attach the metrics to an engine.
+
+        Args:
+            engine (Engine): SQLAlchemy engine
+        """
+        self._engine = engine
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['query_start_time'].pop()
+            self.record_query(statement, time.perf_counter() - started)
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            starts = context.connection.info.get('query_start_time') if context.connection else None
+            if starts:
+                starts.pop()
+            self.errors += 1
+
+        @event.listens_for(engine.pool, 'connect')
+        def connect(dbapi_connection, connection_record):
+            self.connections_opened += 1
+
+        @event.listens_for(engine.pool, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            connection_record.info['checked_out_at'] = time.perf_counter()
+            with self._lock:
+                self.checked_out += 1
+
+        @event.listens_for(engine.pool, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            checked_out_at = connection_record.info.pop('checked_out_at', None)
+            if checked_out_at is None:
+                return
+            self.connection_hold.observe(time.perf_counter() - checked_out_at)
+            with self._lock:
+                self.checked_out -= 1
+
+    def pool_status(self):
+        """
+        Get the current state of the connection pool.
+
+        Returns:
+            dict: Pool class, size, overflow and connection counts
+        """
+        pool = self._engine.pool if self._engine else None
+        status = {
+            'pool': type(pool).__name__ if pool else None,
+            'checked_out': self.checked_out,
+            'connections_opened': self.connections_opened
+        }
+        if isinstance(pool, QueuePool):
+            status.update({
+                'size': pool.size(),
+                'overflow': pool.overflow(),
+                'checked_in': pool.checkedin()
+            })
+        return status
+
+    def snapshot(self, limit=50):
+        """
+        Summarize the collected metrics.
+
+        Args:
+            limit (int): Number of statements to include, by total time
+
+        Returns:
+            dict: Pool status, pool wait and hold times, the statements with
+                the most total time and recent slow queries
+        """
+        statements = sorted(
+            ((sql, histogram.snapshot()) for sql, histogram in list(self.statements.items())),
+            key=lambda item: item[1]['sum'],
+            reverse=True
+        )
+        return {
+            'pool': self.pool_status(),
+            'pool_wait': self.pool_wait.snapshot(),
+            'connection_hold': self.connection_hold.snapshot(),
+            'errors': self.errors,
+            'statements': [dict(stats, sql=sql) for sql, stats in statements[:limit]],
+            'slow_queries': list(self.slow_queries),
+            'slow_query_ms': self.slow_query_ms
+        }
+
+    def prometheus_lines(self):
+        """
+        Render the metrics in the Prometheus text format.
+
+        Returns:
+            list: Lines of the database metrics
+        """
+        status = self.pool_status()
+        lines = [
+            '# TYPE gradientlab_db_pool_checked_out gauge',
+            f"gradientlab_db_pool_checked_out {status['checked_out']}",
+            '# TYPE gradientlab_db_connections_opened_total counter',
+            f"gradientlab_db_connections_opened_total {status['connections_opened']}",
+            '# TYPE gradientlab_db_errors_total counter',
+            f"gradientlab_db_errors_total {self.errors}",
+            '# TYPE gradientlab_db_pool_wait_seconds histogram'
+        ]
+        lines.extend(self.pool_wait.prometheus_lines('gradientlab_db_pool_wait_seconds'))
+        lines.append('# TYPE gradientlab_db_connection_hold_seconds histogram')
+        lines.extend(self.connection_hold.prometheus_lines('gradientlab_db_connection_hold_seconds'))
+
+        lines.append('# TYPE gradientlab_db_query_seconds summary')
+        for sql, histogram in list(self.statements.items()):
+            stats = histogram.snapshot()
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                lines.append(f"gradientlab_db_query_seconds{format_labels(statement=sql, quantile=quantile)} {stats[key]}")
+            lines.append(f"gradientlab_db_query_seconds_sum{format_labels(statement=sql)} {stats['sum']}")
+            lines.append(f"gradientlab_db_query_seconds_count{format_labels(statement=sql)} {stats['count']}")
+        return lines
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_metrics.pool_wait.observe(time.perf_counter() - started)
+
+# Metrics of the application engine
+db_metrics = DatabaseMetrics()
@@ -0,0 +1,137 @@
+"""
+Metrics utilities for GradientLab backend.
+"""
+import bisect
+import threading
+
+# Latency buckets in seconds, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram with percentile estimates.
+
+    Args:
+        buckets (tuple): Ascending upper bounds of the buckets; values above
+            the last bound are counted in an overflow bucket
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Record a value.
+
+        Args:
+            value (float): Value to record
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile by interpolating within its bucket.
+
+        Args:
+            fraction (float): Percentile as a fraction, e.g. 0.95
+
+        Returns:
+            float: Estimated value, or 0 if nothing was recorded
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+
+        if not total:
+            return 0.0
+
+        rank = fraction * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                upper = min(upper, maximum)
+                return lower + (upper - lower) * ((rank - seen) / count)
+            seen += count
+        return maximum
+
+    def snapshot(self):
+        """
+        Summarize the histogram.
+
+        Returns:
+            dict: Count, sum, mean, max and p50/p95/p99 estimates
+        """
+        with self._lock:
+            count, total, maximum = self.count, self.sum, self.max
+
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else 0.0,
+            'max': round(maximum, 6),
+            'p50': round(self.percentile(0.5), 6),
+            'p95': round(self.percentile(0.95), 6),
+            'p99': round(self.percentile(0.99), 6)
+        }
+
+    def prometheus_lines(self, name, labels=None):
+        """
+        Render the histogram in the Prometheus text format.
+
+        Args:
+            name (str): Metric name
+            labels (dict): Labels of this series
+
+        Returns:
+            list: Lines of the _bucket, _sum and _count series
+        """
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{format_labels(labels, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return lines
+
+def format_labels(labels=None, **extra):
+    """
+    Format Prometheus labels.
+
+    Args:
+        labels (dict): Labels to format
+        **extra: Additional labels
+
+    Returns:
+        str: Label set such as {route="/api",le="0.1"}, or an empty string
+    """
+    items = dict(labels or {}, **extra)
+    if not items:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in items.items()) + '}'
@@ -0,0 +1,172 @@
+"""
+Pagination utilities for GradientLab backend.
+
+List endpoints return pages ordered by a key such as ``(date, id)`` or
+``id``. Each page carries an opaque ``next_cursor`` that encodes the key of
+its last row, and the next page starts strictly after it (keyset
+pagination), so pages stay cheap however deep a client reads. Passing
+``format=ndjson`` streams every row instead, one JSON object per line.
+"""
+import json
+import base64
+from datetime import date, datetime
+from flask import request, jsonify, Response
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _load_value(value, value_type):
+    if value_type is datetime:
+        return datetime.fromisoformat(value)
+    if value_type is date:
+        return date.fromisoformat(value)
+    return value_type(value)
+
+def encode_cursor(values):
+    """
+    Encode the key of the last row of a page as an opaque cursor.
+
+    Args:
+        values (tuple): Key values of the row
+
+    Returns:
+        str: URL-safe cursor
+    """
+    data = json.dumps([_dump_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, types):
+    """
+    Decode a cursor created with encode_cursor.
+
+    Args:
+        cursor (str): Cursor from a previous page
+        types (tuple): Expected type of each key value
+
+    Returns:
+        tuple: Key values of the row the cursor points at
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(_load_value(value, value_type) for value, value_type in zip(values, types))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+def parse_page_args(types=(int,)):
+    """
+    Read the pagination arguments of the current request.
+
+    Args:
+        types (tuple): Type of each value of the pagination key
+
+    Returns:
+        tuple: (limit, after, stream), where after is None on the first page
+
+    Raises:
+        ValueError: If an argument is invalid
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor, types) if cursor else None
+
+    stream = (
+        request.args.get('format') == 'ndjson'
+        or request.accept_mimetypes.best == NDJSON_MIMETYPE
+    )
+    return limit, after, stream
+
+def keyset_filter(columns, values):
+    """
+    Build a filter selecting the rows that sort after a key in ascending order.
+
+    Args:
+        columns (tuple): Columns of the pagination key
+        values (tuple): Key values to start after
+
+    Returns:
+        ClauseElement: SQLAlchemy filter expression
+    """
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    # A row value comparison lets the database seek an index to the key; the
+    # equivalent OR of column comparisons makes it scan up to the key instead
+    return tuple_(*columns) > tuple_(*values)
+
+def paginate_list(items, limit, after=None, key=lambda item: (item['id'],)):
+    """
+    Get one page of an in-memory list ordered by key.
+
+    Args:
+        items (list): Items to paginate
+        limit (int): Page size
+        after (tuple): Key to start after
+        key (callable): Function returning the pagination key of an item
+
+    Returns:
+        list: Up to limit + 1 items, for use with page_response
+    """
+    ordered = sorted(items, key=key)
+    if after is not None:
+        ordered = [item for item in ordered if key(item) > tuple(after)]
+    return ordered[:limit + 1]
+
+def page_response(items, limit, key=lambda item: item['id']):
+    """
+    Build the JSON response for a page.
+
+    Args:
+        items (list): Up to limit + 1 serialized rows; the extra row only
+            signals that another page exists
+        limit (int): Page size
+        key (callable): Function returning the pagination key of a row
+
+    Returns:
+        tuple: Flask response and status code
+    """
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_key = key(items[-1])
+        next_cursor = encode_cursor(next_key if isinstance(next_key, tuple) else (next_key,))
+
+    return jsonify({
+        'status': 'success',
+        'data': items,
+        'next_cursor': next_cursor
+    }), 200
+
+def ndjson_response(rows):
+    """
+    Stream rows as newline-delimited JSON.
+
+    Args:
+        rows (iterable): Serialized rows, consumed lazily
+
+    Returns:
+        Response: Streaming Flask response
+    """
+    def generate():
+        for row in rows:
+            yield json.dumps(row) + '\n'
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
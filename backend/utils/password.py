@@ -0,0 +1,139 @@
+"""
+Password hashing utilities for GradientLab backend.
+
+Password hashes are computed in a bounded pool of native threads, so a burst
+of logins does not block the eventlet hub and starve WebSocket traffic.
+hashlib releases the GIL while hashing, so the threads run in parallel. When
+more verifications are waiting than the pool accepts, new ones are shed with
+HashPoolBusy instead of queueing behind the backlog.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from eventlet import patcher, tpool
+from eventlet.semaphore import Semaphore
+from passlib.context import CryptContext
+
+# PBKDF2 rounds of new hashes; hashes with fewer rounds are rehashed on login
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', '29000'))
+
+# Threads hashing passwords, and verifications allowed to wait for them
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '32'))
+
+def create_context(rounds=PASSWORD_HASH_ROUNDS):
+    """
+    Create the password hashing context.
+
+    Args:
+        rounds (int): PBKDF2 rounds of new hashes
+
+    Returns:
+        CryptContext: Context hashing with pbkdf2_sha256 and flagging hashes
+            with fewer rounds for an update
+    """
+    return CryptContext(
+        schemes=['pbkdf2_sha256'],
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds
+    )
+
+pwd_context = create_context()
+
+class HashPoolBusy(Exception):
+    """Raised when too many password hashes are waiting to be computed."""
+
+class HashPool:
+    """
+    Bounded pool computing password hashes off the request thread.
+
+    Args:
+        workers (int): Hashes computed at the same time
+        max_pending (int): Hashes allowed to be computing or waiting
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_QUEUE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._green_slots = Semaphore(workers)
+
+    def run(self, fn, *args, shed=True):
+        """
+        Run a hashing function in the pool.
+
+        Args:
+            fn (callable): Function to run
+            *args: Arguments of the function
+            shed (bool): Raise HashPoolBusy instead of waiting when the pool is full
+
+        Returns:
+            object: Result of the function
+        """
+        with self._lock:
+            if shed and self.pending >= self.max_pending:
+                self.shed += 1
+                raise HashPoolBusy('Too many password hashes pending')
+            self.pending += 1
+
+        try:
+            if patcher.is_monkey_patched('thread'):
+                # Wait on a green semaphore and hash in eventlet's native thread pool
+                with self._green_slots:
+                    return tpool.execute(fn, *args)
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self):
+        """
+        Get the state of the pool.
+
+        Returns:
+            dict: Workers, pending limit, pending hashes and hashes shed
+        """
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'shed': self.shed
+        }
+
+# Pool of the application
+hash_pool = HashPool()
+
+def hash_password(password, context=None):
+    """
+    Hash a password in the hash pool.
+
+    Args:
+        password (str): Password to hash
+        context (CryptContext): Hashing context, pwd_context by default
+
+    Returns:
+        str: Password hash
+    """
+    context = context or pwd_context
+    return hash_pool.run(context.hash, password, shed=False)
+
+def verify_password(password, password_hash, context=None):
+    """
+    Verify a password in the hash pool.
+
+    Args:
+        password (str): Password to verify
+        password_hash (str): Stored password hash
+        context (CryptContext): Hashing context, pwd_context by default
+
+    Returns:
+        tuple: (valid, new hash if the stored one uses outdated parameters, else None)
+
+    Raises:
+        HashPoolBusy: If too many hashes are pending
+    """
+    context = context or pwd_context
+    return hash_pool.run(context.verify_and_update, password, password_hash)
@@ -0,0 +1,149 @@
+"""
+VM and node change log for GradientLab backend.
+
+Every committed VM or node change is numbered by a monotonic sequence and
+kept in a bounded in-memory log. A reconnecting client sends the sequence of
+the last snapshot it has and gets only the changes since then. A full
+snapshot is needed if the client is further behind than the log reaches, or
+if its sequence comes from another worker or an earlier process. Each
+process has its own epoch so that such sequences can be told apart.
+"""
+import os
+import uuid
+import logging
+import threading
+from collections import deque
+from sqlalchemy import event, select
+
+logger = logging.getLogger(__name__)
+
+# Changes kept for reconnecting clients
+CHANGE_LOG_SIZE = int(os.environ.get('SOCKETIO_CHANGE_LOG_SIZE', '10000'))
+
+class ChangeLog:
+    """
+    Bounded log of VM and node changes, numbered by a monotonic sequence.
+
+    Args:
+        maxlen (int): Number of changes kept
+    """
+
+    def __init__(self, maxlen=CHANGE_LOG_SIZE):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, user_id, kind, item_id, op, data=None):
+        """
+        Record a change.
+
+        Args:
+            user_id: ID of the user owning the item
+            kind (str): vm or node
+            item_id (int): ID of the item
+            op (str): upsert with the whole item, update with some fields, or delete
+            data (dict): Item or changed fields
+
+        Returns:
+            int: Sequence number of the change
+        """
+        with self._lock:
+            self.seq += 1
+            self.entries.append((self.seq, str(user_id), kind, item_id, op, data))
+            return self.seq
+
+    def since(self, user_id, epoch, last_seq):
+        """
+        Get the changes of a user's items after a sequence number.
+
+        Args:
+            user_id: ID of the user
+            epoch (str): Epoch the sequence number comes from
+            last_seq (int): Sequence number of the client's last snapshot
+
+        Returns:
+            tuple: (current sequence, changes with the latest state of each
+                item), or None if the client needs a full snapshot
+        """
+        with self._lock:
+            seq = self.seq
+            oldest = self.entries[0][0] if self.entries else seq + 1
+            if epoch != self.epoch or last_seq > seq or last_seq < oldest - 1:
+                return None
+            # Sequence numbers are contiguous, so the changes start at a known offset
+            entries = list(self.entries)[last_seq - oldest + 1:]
+
+        user_id = str(user_id)
+        changes = {}
+        for _, owner, kind, item_id, op, data in entries:
+            if owner != user_id:
+                continue
+
+            key = (kind, item_id)
+            previous = changes.get(key)
+            if op == 'update' and previous and previous['op'] != 'delete':
+                # Fold the changed fields into the earlier state of the item
+                changes[key] = dict(previous, data=dict(previous['data'], **data))
+            else:
+                changes.pop(key, None)
+                changes[key] = {'type': kind, 'id': item_id, 'op': op, 'data': data}
+
+        return seq, list(changes.values())
+
+def track_changes(session_factory, change_log):
+    """
+    Record the VM and node changes of committed sessions in a change log.
+
+    Args:
+        session_factory (sessionmaker): Factory of the sessions to track
+        change_log (ChangeLog): Log to record the changes in
+    """
+    from models.vm import VM
+    from models.node import Node
+
+    def owner_of(session, item, vm_owners=None):
+        if isinstance(item, VM):
+            return item.user_id
+        if 'vm' in item.__dict__ and item.vm is not None:
+            return item.vm.user_id
+        if vm_owners and item.vm_id in vm_owners:
+            return vm_owners[item.vm_id]
+        return session.connection().execute(
+            select(VM.user_id).where(VM.id == item.vm_id)
+        ).scalar()
+
+    @event.listens_for(session_factory, 'before_flush')
+    def collect_owners(session, flush_context, instances):
+        # Deleted nodes can't be traced to their owner once the flush removed their VM
+        deleted = [item for item in session.deleted if isinstance(item, (VM, Node))]
+        vm_owners = {item.id: item.user_id for item in deleted if isinstance(item, VM)}
+        session.info['change_owners'] = {
+            item: owner_of(session, item, vm_owners) for item in deleted
+        }
+
+    @event.listens_for(session_factory, 'after_flush')
+    def collect_changes(session, flush_context):
+        # Collections still hold their pre-flush state, with the new IDs assigned
+        changes = session.info.setdefault('change_log', [])
+        owners = session.info.pop('change_owners', {})
+        for items, op in ((session.new, 'upsert'), (session.dirty, 'upsert'), (session.deleted, 'delete')):
+            for item in items:
+                if not isinstance(item, (VM, Node)):
+                    continue
+                if op == 'upsert' and item in session.dirty and not session.is_modified(item):
+                    continue
+                kind = 'vm' if isinstance(item, VM) else 'node'
+                data = item.to_dict() if op == 'upsert' else None
+                owner = owners[item] if item in owners else owner_of(session, item)
+                changes.append((owner, kind, item.id, op, data))
+
+    @event.listens_for(session_factory, 'after_commit')
+    def record_changes(session):
+        for change in session.info.pop('change_log', []):
+            change_log.record(*change)
+
+    @event.listens_for(session_factory, 'after_soft_rollback')
+    def discard_changes(session, previous_transaction):
+        session.info.pop('change_log', None)
+        session.info.pop('change_owners', None)
@@ -0,0 +1,78 @@
+"""
+Broadcast coalescing for GradientLab backend.
+
+Collects the updates sent to each room over a short window and emits them as
+a single batch frame. A later update for the same key replaces the earlier
+one, so a subscriber only gets the latest state of each node per window.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BroadcastCoalescer:
+    """
+    Emits the updates of each room at most once per window.
+
+    Args:
+        socketio (SocketIO): SocketIO instance emitting the batches
+        event (str): Event name of the batches
+        window (float): Seconds updates are collected before they are emitted;
+            0 emits every update as its own batch right away
+    """
+
+    def __init__(self, socketio, event, window=0.25):
+        self.socketio = socketio
+        self.event = event
+        self.window = window
+        self.pending = {}
+        self.scheduled = False
+        self._lock = threading.Lock()
+
+    def add(self, room, key, data):
+        """
+        Queue an update for a room, replacing a pending update with the same key.
+
+        Args:
+            room (str): Room to emit the update to
+            key: Key of the updated item, e.g. the node ID
+            data (dict): Update data
+        """
+        with self._lock:
+            updates = self.pending.setdefault(room, {})
+            updates.pop(key, None)
+            updates[key] = data
+
+            if self.scheduled and self.window > 0:
+                return
+            self.scheduled = True
+
+        if self.window > 0:
+            self.socketio.start_background_task(self._flush_after_window)
+        else:
+            self.flush()
+
+    def _flush_after_window(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        """
+        Emit the pending updates, one batch per room.
+
+        Returns:
+            int: Number of batches emitted
+        """
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.scheduled = False
+
+        for room, updates in pending.items():
+            try:
+                self.socketio.emit(self.event, {'updates': list(updates.values())}, room=room)
+            except Exception as e:
+                logger.error(f"Error emitting {self.event} to {room}: {str(e)}")
+
+        if pending:
+            logger.debug(f"Emitted {self.event} to {len(pending)} rooms")
+        return len(pending)
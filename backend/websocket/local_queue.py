@@ -0,0 +1,54 @@
+"""
+In-process message queue for GradientLab backend.
+
+Stands in for Redis as the SOCKETIO_MESSAGE_QUEUE of several Socket.IO
+servers running in one process, e.g. two app instances in a test. Set the
+queue to local://<name>; servers using the same name get each other's emits.
+"""
+import json
+import threading
+from socketio import PubSubManager
+
+LOCAL_QUEUE_PREFIX = 'local://'
+
+# Queues of the listening servers, by channel
+_subscribers = {}
+_lock = threading.Lock()
+
+class LocalManager(PubSubManager):
+    """
+    Socket.IO client manager relaying emits between the servers of this process.
+
+    Args:
+        url (str): local://<name> URL of the queue
+        channel (str): Channel name within the queue
+        write_only (bool): Only emit, without receiving the emits of other servers
+    """
+
+    name = 'local'
+
+    def __init__(self, url=LOCAL_QUEUE_PREFIX, channel='flask-socketio', write_only=False, logger=None):
+        super().__init__(channel=f"{url[len(LOCAL_QUEUE_PREFIX):]}:{channel}", write_only=write_only, logger=logger)
+        self.queue = None
+
+    def initialize(self):
+        if self.queue is not None:
+            return
+        if not self.write_only:
+            # Subscribe before the listener starts, so no emit in between is lost
+            self.queue = self.server.eio.create_queue()
+            with _lock:
+                _subscribers.setdefault(self.channel, []).append(self.queue)
+        super().initialize()
+
+    def _publish(self, data):
+        # Encode like a real queue would, so no server shares objects with another
+        message = json.dumps(data)
+        with _lock:
+            queues = list(_subscribers.get(self.channel, []))
+        for queue in queues:
+            queue.put(message)
+
+    def _listen(self):
+        while True:
+            yield json.loads(self.queue.get())
@@ -0,0 +1,180 @@
+"""
+Subscription registry for GradientLab backend.
+
+Tracks the clients connected to this worker and the rooms each one joined,
+so subscriber counts per room are known without asking the Socket.IO server.
+Clients whose disconnect event was missed are reaped by checking them
+against the server's own connection table.
+"""
+import threading
+from datetime import datetime
+
+class ClientEntry:
+    """A client connected to this worker."""
+
+    __slots__ = ('sid', 'user_id', 'authenticated', 'connected_at', 'rooms')
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.user_id = None
+        self.authenticated = False
+        self.connected_at = datetime.utcnow()
+        self.rooms = set()
+
+    def to_dict(self):
+        """Convert the client entry to dictionary."""
+        return {
+            'user_id': self.user_id,
+            'authenticated': self.authenticated,
+            'connected_at': self.connected_at.isoformat(),
+            'rooms': sorted(self.rooms)
+        }
+
+class SubscriptionRegistry:
+    """Clients of this worker and their room subscriptions."""
+
+    def __init__(self):
+        self.clients = {}
+        self.rooms = {}
+        self.authenticated = 0
+        self._lock = threading.Lock()
+
+    def connect(self, sid):
+        """
+        Register a connected client.
+
+        Args:
+            sid (str): Session ID of the client
+
+        Returns:
+            ClientEntry: Entry of the client
+        """
+        entry = ClientEntry(sid)
+        with self._lock:
+            self._remove(sid)
+            self.clients[sid] = entry
+        return entry
+
+    def disconnect(self, sid):
+        """
+        Remove a client and its subscriptions.
+
+        Args:
+            sid (str): Session ID of the client
+
+        Returns:
+            ClientEntry: Entry of the removed client, or None if it was not registered
+        """
+        with self._lock:
+            return self._remove(sid)
+
+    def _remove(self, sid):
+        entry = self.clients.pop(sid, None)
+        if entry is None:
+            return None
+
+        for room in entry.rooms:
+            self._discard_member(room, sid)
+        if entry.authenticated:
+            self.authenticated -= 1
+        return entry
+
+    def _discard_member(self, room, sid):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                # Drop empty rooms so the registry doesn't grow with every node ever watched
+                del self.rooms[room]
+
+    def authenticate(self, sid, user_id):
+        """
+        Mark a client as authenticated.
+
+        Args:
+            sid (str): Session ID of the client
+            user_id: ID of the authenticated user
+
+        Returns:
+            bool: True if the client is registered
+        """
+        with self._lock:
+            entry = self.clients.get(sid)
+            if entry is None:
+                return False
+            if not entry.authenticated:
+                self.authenticated += 1
+            entry.user_id = user_id
+            entry.authenticated = True
+            return True
+
+    def join(self, sid, room):
+        """
+        Record that a client joined a room.
+
+        Args:
+            sid (str): Session ID of the client
+            room (str): Room name
+        """
+        with self._lock:
+            entry = self.clients.get(sid)
+            if entry is not None:
+                entry.rooms.add(room)
+                self.rooms.setdefault(room, set()).add(sid)
+
+    def leave(self, sid, room):
+        """
+        Record that a client left a room.
+
+        Args:
+            sid (str): Session ID of the client
+            room (str): Room name
+        """
+        with self._lock:
+            entry = self.clients.get(sid)
+            if entry is not None:
+                entry.rooms.discard(room)
+            self._discard_member(room, sid)
+
+    def get(self, sid):
+        """Get the entry of a client, or None if it is not registered."""
+        return self.clients.get(sid)
+
+    def is_authenticated(self, sid):
+        """Check if a client is registered and authenticated."""
+        entry = self.clients.get(sid)
+        return entry is not None and entry.authenticated
+
+    def subscriber_count(self, room):
+        """Get the number of clients of this worker in a room."""
+        return len(self.rooms.get(room, ()))
+
+    def room_counts(self):
+        """Get the number of clients of this worker in each room."""
+        with self._lock:
+            return {room: len(members) for room, members in self.rooms.items()}
+
+    def counts(self):
+        """
+        Get the connection counts of this worker.
+
+        Returns:
+            tuple: (connected clients, authenticated clients)
+        """
+        return len(self.clients), self.authenticated
+
+    def reap(self, is_connected):
+        """
+        Remove clients the server no longer knows, e.g. after a missed disconnect event.
+
+        Args:
+            is_connected (callable): Function telling whether a session ID is still connected
+
+        Returns:
+            list: Session IDs of the removed clients
+        """
+        ghosts = [sid for sid in list(self.clients) if not is_connected(sid)]
+        with self._lock:
+            for sid in ghosts:
+                self._remove(sid)
+        return ghosts
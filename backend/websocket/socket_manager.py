@@ -4,32 +4,114 @@ WebSocket manager for GradientLab backend.
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_jwt_extended import decode_token
 from flask import request
+import os
 import logging
 import json
-from datetime import datetime
+from websocket.registry import SubscriptionRegistry
+from websocket.state import get_state, PRESENCE_TTL
+from websocket.coalescer import BroadcastCoalescer
+from websocket.local_queue import LocalManager, LOCAL_QUEUE_PREFIX
+from websocket.change_log import ChangeLog, track_changes
+from config.database import session_factory
 
 logger = logging.getLogger(__name__)
 
 # Initialize SocketIO
 socketio = SocketIO()
 
-# Connected clients
-connected_clients = {}
+# Message queue relaying emits between workers, e.g. redis://localhost:6379/0,
+# or local://<name> between the app instances of one process
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
 
-# Node status updates
-node_status_updates = {}
+# Window in milliseconds over which node status updates are batched per room
+SOCKETIO_COALESCE_MS = int(os.environ.get('SOCKETIO_COALESCE_MS', '250'))
+
+# Seconds between checks for clients whose disconnect event was missed
+SOCKETIO_REAP_INTERVAL = int(os.environ.get('SOCKETIO_REAP_INTERVAL', '60'))
+
+# Clients connected to this worker and the rooms they joined
+registry = SubscriptionRegistry()
+
+# Presence counts and last known node statuses shared by the workers
+state = get_state()
+
+# VM and node changes, for sending reconnecting clients only what changed
+change_log = ChangeLog()
+
+# Node status updates waiting to be emitted as node_status_batch frames
+node_status_coalescer = BroadcastCoalescer(socketio, 'node_status_batch', SOCKETIO_COALESCE_MS / 1000)
+
+def queue_options(url):
+    """Get the SocketIO options relaying emits through a message queue URL."""
+    if url and url.startswith(LOCAL_QUEUE_PREFIX):
+        # Flask-SocketIO only knows the queues of other processes
+        return {'client_manager': LocalManager(url)}
+    return {'message_queue': url}
 
 def init_app(app):
     """Initialize SocketIO with the Flask app."""
     socketio.init_app(
         app,
         cors_allowed_origins="*",  # In production, specify exact origins
-        async_mode='eventlet'
+        async_mode='eventlet',
+        **queue_options(SOCKETIO_MESSAGE_QUEUE)
     )
     register_handlers()
+    track_changes(session_factory, change_log)
+    if state.shared:
+        socketio.start_background_task(publish_presence_periodically)
+    if SOCKETIO_REAP_INTERVAL > 0:
+        socketio.start_background_task(reap_ghost_clients_periodically)
     logger.info("WebSocket initialized")
     return socketio
 
+def publish_presence():
+    """Publish the connection counts of this worker."""
+    try:
+        state.publish_presence(*registry.counts())
+    except Exception as e:
+        logger.error(f"Error publishing WebSocket presence: {str(e)}")
+
+def publish_presence_periodically():
+    """Keep the presence of this worker from expiring while it has no connection changes."""
+    while True:
+        publish_presence()
+        socketio.sleep(PRESENCE_TTL / 3)
+
+def reap_ghost_clients():
+    """Remove clients the Socket.IO server no longer knows, e.g. after a missed disconnect event."""
+    try:
+        manager = socketio.server.manager
+        ghosts = registry.reap(lambda sid: manager.is_connected(sid, '/'))
+    except Exception as e:
+        logger.error(f"Error reaping WebSocket clients: {str(e)}")
+        return []
+    
+    if ghosts:
+        logger.info(f"Reaped {len(ghosts)} disconnected WebSocket clients")
+        publish_presence()
+    return ghosts
+
+def reap_ghost_clients_periodically():
+    """Keep clients with a missed disconnect event from piling up in the registry."""
+    while True:
+        socketio.sleep(SOCKETIO_REAP_INTERVAL)
+        reap_ghost_clients()
+
+def has_listeners(room):
+    """Check if a room may have subscribers, on this worker or, with a message queue, any other."""
+    return SOCKETIO_MESSAGE_QUEUE is not None or registry.subscriber_count(room) > 0
+
+def join(room):
+    """Add the current client to a room."""
+    join_room(room)
+    registry.join(request.sid, room)
+
+def leave(room):
+    """Remove the current client from a room."""
+    leave_room(room)
+    registry.leave(request.sid, room)
+
 def register_handlers():
     """Register WebSocket event handlers."""
     
@@ -37,23 +119,16 @@ def register_handlers():
     def handle_connect():
         """Handle client connection."""
         logger.info(f"Client connected: {request.sid}")
-        connected_clients[request.sid] = {
-            'user_id': None,
-            'authenticated': False,
-            'connected_at': datetime.utcnow().isoformat()
-        }
+        registry.connect(request.sid)
+        publish_presence()
     
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnection."""
         logger.info(f"Client disconnected: {request.sid}")
-        if request.sid in connected_clients:
-            # Leave all rooms
-            if connected_clients[request.sid].get('user_id'):
-                leave_room(f"user_{connected_clients[request.sid]['user_id']}")
-            
-            # Remove client from connected clients
-            del connected_clients[request.sid]
+        # The server leaves the client's rooms itself
+        if registry.disconnect(request.sid):
+            publish_presence()
     
     @socketio.on('authenticate')
     def handle_authenticate(data):
@@ -68,20 +143,24 @@ def register_handlers():
             decoded_token = decode_token(token)
             user_id = decoded_token['sub']
             
-            # Update client info
-            connected_clients[request.sid]['user_id'] = user_id
-            connected_clients[request.sid]['authenticated'] = True
+            # Update client info, registering the client again if it was reaped meanwhile
+            if not registry.authenticate(request.sid, user_id):
+                registry.connect(request.sid)
+                registry.authenticate(request.sid, user_id)
+            publish_presence()
             
             # Join user-specific room
-            join_room(f"user_{user_id}")
+            join(f"user_{user_id}")
             
             # Send success response
             emit('authenticated', {'user_id': user_id})
             
             logger.info(f"Client authenticated: {request.sid}, user_id: {user_id}")
             
-            # Send initial data
-            send_initial_data(user_id)
+            # Send what changed since the client's last snapshot, or else a full snapshot
+            last_seq = data.get('last_seq')
+            if not (isinstance(last_seq, int) and send_data_delta(user_id, data.get('epoch'), last_seq)):
+                send_initial_data(user_id)
         except Exception as e:
             logger.error(f"Authentication error: {str(e)}")
             emit('authentication_error', {'message': 'Invalid token'})
@@ -89,7 +168,7 @@ def register_handlers():
     @socketio.on('subscribe_node_updates')
     def handle_subscribe_node_updates(data):
         """Handle subscription to node updates."""
-        if not connected_clients.get(request.sid, {}).get('authenticated'):
+        if not registry.is_authenticated(request.sid):
             emit('error', {'message': 'Not authenticated'})
             return
         
@@ -99,12 +178,17 @@ def register_handlers():
             return
         
         # Join node-specific room
-        join_room(f"node_{node_id}")
+        join(f"node_{node_id}")
         logger.info(f"Client {request.sid} subscribed to node {node_id} updates")
         
-        # Send latest node status if available
-        if node_id in node_status_updates:
-            emit('node_status_update', node_status_updates[node_id])
+        # Send latest node status if available, wherever it was broadcast from
+        try:
+            status_data = state.get_node_status(node_id)
+        except Exception as e:
+            logger.error(f"Error getting node status: {str(e)}")
+            status_data = None
+        if status_data:
+            emit('node_status_update', status_data)
     
     @socketio.on('unsubscribe_node_updates')
     def handle_unsubscribe_node_updates(data):
@@ -115,24 +199,21 @@ def register_handlers():
             return
         
         # Leave node-specific room
-        leave_room(f"node_{node_id}")
+        leave(f"node_{node_id}")
         logger.info(f"Client {request.sid} unsubscribed from node {node_id} updates")
 
 def send_initial_data(user_id):
     """Send initial data to authenticated client."""
     # Import here to avoid circular imports
-    from models.vm import get_vms_by_user
-    from models.node import get_nodes_by_vm
+    from models.vm import get_vms_with_nodes_by_user
     
     try:
-        # Get user's VMs
-        vms = get_vms_by_user(user_id)
+        # Changes committed while the snapshot is read are sent again with the next delta
+        seq = change_log.seq
         
-        # Get nodes for each VM
-        nodes = []
-        for vm in vms:
-            vm_nodes = get_nodes_by_vm(vm.id)
-            nodes.extend(vm_nodes)
+        # Get user's VMs and their nodes in one query
+        vms = get_vms_with_nodes_by_user(user_id)
+        nodes = [node for vm in vms for node in vm.nodes]
         
         # Convert to dictionaries
         vm_dicts = [vm.to_dict() for vm in vms]
@@ -140,6 +221,8 @@ def send_initial_data(user_id):
         
         # Send data to client
         socketio.emit('initial_data', {
+            'epoch': change_log.epoch,
+            'seq': seq,
             'vms': vm_dicts,
             'nodes': node_dicts
         }, room=f"user_{user_id}")
@@ -148,35 +231,86 @@ def send_initial_data(user_id):
     except Exception as e:
         logger.error(f"Error sending initial data: {str(e)}")
 
+def send_data_delta(user_id, epoch, last_seq):
+    """Send the VM and node changes since a client's last snapshot, if they are still logged."""
+    # The log only holds this worker's commits, so with other workers a delta could miss changes
+    if SOCKETIO_MESSAGE_QUEUE is not None or state.shared:
+        return False
+    
+    delta = change_log.since(user_id, epoch, last_seq)
+    if delta is None:
+        return False
+    
+    seq, changes = delta
+    emit('initial_data_delta', {
+        'epoch': change_log.epoch,
+        'seq': seq,
+        'changes': changes
+    })
+    
+    logger.info(f"Sent {len(changes)} changes since {last_seq} to user {user_id}")
+    return True
+
+def record_node_change(user_id, node_id, fields):
+    """Record node fields changed outside the ORM, e.g. by a bulk UPDATE."""
+    change_log.record(user_id, 'node', node_id, 'update', fields)
+
 def broadcast_node_status_update(node_id, status_data):
-    """Broadcast node status update to subscribed clients."""
+    """Queue a node status update for the next batch sent to subscribed clients."""
     try:
-        # Store latest status update
-        node_status_updates[node_id] = status_data
+        # Skip updates that change nothing subscribers can see
+        last_status = state.get_node_status(node_id)
+        if last_status and all(
+            last_status.get(field) == status_data.get(field)
+            for field in ('status', 'uptime_percentage')
+        ):
+            return False
         
-        # Broadcast to node-specific room
-        socketio.emit('node_status_update', status_data, room=f"node_{node_id}")
+        # Store latest status update
+        state.set_node_status(node_id, status_data)
         
-        logger.info(f"Broadcasted status update for node {node_id}")
+        # Batch with the other updates for the node's room, unless nobody listens
+        room = f"node_{node_id}"
+        if has_listeners(room):
+            node_status_coalescer.add(room, node_id, status_data)
+            logger.debug(f"Queued status update for node {node_id}")
+        return True
     except Exception as e:
         logger.error(f"Error broadcasting node status update: {str(e)}")
+        return False
 
 def broadcast_reward_update(user_id, reward_data):
     """Broadcast reward update to user."""
     try:
-        socketio.emit('reward_update', reward_data, room=f"user_{user_id}")
+        room = f"user_{user_id}"
+        if not has_listeners(room):
+            return
+        socketio.emit('reward_update', reward_data, room=room)
         logger.info(f"Broadcasted reward update to user {user_id}")
     except Exception as e:
         logger.error(f"Error broadcasting reward update: {str(e)}")
 
 def get_connected_clients_count():
-    """Get the number of connected clients."""
-    return len(connected_clients)
+    """Get the number of clients connected to all workers."""
+    try:
+        return state.presence()[0]
+    except Exception as e:
+        logger.error(f"Error getting WebSocket presence: {str(e)}")
+        return registry.counts()[0]
 
 def get_authenticated_clients_count():
-    """Get the number of authenticated clients."""
-    return sum(1 for client in connected_clients.values() if client.get('authenticated'))
+    """Get the number of authenticated clients connected to all workers."""
+    try:
+        return state.presence()[1]
+    except Exception as e:
+        logger.error(f"Error getting WebSocket presence: {str(e)}")
+        return registry.counts()[1]
 
 def get_client_info(client_id):
-    """Get information about a specific client."""
-    return connected_clients.get(client_id)
+    """Get information about a client connected to this worker."""
+    entry = registry.get(client_id)
+    return entry.to_dict() if entry else None
+
+def get_room_subscriber_counts():
+    """Get the number of clients of this worker in each room."""
+    return registry.room_counts()
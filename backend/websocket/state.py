@@ -0,0 +1,276 @@
+"""
+Shared WebSocket state for GradientLab backend.
+
+Each worker process tracks its own connections, and publishes how many it
+has to a state backend so every worker can report the totals. The backend
+also keeps the last known status of every node, so a client subscribing on
+any worker gets the status broadcast from another one. Statuses expire when a
+node stops reporting, so removed nodes don't pile up over weeks of uptime. The memory backend
+keeps everything in this process, for a single worker and for tests. The
+Redis backend works with any server speaking the Redis protocol, including
+one on a local unix socket. The local backend shares the state between the
+workers of one process, standing in for Redis in tests.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which the presence of a worker that stopped publishing is ignored
+PRESENCE_TTL = int(os.environ.get('SOCKETIO_PRESENCE_TTL', '90'))
+
+# Seconds the last status of a node is kept after its last update
+STATUS_TTL = int(os.environ.get('SOCKETIO_STATUS_TTL', '3600'))
+
+# Node statuses kept by the memory backend
+STATUS_MAX = int(os.environ.get('SOCKETIO_STATUS_MAX', '100000'))
+
+class MemoryState:
+    """
+    WebSocket state of this process only.
+
+    Args:
+        status_ttl (float): Seconds a node status is kept after its last update
+        status_max (int): Node statuses kept, the least recently updated are dropped first
+    """
+
+    shared = False
+
+    def __init__(self, status_ttl=STATUS_TTL, status_max=STATUS_MAX):
+        self.connected = 0
+        self.authenticated = 0
+        self.status_ttl = status_ttl
+        self.status_max = status_max
+        # Node ID -> (expiry, status), in order of the last update
+        self.node_status = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish_presence(self, connected, authenticated):
+        """
+        Publish the connection counts of this worker.
+
+        Args:
+            connected (int): Connected clients
+            authenticated (int): Authenticated clients
+        """
+        with self._lock:
+            self.connected, self.authenticated = connected, authenticated
+
+    def presence(self):
+        """
+        Get the connection counts of all workers.
+
+        Returns:
+            tuple: (connected clients, authenticated clients)
+        """
+        with self._lock:
+            return self.connected, self.authenticated
+
+    def set_node_status(self, node_id, status):
+        """
+        Store the last known status of a node.
+
+        Args:
+            node_id: Node ID
+            status (dict): Status data
+        """
+        with self._lock:
+            key = str(node_id)
+            self.node_status.pop(key, None)
+            self.node_status[key] = (time.monotonic() + self.status_ttl, status)
+            self._prune()
+
+    def _prune(self):
+        # Every status lives for the same TTL, so the expired ones are at the front
+        now = time.monotonic()
+        while self.node_status:
+            expires, _ = next(iter(self.node_status.values()))
+            if expires > now and len(self.node_status) <= self.status_max:
+                break
+            self.node_status.popitem(last=False)
+
+    def get_node_status(self, node_id):
+        """
+        Get the last known status of a node.
+
+        Args:
+            node_id: Node ID
+
+        Returns:
+            dict: Status data, or None if none was stored
+        """
+        with self._lock:
+            self._prune()
+            entry = self.node_status.get(str(node_id))
+            return entry[1] if entry else None
+
+class LocalState:
+    """
+    WebSocket state shared by the workers of this process.
+
+    Args:
+        name (str): Name of the shared state; workers using the same name share it
+    """
+
+    shared = True
+
+    # Presence by worker, and node statuses, of each shared state
+    stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, name='default'):
+        with self._stores_lock:
+            self.workers, self.statuses = self.stores.setdefault(name, ({}, MemoryState()))
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+
+    def publish_presence(self, connected, authenticated):
+        """
+        Publish the connection counts of this worker.
+
+        Args:
+            connected (int): Connected clients
+            authenticated (int): Authenticated clients
+        """
+        with self._lock:
+            self.workers[self.worker_id] = (connected, authenticated, time.monotonic() + PRESENCE_TTL)
+
+    def presence(self):
+        """
+        Get the connection counts of all workers.
+
+        Returns:
+            tuple: (connected clients, authenticated clients)
+        """
+        now = time.monotonic()
+        with self._lock:
+            counts = [(c, a) for c, a, expires in self.workers.values() if expires > now]
+        return sum(c for c, _ in counts), sum(a for _, a in counts)
+
+    def set_node_status(self, node_id, status):
+        """
+        Store the last known status of a node.
+
+        Args:
+            node_id: Node ID
+            status (dict): Status data
+        """
+        self.statuses.set_node_status(node_id, status)
+
+    def get_node_status(self, node_id):
+        """
+        Get the last known status of a node.
+
+        Args:
+            node_id: Node ID
+
+        Returns:
+            dict: Status data, or None if none was stored
+        """
+        return self.statuses.get_node_status(node_id)
+
+class RedisState:
+    """
+    WebSocket state shared by all workers through Redis.
+
+    Args:
+        url (str): Redis URL, e.g. redis://localhost:6379/0 or unix:///run/redis.sock
+        prefix (str): Prefix of the keys
+    """
+
+    shared = True
+
+    def __init__(self, url, prefix='gradientlab:ws:'):
+        if redis is None:
+            raise RuntimeError('The redis package is required for the Redis WebSocket state')
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def publish_presence(self, connected, authenticated):
+        """
+        Publish the connection counts of this worker.
+
+        Args:
+            connected (int): Connected clients
+            authenticated (int): Authenticated clients
+        """
+        self.client.set(
+            f"{self.prefix}presence:{self.worker_id}",
+            json.dumps({'connected': connected, 'authenticated': authenticated, 'at': time.time()}),
+            ex=PRESENCE_TTL
+        )
+
+    def presence(self):
+        """
+        Get the connection counts of all workers.
+
+        Returns:
+            tuple: (connected clients, authenticated clients)
+        """
+        keys = list(self.client.scan_iter(match=f"{self.prefix}presence:*", count=100))
+        connected = authenticated = 0
+        for value in self.client.mget(keys) if keys else []:
+            if value:
+                counts = json.loads(value)
+                connected += counts['connected']
+                authenticated += counts['authenticated']
+        return connected, authenticated
+
+    def set_node_status(self, node_id, status):
+        """
+        Store the last known status of a node.
+
+        Args:
+            node_id: Node ID
+            status (dict): Status data
+        """
+        self.client.set(f"{self.prefix}node_status:{node_id}", json.dumps(status), ex=STATUS_TTL)
+
+    def get_node_status(self, node_id):
+        """
+        Get the last known status of a node.
+
+        Args:
+            node_id: Node ID
+
+        Returns:
+            dict: Status data, or None if none was stored
+        """
+        value = self.client.get(f"{self.prefix}node_status:{node_id}")
+        return json.loads(value) if value else None
+
+def get_state(url=None):
+    """
+    Create the WebSocket state backend configured by a URL.
+
+    Args:
+        url (str): memory, local://<name>, or a redis://, rediss:// or unix:// URL;
+            SOCKETIO_STATE_BACKEND, else a Redis or local SOCKETIO_MESSAGE_QUEUE, else memory
+
+    Returns:
+        object: WebSocket state backend
+    """
+    message_queue = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    default = message_queue if message_queue.startswith(('redis://', 'rediss://', 'unix://', 'local://')) else 'memory'
+    url = url or os.environ.get('SOCKETIO_STATE_BACKEND', default)
+
+    if url.startswith('local://'):
+        return LocalState(url[len('local://'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisState(url)
+    if url != 'memory':
+        logger.error(f"Unknown WebSocket state backend {url}, using memory")
+    return MemoryState()
@@ -45,3 +45,14 @@ CREATE TABLE IF NOT EXISTS referrals (
     FOREIGN KEY (referrer_node_id) REFERENCES nodes (id),
     FOREIGN KEY (referred_node_id) REFERENCES nodes (id)
 );
+
+-- Indexes for the lookups made by the backend models
+CREATE INDEX IF NOT EXISTS ix_nodes_vm_id ON nodes (vm_id);
+
+-- One reward row per node and day; also serves per-node date ranges
+CREATE UNIQUE INDEX IF NOT EXISTS ix_rewards_node_id_date ON rewards (node_id, date);
+CREATE INDEX IF NOT EXISTS ix_rewards_date ON rewards (date);
+
+-- A node refers another node at most once; also serves referrer lookups
+CREATE UNIQUE INDEX IF NOT EXISTS ix_referrals_referrer_referred ON referrals (referrer_node_id, referred_node_id);
+CREATE INDEX IF NOT EXISTS ix_referrals_referred_node_id ON referrals (referred_node_id);
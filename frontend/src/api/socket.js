@@ -4,10 +4,15 @@ import { isAuthenticated } from './auth';
 // Socket.io instance
 let socket = null;
 
+// Version of the last snapshot received, so a reconnect only fetches changes
+let snapshotVersion = null;
+
 // Event listeners
 const listeners = {
   'node_status_update': [],
   'reward_update': [],
+  'initial_data': [],
+  'initial_data_delta': [],
   'authenticated': [],
   'authentication_error': [],
   'connect': [],
@@ -64,11 +69,28 @@ export const initSocket = () => {
     notifyListeners('node_status_update', data);
   });
   
+  // Status updates are batched per window, with the latest update of each node
+  socket.on('node_status_batch', (data) => {
+    data.updates.forEach((update) => {
+      notifyListeners('node_status_update', update);
+    });
+  });
+  
   socket.on('reward_update', (data) => {
     console.log('Reward update:', data);
     notifyListeners('reward_update', data);
   });
   
+  socket.on('initial_data', (data) => {
+    snapshotVersion = { epoch: data.epoch, last_seq: data.seq };
+    notifyListeners('initial_data', data);
+  });
+  
+  socket.on('initial_data_delta', (data) => {
+    snapshotVersion = { epoch: data.epoch, last_seq: data.seq };
+    notifyListeners('initial_data_delta', data);
+  });
+  
   socket.on('authenticated', (data) => {
     console.log('Socket authenticated:', data);
     notifyListeners('authenticated', data);
@@ -99,6 +121,9 @@ export const connectSocket = () => {
  * Disconnect from WebSocket server
  */
 export const disconnectSocket = () => {
+  // The next connection may belong to another user, so start from a full snapshot
+  snapshotVersion = null;
+  
   if (socket && socket.connected) {
     socket.disconnect();
   }
@@ -119,7 +144,7 @@ export const authenticateSocket = () => {
     return;
   }
   
-  socket.emit('authenticate', { token });
+  socket.emit('authenticate', { token, ...snapshotVersion });
 };
 
 /**